@@ -0,0 +1,352 @@
+import sys, os
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import socket
+import time
+
+from pairwise_sequence_alignment import AlignmentProcessor, AlignmentResultCache, ScoringMatrixFileReader
+
+# the scoring matrices loaded in this process, by the name or path they are requested with
+scoring_matrices = {}
+
+# the settings of the current worker process
+worker_settings = {'result_cache': None}
+
+def get_scoring_matrix(name):
+    # name is the path of a scoring matrix file or the name of a built-in one
+    if name not in scoring_matrices:
+        path = name
+        if not os.path.exists(path) and ScoringMatrixFileReader.get_built_in_path(name) is not None:
+            path = ScoringMatrixFileReader.get_built_in_path(name)
+        if not os.path.isfile(path):
+            raise ValueError("Unknown scoring matrix!: {}".format(name))
+        scoring_matrices[name] = ScoringMatrixFileReader(path).read_matrix()
+    return scoring_matrices[name]
+
+def initialize_worker(result_cache, preloaded_matrices):
+    worker_settings['result_cache'] = result_cache
+    for name in preloaded_matrices:
+        get_scoring_matrix(name)
+
+def align_batch(requests):
+    # runs in a worker process: returns the responses to a list of alignment requests
+    return [align_request(request) for request in requests]
+
+def align_request(request):
+    try:
+        alignment_processor = AlignmentProcessor(request['sequence1'], request['sequence2'], request['alignment'],
+                                                 get_scoring_matrix(request['scoring_matrix']),
+                                                 request['gap_opening_penalty'], request['gap_extension_penalty'],
+                                                 False, request.get('engine', 'python'),
+                                                 request.get('linear_space_threshold', AlignmentProcessor.DEFAULT_LINEAR_SPACE_THRESHOLD),
+                                                 request.get('band_width'), None, request.get('max_alignments'),
+                                                 request.get('top'), worker_settings['result_cache'])
+        if request['type'] == 'score':
+            score, end = alignment_processor.calculate_score()
+            return {'ok': True, 'result': {'score': score, 'end': end}}
+
+        results = alignment_processor.align()
+        return {'ok': True, 'result': {
+            'alignments': [result.get_aligned_sequences() for result in results],
+            'match_strings': [result.get_match_string() for result in results],
+            'raw_alignment_scores': [result.score for result in results],
+            'percent_identities': [result.get_percent_identity() for result in results],
+            'positions': [result.get_positions() for result in results],
+            'band_edge_reached': alignment_processor.band_edge_reached,
+        }}
+    except (ValueError, TypeError, OSError) as e:
+        return {'ok': False, 'error': str(e)}
+    except Exception as e:
+        # e.g. a scoring matrix file that cannot be parsed: only this request fails, not its batch
+        return {'ok': False, 'error': "The alignment failed!: {}".format(e)}
+
+def is_integer(value):
+    # JSON true and false are read as the bools True and False, which are ints too
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def check_request(request):
+    # returns the error message of an invalid alignment request, or None.
+    # only what the workers cannot report clearly is checked here.
+    for field in ('sequence1', 'sequence2', 'alignment', 'scoring_matrix', 'gap_opening_penalty', 'gap_extension_penalty'):
+        if field not in request:
+            return "Missing field!: {}".format(field)
+    if not isinstance(request['sequence1'], str) or not isinstance(request['sequence2'], str):
+        return "Sequences must be strings!"
+    if request['alignment'] not in ('local', 'global'):
+        return "Invalid value for alignment type!: {}\nAlignment type can be either local or global".format(request['alignment'])
+    if request.get('engine', 'python') not in ('python', 'numpy'):
+        return "Invalid value for engine!: {}\nEngine can be either python or numpy".format(request['engine'])
+    for field in ('gap_opening_penalty', 'gap_extension_penalty'):
+        if not is_integer(request[field]) or request[field] > 0:
+            return "Invalid value for {}!: {}".format(field.replace('_', ' '), request[field])
+    if request.get('band_width') not in (None, 'auto') and (not is_integer(request['band_width']) or request['band_width'] < 0):
+        return "Invalid value for band width!: {}\nBand width can be either a number or auto".format(request['band_width'])
+    if request.get('band_width') is not None and request['type'] == 'score':
+        return "band_width cannot be used with score requests!"
+    if not is_integer(request.get('linear_space_threshold', 0)) or request.get('linear_space_threshold', 0) < 0:
+        return "Invalid value for linear space threshold!: {}".format(request['linear_space_threshold'])
+    for field in ('max_alignments', 'top'):
+        if request.get(field) is not None and (not is_integer(request[field]) or request[field] < 1):
+            return "Invalid value for {}!: {}".format(field.replace('_', ' '), request[field])
+    if request.get('top') is not None and (request['alignment'] != 'local' or request['type'] != 'align'):
+        return "top can only be used with local alignment!"
+    return None
+
+class AlignmentServer:
+    # serves alignments over a local TCP or Unix socket. every request and response
+    # is a JSON object on one line; a response carries the id of its request, and
+    # the responses to the requests sent on one connection may come in any order.
+    #
+    #   {"id": 1, "type": "align", "sequence1": "...", "sequence2": "...", "alignment": "local",
+    #    "scoring_matrix": "BLOSUM62", "gap_opening_penalty": -10, "gap_extension_penalty": -1}
+    #   {"id": 1, "ok": true, "result": {"alignments": [["...", "..."]], "raw_alignment_scores": [...], ...}}
+    #
+    # request types: align, score (the score and end cell only), health and stats.
+    # align and score take the optional engine, linear_space_threshold, band_width (align only),
+    # max_alignments and top fields, which mean the same as the command line options.
+    #
+    # the alignments run on a pool of worker processes which keep the scoring matrices
+    # loaded. the requests waiting in the queue are sent to a worker together, up to
+    # batch_size of them, so that small alignments do not cost a round trip each. when
+    # max_pending requests are waiting, the server stops reading from the connections
+    # until some of them are done.
+
+    def __init__(self, workers = None, batch_size = 64, batch_delay = 0.002, max_pending = 4096,
+     preloaded_matrices = (), result_cache = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay # seconds to wait for more requests when a batch is not full
+        self.max_pending = max_pending
+        self.preloaded_matrices = tuple(preloaded_matrices)
+        self.result_cache = result_cache
+        self.queue = None
+        self.batch_slots = None
+        self.executor = None
+        self.start_time = None
+        self.counters = {'connections': 0, 'requests': 0, 'errors': 0, 'batches': 0, 'batched requests': 0}
+
+    async def start(self, host = '127.0.0.1', port = 8765, unix_socket = None):
+        for name in self.preloaded_matrices:
+            get_scoring_matrix(name) # fails early on an unknown matrix
+
+        self.queue = asyncio.Queue(self.max_pending)
+        # two batches per worker: one running, one ready to start
+        self.batch_slots = asyncio.Semaphore(2 * self.workers)
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers, initializer = initialize_worker,
+                                                               initargs = (self.result_cache,
+                                                                           self.preloaded_matrices))
+        self.start_time = time.time()
+        self.dispatcher = asyncio.ensure_future(self.dispatch())
+
+        # long sequences do not fit in the default line limit of the streams
+        if unix_socket is not None:
+            return await asyncio.start_unix_server(self.handle_connection, unix_socket, limit = 2 ** 28)
+        return await asyncio.start_server(self.handle_connection, host, port, limit = 2 ** 28)
+
+    def close(self):
+        self.dispatcher.cancel()
+        self.executor.shutdown(cancel_futures = True)
+
+    async def handle_connection(self, reader, writer):
+        self.counters['connections'] += 1
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                self.counters['requests'] += 1
+                # waits while the queue is full, which stops reading from this connection
+                task = await self.handle_request(line, writer, write_lock)
+                if task is not None:
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line, writer, write_lock):
+        # answers health and stats requests at once, queues the others and returns
+        # the task that sends their responses
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object!")
+        except ValueError as e:
+            await self.respond(writer, write_lock, None, {'ok': False, 'error': "Invalid request!: {}".format(e)})
+            return None
+
+        request_id = request.get('id')
+        request_type = request.get('type', 'align')
+        request['type'] = request_type
+        if request_type == 'health':
+            await self.respond(writer, write_lock, request_id, {'ok': True, 'result': self.get_health()})
+            return None
+        if request_type == 'stats':
+            await self.respond(writer, write_lock, request_id, {'ok': True, 'result': self.get_stats()})
+            return None
+        if request_type not in ('align', 'score'):
+            error = "Invalid request type!: {}\nRequest type can be align, score, health or stats".format(request_type)
+            await self.respond(writer, write_lock, request_id, {'ok': False, 'error': error})
+            return None
+
+        error = check_request(request)
+        if error is not None:
+            await self.respond(writer, write_lock, request_id, {'ok': False, 'error': error})
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((request, future))
+        return asyncio.ensure_future(self.respond_when_done(writer, write_lock, request_id, future))
+
+    async def respond_when_done(self, writer, write_lock, request_id, future):
+        try:
+            response = await future
+        except Exception as e: # e.g. a worker process died
+            response = {'ok': False, 'error': "The alignment failed!: {}".format(e)}
+        await self.respond(writer, write_lock, request_id, response)
+
+    async def respond(self, writer, write_lock, request_id, response):
+        if not response['ok']:
+            self.counters['errors'] += 1
+        response = dict(response, id = request_id)
+        async with write_lock:
+            writer.write((json.dumps(response) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    async def dispatch(self):
+        # takes the waiting requests from the queue in batches and runs them on the workers
+        while True:
+            batch = [await self.queue.get()]
+            if self.queue.empty() and self.batch_delay > 0:
+                await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            await self.batch_slots.acquire()
+            asyncio.ensure_future(self.run_batch(batch))
+
+    async def run_batch(self, batch):
+        self.counters['batches'] += 1
+        self.counters['batched requests'] += len(batch)
+        try:
+            responses = await asyncio.get_running_loop().run_in_executor(
+                self.executor, align_batch, [request for request, future in batch])
+            for (request, future), response in zip(batch, responses):
+                future.set_result(response)
+        except Exception as e:
+            for request, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.batch_slots.release()
+
+    def get_health(self):
+        return {'status': 'ok', 'pending': self.queue.qsize(), 'workers': self.workers}
+
+    def get_stats(self):
+        stats = dict(self.counters)
+        stats['uptime'] = time.time() - self.start_time
+        stats['pending'] = self.queue.qsize()
+        stats['average batch size'] = stats['batched requests'] / stats['batches'] if stats['batches'] else 0
+        stats['preloaded scoring matrices'] = list(self.preloaded_matrices)
+        return stats
+
+class AlignmentClient:
+    # a blocking client of AlignmentServer. request_many sends all the requests
+    # before reading the responses, so that the server can batch them.
+
+    def __init__(self, host = '127.0.0.1', port = 8765, unix_socket = None):
+        if unix_socket is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(unix_socket)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile('rwb')
+        self.next_id = 0
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def request(self, request):
+        return self.request_many([request])[0]
+
+    def request_many(self, requests, window = 1024):
+        # returns the responses in the order of the requests. at most window requests
+        # are sent ahead of the responses, so that neither side blocks on a full socket
+        # while the other one is writing too.
+        ids = []
+        responses = {}
+        for request in requests:
+            if len(ids) - len(responses) >= window:
+                self.file.flush()
+                self.read_response(responses)
+            request = dict(request, id = self.next_id)
+            ids.append(self.next_id)
+            self.next_id += 1
+            self.file.write((json.dumps(request) + "\n").encode("utf-8"))
+        self.file.flush()
+
+        while len(responses) < len(ids):
+            self.read_response(responses)
+        return [responses[request_id] for request_id in ids]
+
+    def read_response(self, responses):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection!")
+        response = json.loads(line)
+        responses[response['id']] = response
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description = "Serves pairwise alignments over a local socket with a JSON protocol.")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--unix-socket", help = "path of a Unix socket to listen on instead of TCP")
+    parser.add_argument("--workers", type = int, help = "number of worker processes (all CPUs by default)")
+    parser.add_argument("--batch-size", type = int, default = 64, help = "the most requests sent to a worker at once")
+    parser.add_argument("--batch-delay", type = float, default = 0.002,
+                        help = "seconds to wait for more requests when a batch is not full")
+    parser.add_argument("--max-pending", type = int, default = 4096,
+                        help = "the most requests waiting for a worker before the server stops reading")
+    parser.add_argument("--preload", nargs = "+", default = [],
+                        help = "scoring matrices (paths or built-in names) to load when the server starts")
+    parser.add_argument("--cache", help = "path of the SQLite database to cache the alignment results in")
+    return parser.parse_args(args)
+
+async def serve(options):
+    result_cache = AlignmentResultCache(os.path.abspath(options.cache)) if options.cache is not None else None
+    server = AlignmentServer(options.workers, options.batch_size, options.batch_delay, options.max_pending,
+                             options.preload, result_cache)
+    try:
+        listener = await server.start(options.host, options.port, options.unix_socket)
+    except (ValueError, OSError) as e:
+        print ("\n{}".format(e))
+        return
+
+    print ("Listening on {}".format(options.unix_socket or "{}:{}".format(options.host, options.port)))
+    sys.stdout.flush()
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+def main(args):
+    options = parse_args(args)
+    try:
+        asyncio.run(serve(options))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
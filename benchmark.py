@@ -0,0 +1,224 @@
+import sys, os
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+from pairwise_sequence_alignment import AlignmentProcessor, AlignmentStatistics, ScoringMatrixFileReader, np
+
+PROTEIN_ALPHABET = "ARNDCQEGHILKMFPSTWYV"
+DNA_ALPHABET = "ACGT"
+
+class SyntheticPairGenerator:
+    # generates pairs of related sequences: the second sequence is a copy of the
+    # first one with substitutions, insertions and deletions, so that about the
+    # given fraction of its residues stays identical.
+
+    def __init__(self, alphabet, seed = 0):
+        self.alphabet = alphabet
+        self.random = random.Random(seed)
+
+    def generate_sequence(self, length):
+        return "".join(self.random.choice(self.alphabet) for i in range(length))
+
+    def mutate(self, sequence, identity, indel_fraction = 0.1):
+        # a tenth of the mutations are indels, the rest substitutions
+        mutation_rate = 1 - identity
+        result = []
+        for residue in sequence:
+            r = self.random.random()
+            if r >= mutation_rate:
+                result.append(residue)
+            elif r < mutation_rate * indel_fraction / 2: # deletion
+                continue
+            elif r < mutation_rate * indel_fraction: # insertion
+                result.append(residue)
+                result.append(self.random.choice(self.alphabet))
+            else:
+                result.append(self.random.choice([x for x in self.alphabet if x != residue]))
+        return "".join(result)
+
+    def generate_pair(self, length, identity):
+        sequence1 = self.generate_sequence(length)
+        return sequence1, self.mutate(sequence1, identity)
+
+class Benchmark:
+    # runs every mode of every engine on synthetic pairs and records wall time,
+    # cells per second and peak memory for each of them.
+
+    # mode name: (alignment type, how the alignment is run)
+    MODES = {
+        'global': ('global', 'align'),
+        'local': ('local', 'align'),
+        'global-score-only': ('global', 'score'),
+        'local-score-only': ('local', 'score'),
+        'global-linear-space': ('global', 'linear-space'),
+        'global-banded': ('global', 'banded'),
+    }
+
+    def __init__(self, scoring_matrices, lengths, identities, engines, modes, repeat,
+     gap_opening_penalty, gap_extension_penalty, seed, measure_memory = True):
+        # scoring_matrices maps a sequence type (protein or dna) to its scoring matrix
+        self.scoring_matrices = scoring_matrices
+        self.lengths = lengths
+        self.identities = identities
+        self.engines = engines
+        self.modes = modes
+        self.repeat = repeat
+        self.gap_opening_penalty = gap_opening_penalty
+        self.gap_extension_penalty = gap_extension_penalty
+        self.seed = seed
+        self.measure_memory = measure_memory
+
+    def create_processor(self, sequence1, sequence2, sequence_type, engine, mode, statistics = None):
+        alignment_type, run = self.MODES[mode]
+        linear_space_threshold = 0 if run == 'linear-space' else AlignmentProcessor.DEFAULT_LINEAR_SPACE_THRESHOLD
+        band_width = 'auto' if run == 'banded' else None
+        return AlignmentProcessor(sequence1, sequence2, alignment_type, self.scoring_matrices[sequence_type],
+                                  self.gap_opening_penalty, self.gap_extension_penalty, False, engine,
+                                  linear_space_threshold, band_width, statistics)
+
+    def run_once(self, sequence1, sequence2, sequence_type, engine, mode):
+        # returns the score and the number of cells computed, which depends on the mode:
+        # e.g. a band holds fewer cells than the matrix, and the linear space algorithm
+        # computes about twice as many
+        statistics = AlignmentStatistics()
+        alignment_processor = self.create_processor(sequence1, sequence2, sequence_type, engine, mode, statistics)
+        if self.MODES[mode][1] == 'score':
+            score = alignment_processor.calculate_score()[0]
+        else:
+            score = alignment_processor.align()[0].score
+        return score, statistics.counters.get('cells', 0)
+
+    def run_case(self, sequence1, sequence2, sequence_type, engine, mode):
+        wall_times = []
+        cpu_times = []
+        for i in range(self.repeat):
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            score, cells = self.run_once(sequence1, sequence2, sequence_type, engine, mode)
+            cpu_times.append(time.process_time() - cpu_start)
+            wall_times.append(time.perf_counter() - wall_start)
+
+        peak_memory = None
+        if self.measure_memory:
+            # measured in a separate run, since tracing the allocations slows them down
+            tracemalloc.start()
+            self.run_once(sequence1, sequence2, sequence_type, engine, mode)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        wall_time = min(wall_times)
+        return {
+            'sequence_type': sequence_type,
+            'length': len(sequence1),
+            'identity': None,
+            'engine': engine,
+            'mode': mode,
+            'score': score,
+            'cells': cells,
+            'wall_time': wall_time,
+            'cpu_time': min(cpu_times),
+            'cells_per_second': cells / wall_time if wall_time > 0 else None,
+            'peak_memory': peak_memory,
+        }
+
+    def run(self):
+        # yields the results of the cases one by one
+        for sequence_type in sorted(self.scoring_matrices):
+            alphabet = PROTEIN_ALPHABET if sequence_type == 'protein' else DNA_ALPHABET
+            generator = SyntheticPairGenerator(alphabet, self.seed)
+            for length in self.lengths:
+                for identity in self.identities:
+                    sequence1, sequence2 = generator.generate_pair(length, identity)
+                    for engine in self.engines:
+                        for mode in self.modes:
+                            result = self.run_case(sequence1, sequence2, sequence_type, engine, mode)
+                            result['identity'] = identity
+                            yield result
+
+def get_case_key(result):
+    return (result['sequence_type'], result['length'], result['identity'], result['engine'], result['mode'])
+
+def get_environment():
+    environment = {
+        'python': platform.python_version(),
+        'numpy': np.__version__ if np is not None else None,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'commit': None,
+    }
+    try:
+        environment['commit'] = subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True,
+                                               cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        pass
+    return environment
+
+def format_result(result, previous_result = None):
+    peak_memory = "-" if result['peak_memory'] is None else "{:.1f} MB".format(result['peak_memory'] / 2 ** 20)
+    cells_per_second = result['cells_per_second'] or 0
+    line = "{:8} {:>7} {:>5} {:7} {:20} {:>10.4f} s {:>9.2f} MCUPS {:>10}".format(
+        result['sequence_type'], result['length'], result['identity'], result['engine'], result['mode'],
+        result['wall_time'], cells_per_second / 1e6, peak_memory)
+    if previous_result is not None and result['wall_time'] > 0:
+        line += "  {:.2f}x".format(previous_result['wall_time'] / result['wall_time'])
+    return line
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description = "Benchmarks the alignment engines and modes on synthetic sequence pairs.")
+    parser.add_argument("--lengths", type = int, nargs = "+", default = [100, 300, 1000])
+    parser.add_argument("--identities", type = float, nargs = "+", default = [0.5, 0.9])
+    parser.add_argument("--engines", nargs = "+", default = ['python'] + (['numpy'] if np is not None else []),
+                        choices = ['python', 'numpy'])
+    parser.add_argument("--modes", nargs = "+", default = sorted(Benchmark.MODES), choices = sorted(Benchmark.MODES))
+    parser.add_argument("--sequence-types", nargs = "+", default = ['protein', 'dna'], choices = ['protein', 'dna'])
+    parser.add_argument("--protein-scoring-matrix", default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BLOSUM62.txt"))
+    parser.add_argument("--dna-scoring-matrix", default = "NUC.4.4", help = "path of a scoring matrix, or the name of a built-in one")
+    parser.add_argument("--gap-opening-penalty", type = int, default = -10)
+    parser.add_argument("--gap-extension-penalty", type = int, default = -1)
+    parser.add_argument("--repeat", type = int, default = 3, help = "the best of this many runs is reported")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--no-memory", action = "store_true", help = "do not measure the peak memory")
+    parser.add_argument("--output", help = "path of the JSON file to record the results to")
+    parser.add_argument("--compare", help = "path of a JSON file recorded earlier, to compare the wall times with")
+    return parser.parse_args(args)
+
+def main(args):
+    options = parse_args(args)
+
+    scoring_matrices = {}
+    if 'protein' in options.sequence_types:
+        scoring_matrices['protein'] = ScoringMatrixFileReader(options.protein_scoring_matrix).read_matrix()
+    if 'dna' in options.sequence_types:
+        scoring_matrices['dna'] = ScoringMatrixFileReader(options.dna_scoring_matrix).read_matrix()
+
+    previous_results = {}
+    if options.compare is not None:
+        with open(options.compare, encoding="utf-8") as f:
+            previous_results = {get_case_key(result): result for result in json.load(f)['results']}
+
+    benchmark = Benchmark(scoring_matrices, options.lengths, options.identities, options.engines, options.modes,
+                          options.repeat, options.gap_opening_penalty, options.gap_extension_penalty, options.seed,
+                          not options.no_memory)
+
+    print ("{:8} {:>7} {:>5} {:7} {:20} {:>12} {:>15} {:>10}".format(
+        "type", "length", "ident", "engine", "mode", "wall time", "speed", "peak mem") +
+        ("  speedup" if previous_results else ""))
+    results = []
+    for result in benchmark.run():
+        results.append(result)
+        print (format_result(result, previous_results.get(get_case_key(result))))
+        sys.stdout.flush()
+
+    if options.output is not None:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump({'environment': get_environment(), 'results': results}, f, indent = 2)
+        print ("The results have been recorded to the following path: {}".format(os.path.abspath(options.output)))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
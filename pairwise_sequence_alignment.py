@@ -1,4 +1,30 @@
 import sys, os
+import bisect
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import marshal
+import math
+import mmap
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import time
+from array import array
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
 
 class ScoringMatrix:
     def __init__(self, matrix, row_titles, column_titles, row_index_map, column_index_map):
@@ -7,6 +33,12 @@ class ScoringMatrix:
         self.column_titles = column_titles
         self.row_index_map = row_index_map
         self.column_index_map = column_index_map
+        # the compiled form, created when first needed
+        self.row_code_table = None
+        self.column_code_table = None
+        self.dense_matrix = None
+        self.fingerprint = None
+        self.residue_class_tables = None
     
     def get_matrix(self):
         return self.matrix
@@ -27,6 +59,94 @@ class ScoringMatrix:
         row_index = self.row_index_map[x.upper()]
         column_index = self.column_index_map[y.upper()]
         return self.matrix[row_index][column_index]
+
+    def get_fingerprint(self):
+        # a hash of the contents of the matrix, identifying it in the result cache
+        if self.fingerprint is None:
+            contents = json.dumps([self.row_titles, self.column_titles, self.matrix])
+            self.fingerprint = hashlib.sha256(contents.encode("utf-8")).hexdigest()
+        return self.fingerprint
+
+    def get_dense_matrix(self):
+        # the matrix as a flat typed array: the score of (row r, column c) is at r * number of columns + c
+        if self.dense_matrix is None:
+            self.dense_matrix = array('q', [value for row in self.matrix for value in row])
+        return self.dense_matrix
+
+    def create_code_table(self, index_map):
+        # maps every byte to the index of its residue (in either case), or to 255 if it is not a residue
+        table = bytearray([255]) * 256
+        for residue, index in index_map.items():
+            if len(residue) == 1 and ord(residue) < 128:
+                table[ord(residue.upper())] = index
+                table[ord(residue.lower())] = index
+        return bytes(table)
+
+    def encode_sequence(self, sequence, table, sequence_name):
+        try:
+            encoded_sequence = sequence.encode('latin-1').translate(table)
+        except UnicodeEncodeError:
+            encoded_sequence = bytes(table[ord(x)] if ord(x) < 256 else 255 for x in sequence)
+
+        position = encoded_sequence.find(255)
+        if position != -1:
+            raise ValueError("Unknown residue '{}' at position {} of {}!".format(sequence[position], position + 1, sequence_name))
+        return encoded_sequence
+
+    def encode_row_sequence(self, sequence, sequence_name = 'sequence'):
+        # encodes the residues of a sequence as their row indexes (x in get_score_of_pair).
+        # raises ValueError if a residue is not in the matrix.
+        if self.row_code_table is None:
+            self.row_code_table = self.create_code_table(self.row_index_map)
+        return self.encode_sequence(sequence, self.row_code_table, sequence_name)
+
+    def encode_column_sequence(self, sequence, sequence_name = 'sequence'):
+        # encodes the residues of a sequence as their column indexes (y in get_score_of_pair).
+        # raises ValueError if a residue is not in the matrix.
+        if self.column_code_table is None:
+            self.column_code_table = self.create_code_table(self.column_index_map)
+        return self.encode_sequence(sequence, self.column_code_table, sequence_name)
+
+    def get_match_and_mismatch_scores(self, row_indexes, column_indexes):
+        # the scores (match, mismatch) if, among the given row and column residues, every
+        # pair of the same residue has one score and every pair of different residues
+        # another one, or None. e.g. NUC.4.4 has them over A, C, G and T, though not over
+        # its ambiguity codes.
+        match_scores = set()
+        mismatch_scores = set()
+        for row_index in row_indexes:
+            for column_index in column_indexes:
+                if self.row_titles[row_index].upper() == self.column_titles[column_index].upper():
+                    match_scores.add(self.matrix[row_index][column_index])
+                else:
+                    mismatch_scores.add(self.matrix[row_index][column_index])
+        if len(match_scores) == 1 and len(mismatch_scores) == 1:
+            return match_scores.pop(), mismatch_scores.pop()
+        return None
+
+    def get_residue_class_tables(self):
+        # tables for bytes.translate mapping the row and the column indexes of the residues
+        # to the same number if they are the same residue, so that encoded sequences can be
+        # compared with each other. None if there are too many residues to number them in a byte.
+        if self.residue_class_tables is None:
+            classes = {}
+            tables = []
+            for index_map in (self.row_index_map, self.column_index_map):
+                table = bytearray(256)
+                for title, index in index_map.items():
+                    table[index] = classes.setdefault(title.upper(), len(classes) % 256)
+                tables.append(bytes(table))
+            self.residue_class_tables = tuple(tables) if len(classes) <= 256 else False
+        return self.residue_class_tables or None
+
+    def get_row_profile(self, encoded_sequence):
+        # for every column residue, the scores of the residues of a row encoded sequence against it
+        return [array('q', [self.matrix[x][column_index] for x in encoded_sequence])
+                for column_index in range(len(self.column_titles))]
+
+    def get_column_profile(self, encoded_sequence):
+        # for every row residue, the scores of the residues of a column encoded sequence against it
+        return [array('q', [row[y] for y in encoded_sequence]) for row in self.matrix]
     
     def print(self):
         max_len = len(str(self.matrix[0][0]))
@@ -47,27 +167,46 @@ class ScoringMatrix:
             print ()
 
 class ScoringMatrixFileReader:
+    # the scoring matrices distributed in the scoring_matrices directory, which can be given by name
+    BUILT_IN_SCORING_MATRICES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_matrices")
+    BUILT_IN_SCORING_MATRICES = ("BLOSUM45", "BLOSUM50", "BLOSUM62", "BLOSUM80", "BLOSUM90",
+                                 "PAM30", "PAM70", "PAM250", "NUC.4.4")
+
     def __init__(self, path = None):
+        # path is the path of a scoring matrix file, or the name of a built-in matrix
         self.path = path
 
     def load_path(self, path):
         self.path = path
 
+    @staticmethod
+    def get_built_in_path(name):
+        # returns the path of the built-in matrix with the given name (in any case), or None
+        for built_in_name in ScoringMatrixFileReader.BUILT_IN_SCORING_MATRICES:
+            if built_in_name.upper() == name.upper():
+                return os.path.join(ScoringMatrixFileReader.BUILT_IN_SCORING_MATRICES_DIRECTORY, built_in_name + ".txt")
+        return None
+
+    def get_path(self):
+        if not os.path.exists(self.path) and self.get_built_in_path(self.path) is not None:
+            return self.get_built_in_path(self.path)
+        return self.path
+
     def read_matrix(self):
+        return self.parse_matrix()
+
+    def parse_matrix(self):
         valid_lines = []
-        with open(self.path, encoding="utf-8") as f:
+        with open(self.get_path(), encoding="utf-8") as f:
             while True:
                 line = f.readline()
                 if not line:
                     break
-                if not line.strip().startswith("#"):
+                if line.strip() and not line.strip().startswith("#"):
                     valid_lines.append(line.strip().split("#")[0].upper())
 
         column_titles = valid_lines[0].split()
-        column_index_map = {i:column_titles.index(i) for i in column_titles}
-
         row_titles = [i.split()[0] for i in valid_lines[1:]]
-        row_index_map = {i:row_titles.index(i) for i in row_titles}
 
         matrix = []
         for line in valid_lines[1:]:
@@ -76,13 +215,465 @@ class ScoringMatrixFileReader:
                 values.append(int(value))
             matrix.append(values)
 
+        return self.create_scoring_matrix(matrix, row_titles, column_titles)
+
+    def create_scoring_matrix(self, matrix, row_titles, column_titles):
+        # the first index of every title, as list.index would give
+        column_index_map = {}
+        for index, title in enumerate(column_titles):
+            column_index_map.setdefault(title, index)
+
+        row_index_map = {}
+        for index, title in enumerate(row_titles):
+            row_index_map.setdefault(title, index)
+
         return ScoringMatrix(matrix, row_titles, column_titles, row_index_map, column_index_map)
 
+class SequenceFileReader:
+    # reads (id, sequence) records lazily from FASTA / multi-FASTA files, or from
+    # plain text files in which each non-empty line is a sequence, identified by
+    # its number among them. the files can be gzip compressed. uncompressed files
+    # are memory-mapped, so the records are read without loading the whole file.
+
+    def __init__(self, path = None):
+        self.path = path
+        self.index = None
+
+    def load_path(self, path):
+        self.path = path
+        self.index = None
+
+    def get_index_path(self):
+        return self.path + ".idx"
+
+    @staticmethod
+    def get_cache_directory():
+        # where the index files are kept when they cannot be written next to the sequence file
+        return os.environ.get("PAIRWISE_ALIGNMENT_CACHE_DIR",
+                              os.path.join(os.path.expanduser("~"), ".cache", "pairwise_sequence_alignment"))
+
+    def get_cached_index_path(self):
+        # the path of the index in the cache directory, named after the path of the sequence file
+        name = hashlib.sha256(os.path.abspath(self.path).encode("utf-8")).hexdigest()
+        return os.path.join(self.get_cache_directory(), name + ".idx")
+
+    def is_compressed(self):
+        with open(self.path, 'rb') as f:
+            return f.read(2) == b'\x1f\x8b'
+
+    def read_lines(self):
+        # yields (offset, line) pairs, offset being the position of the line in the (uncompressed) file
+        if self.is_compressed():
+            with gzip.open(self.path, 'rb') as f:
+                yield from self.read_lines_of(f)
+        elif os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                    yield from self.read_lines_of(mapped_file)
+
+    def read_lines_of(self, f):
+        offset = 0
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            yield offset, line
+            offset += len(line)
+
+    def parse_records(self, lines):
+        # yields (id, sequence, start, end) tuples; the record takes the bytes
+        # from start to end in the file
+        fasta = None
+        number = 0
+        record_id = None
+        parts = []
+        start = end = 0
+
+        for offset, line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith(b';'):
+                continue
+            if fasta is None:
+                fasta = stripped.startswith(b'>')
+
+            if not fasta:
+                number += 1
+                yield str(number), stripped.decode('latin-1'), offset, offset + len(line)
+            elif stripped.startswith(b'>'):
+                if record_id is not None:
+                    yield record_id, b''.join(parts).decode('latin-1'), start, end
+                header = stripped[1:].split()
+                record_id = header[0].decode('latin-1') if header else ''
+                parts = []
+                start = offset
+                end = offset + len(line)
+            else:
+                parts.append(b''.join(stripped.split()))
+                end = offset + len(line)
+
+        if record_id is not None:
+            yield record_id, b''.join(parts).decode('latin-1'), start, end
+
+    def read_records(self):
+        for record_id, sequence, start, end in self.parse_records(self.read_lines()):
+            yield record_id, sequence
+
+    def build_index(self):
+        # records the position of every record in the index file. a gzip compressed file
+        # cannot be read from the middle, so it has no index, and the records are looked
+        # up by their ids, which must be unique.
+        if self.is_compressed():
+            raise ValueError("A gzip compressed file cannot be indexed!: {}".format(self.path))
+        index = {}
+        for record_id, sequence, start, end in self.parse_records(self.read_lines()):
+            if record_id in index:
+                raise ValueError("Duplicate record id '{}' in {}!".format(record_id, self.path))
+            index[record_id] = (start, end)
+        self.index = index
+
+        # written next to the sequence file, or to the cache directory if that fails. the
+        # index is only kept to save building it again: failing to write it is not an error.
+        for index_path in (self.get_index_path(), self.get_cached_index_path()):
+            if self.write_index(index_path):
+                break
+        return self.index
+
+    def write_index(self, index_path):
+        # written to a temporary file first, so that other processes never read a partial index
+        temporary_path = "{}.{}.tmp".format(index_path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(index_path) or ".", exist_ok = True)
+            with open(temporary_path, 'w', encoding="utf-8") as f:
+                for record_id, (start, end) in self.index.items():
+                    f.write("{}\t{}\t{}\n".format(record_id, start, end))
+            os.replace(temporary_path, index_path)
+        except OSError:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def load_index(self):
+        # loads the index file, building it first if it is missing or older than the sequence file
+        for index_path in (self.get_index_path(), self.get_cached_index_path()):
+            if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(self.path):
+                break
+        else:
+            return self.build_index()
+
+        self.index = {}
+        with open(index_path, encoding="utf-8") as f:
+            for line in f:
+                record_id, start, end = line.rstrip("\n").split("\t")
+                self.index[record_id] = (int(start), int(end))
+        return self.index
+
+    def get_record(self, record_id):
+        # returns the sequence of the given record, reading only its part of the file.
+        # raises KeyError if there is no such record.
+        if self.index is None:
+            self.load_index()
+        start, end = self.index[record_id]
+        return self.read_record_at(start, end)
+
+    def read_record_at(self, start, end):
+        # returns the sequence of the record taking the bytes from start to end in the
+        # file. a gzip compressed file is decompressed from its beginning up to the record.
+        if self.is_compressed():
+            with gzip.open(self.path, 'rb') as f:
+                f.seek(start)
+                content = f.read(end - start)
+        else:
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                content = f.read(end - start)
+
+        lines = self.read_lines_of(io.BytesIO(content))
+        for parsed_id, sequence, parsed_start, parsed_end in self.parse_records(lines):
+            return sequence
+
+class AlignmentStatistics:
+    # wall and CPU times of the phases of a run, counters, and the peak memory.
+    # the objects collecting them (Main, AlignmentProcessor, ...) take None
+    # instead of an AlignmentStatistics when they are not wanted.
+
+    def __init__(self):
+        self.phases = {} # phase: [wall time, CPU time, number of times measured]
+        self.started_phases = {} # phase: (wall clock, CPU clock) when it started
+        self.counters = {}
+        self.peak_memory = None
+
+    def start_phase(self, phase):
+        self.started_phases[phase] = (time.perf_counter(), time.process_time())
+
+    def end_phase(self, phase):
+        wall_start, cpu_start = self.started_phases.pop(phase)
+        record = self.phases.setdefault(phase, [0.0, 0.0, 0])
+        record[0] += time.perf_counter() - wall_start
+        record[1] += time.process_time() - cpu_start
+        record[2] += 1
+        self.update_peak_memory()
+
+    def count(self, counter, value = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def update_peak_memory(self):
+        # the peak resident memory of the process so far, if the platform reports it
+        if resource is None:
+            return
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin': # reported in kilobytes except on macOS
+            peak_memory *= 1024
+        self.peak_memory = max(self.peak_memory or 0, peak_memory)
+
+    def merge(self, other):
+        # adds the statistics collected by another object (e.g. in a worker process) to these
+        for phase, (wall_time, cpu_time, number) in other.phases.items():
+            record = self.phases.setdefault(phase, [0.0, 0.0, 0])
+            record[0] += wall_time
+            record[1] += cpu_time
+            record[2] += number
+        for counter, value in other.counters.items():
+            self.count(counter, value)
+        if other.peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, other.peak_memory)
+
+    def get_report(self):
+        return {
+            'phases': {phase: {'wall_time': record[0], 'cpu_time': record[1], 'count': record[2]}
+                       for phase, record in self.phases.items()},
+            'counters': dict(self.counters),
+            'peak_memory': self.peak_memory,
+        }
+
+    def format_text(self):
+        lines = ["{:28} {:>12} {:>12} {:>8}".format("Phase", "Wall time", "CPU time", "Count")]
+        for phase, (wall_time, cpu_time, number) in self.phases.items():
+            lines.append("{:28} {:>10.4f} s {:>10.4f} s {:>8}".format(phase, wall_time, cpu_time, number))
+        for counter, value in self.counters.items():
+            lines.append("{}: {}".format(counter.capitalize(), value))
+        if self.peak_memory is not None:
+            lines.append("Peak memory: {:.1f} MB".format(self.peak_memory / 2 ** 20))
+        return "\n".join(lines)
+
+    def format_json(self):
+        return json.dumps(self.get_report(), indent = 2)
+
+class AlignmentResultCache:
+    # keeps the results of alignments in an SQLite database, so that aligning the
+    # same pair with the same settings again only reads the result. when there are
+    # more than max_entries results, the least recently used ones are removed.
+    # several processes can use the same database: each of them opens its own
+    # connection, and SQLite serializes their writes.
+
+    DEFAULT_MAX_ENTRIES = 100000
+
+    # part of the keys, changed when what is stored for a result changes
+    VERSION = 3
+
+    # the number of results stored between two checks of the number of results
+    EVICTION_INTERVAL = 64
+
+    def __init__(self, path, max_entries = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        self.stored_since_eviction = 0
+
+    def __getstate__(self):
+        # sent to worker processes without the connection, each of them opens its own
+        state = dict(self.__dict__)
+        state['connection'] = None
+        return state
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout = 60, isolation_level = None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        return self.connection
+
+    def close(self):
+        # the results stored by worker processes since their last check are removed here too
+        if self.connection is not None:
+            try:
+                self.evict()
+            except sqlite3.OperationalError:
+                pass
+            self.connection.close()
+            self.connection = None
+
+    def get(self, key):
+        # returns the result stored with the key, or None
+        try:
+            connection = self.connect()
+            row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.OperationalError: # e.g. the database stayed locked too long: compute the result instead
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        try:
+            connection = self.connect()
+            connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+            self.stored_since_eviction += 1
+            if self.stored_since_eviction >= self.EVICTION_INTERVAL:
+                self.evict()
+        except sqlite3.OperationalError:
+            pass
+
+    def evict(self):
+        # removes the least recently used results beyond max_entries
+        self.stored_since_eviction = 0
+        self.connect().execute("DELETE FROM results WHERE last_used <= (SELECT last_used FROM results "
+                               "ORDER BY last_used DESC LIMIT 1 OFFSET ?)", (self.max_entries,))
+
+    def get_number_of_entries(self):
+        return self.connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+class AlignmentResult:
+    # an alignment of residues1 = sequence1[start1 - 1:end1] with residues2 = sequence2[start2 - 1:end2]
+    # (positions from 1), given by its path: the movements of AlignmentProcessor from the
+    # first column to the last, one byte per column. the score and the numbers of matches
+    # and of gaps opened and extended are counted once, when the alignment is traced back;
+    # the aligned sequences and the match string are built only when asked for.
+
+    __slots__ = ('residues1', 'residues2', 'path', 'start1', 'start2', 'score', 'matches',
+                 'gap_openings', 'gap_extensions', 'aligned_sequences')
+
+    # the operation of each movement in CIGAR strings: a pair of residues (M), a residue of
+    # sequence2 aligned with a gap (D) and a residue of sequence1 aligned with a gap (I)
+    CIGAR_OPERATIONS = "MDI"
+
+    def __init__(self, residues1, residues2, path, start1, start2, score, matches, gap_openings, gap_extensions):
+        self.residues1 = residues1
+        self.residues2 = residues2
+        self.path = path
+        self.start1 = start1
+        self.start2 = start2
+        self.score = score
+        self.matches = matches
+        self.gap_openings = gap_openings
+        self.gap_extensions = gap_extensions
+        self.aligned_sequences = None
+
+    @staticmethod
+    def from_cigar(sequence1, sequence2, start1, start2, cigar, score, matches, gap_openings, gap_extensions):
+        # the inverse of get_cigar
+        path = bytearray()
+        length = 0
+        for character in cigar:
+            if character.isdigit():
+                length = length * 10 + int(character)
+            else:
+                path += bytes([AlignmentResult.CIGAR_OPERATIONS.index(character)]) * length
+                length = 0
+        end1 = start1 - 1 + path.count(AlignmentProcessor.DIAGONAL_MOVEMENT) + path.count(AlignmentProcessor.HORIZONTAL_MOVEMENT)
+        end2 = start2 - 1 + path.count(AlignmentProcessor.DIAGONAL_MOVEMENT) + path.count(AlignmentProcessor.VERTICAL_MOVEMENT)
+        return AlignmentResult(sequence1[start1 - 1:end1], sequence2[start2 - 1:end2], bytes(path), start1, start2,
+                               score, matches, gap_openings, gap_extensions)
+
+    def get_positions(self):
+        # start and end in sequence1, start and end in sequence2
+        return (self.start1, self.start1 + len(self.residues1) - 1, self.start2, self.start2 + len(self.residues2) - 1)
+
+    def get_length(self):
+        return len(self.path)
+
+    def get_mismatches(self):
+        # every pair of residues takes a residue from both sequences, a gap from only one of them
+        return len(self.residues1) + len(self.residues2) - len(self.path) - self.matches
+
+    def get_percent_identity(self, round_to = 4):
+        if not self.path:
+            return 0.0
+        factor = 10 ** round_to
+        return round(self.matches * 100 / len(self.path) * factor) / factor
+
+    def get_runs(self):
+        # (movement, length) pairs of the consecutive columns with the same movement
+        return [(movement, len(list(columns))) for movement, columns in itertools.groupby(self.path)]
+
+    def get_cigar(self):
+        return "".join("{}{}".format(length, self.CIGAR_OPERATIONS[movement]) for movement, length in self.get_runs())
+
+    def get_number_of_gaps(self):
+        # the number of runs of gaps, each of which is counted as a gap opening by BLAST
+        return sum(1 for movement, length in self.get_runs() if movement != AlignmentProcessor.DIAGONAL_MOVEMENT)
+
+    def get_aligned_sequences(self):
+        # (aligned sequence1, aligned sequence2), built run by run from the residues
+        if self.aligned_sequences is None:
+            top_line = [] # aligned sequence1
+            bottom_line = [] # aligned sequence2
+            x = y = 0
+            for movement, length in self.get_runs():
+                if movement == AlignmentProcessor.DIAGONAL_MOVEMENT:
+                    top_line.append(self.residues1[x:x + length])
+                    bottom_line.append(self.residues2[y:y + length])
+                    x += length
+                    y += length
+                elif movement == AlignmentProcessor.VERTICAL_MOVEMENT:
+                    top_line.append("-" * length)
+                    bottom_line.append(self.residues2[y:y + length])
+                    y += length
+                else:
+                    top_line.append(self.residues1[x:x + length])
+                    bottom_line.append("-" * length)
+                    x += length
+            self.aligned_sequences = ("".join(top_line), "".join(bottom_line))
+        return self.aligned_sequences
+
+    def get_match_string(self):
+        top_line, bottom_line = self.get_aligned_sequences()
+        return "".join('|' if x == y else ' ' for x, y in zip(top_line, bottom_line))
+
 class AlignmentProcessor:
     # the algorithm
 
+    # movements kept in the movement map, one byte per cell. the gap extension
+    # state of a cell is its movement: a gap is extended only if the neighbouring
+    # cell it comes from has already moved in the same direction.
+    DIAGONAL_MOVEMENT = 0
+    VERTICAL_MOVEMENT = 1 # gap in sequence1
+    HORIZONTAL_MOVEMENT = 2 # gap in sequence2
+    NO_MOVEMENT = 3 # first row and column, and the cells reset to 0 in local alignment
+
+    # global alignments with more cells than this are done in linear space
+    DEFAULT_LINEAR_SPACE_THRESHOLD = 50000000
+
+    # the smallest band width chosen automatically for banded alignment
+    MINIMUM_BAND_WIDTH = 16
+
+    # bytes taken by a cell of the matrices: 8 for the score and 1 for the movement.
+    # the alignments that only need to be traced back keep the movements alone.
+    CELL_SIZE = 9
+    MOVEMENT_SIZE = 1
+
+    # the numpy engine fills a matrix spilled to disk in strips of at least this many rows
+    MINIMUM_STRIP_HEIGHT = 256
+
+    # the shortest rows the numpy engine computes with vector operations in the linear
+    # space algorithm, which splits the matrix into ever smaller parts
+    MINIMUM_NUMPY_ROW_LENGTH = 32
+
     def __init__(self, sequence1, sequence2, alignment_type,
-     scoring_matrix, gap_opening_penalty, gap_extension_penalty, DEBUG):
+     scoring_matrix, gap_opening_penalty, gap_extension_penalty, DEBUG, engine = 'python',
+     linear_space_threshold = DEFAULT_LINEAR_SPACE_THRESHOLD, band_width = None, statistics = None,
+     max_alignments = None, top_alignments = None, cache = None, tile_size = None, tile_workers = None,
+     memory_budget = None, spill_directory = None, incremental = False, sequence_names = ('sequence1', 'sequence2')):
         self.sequence1 = sequence1
         self.sequence2 = sequence2
         self.sequence1_length = len(self.sequence1)
@@ -92,83 +683,219 @@ class AlignmentProcessor:
         self.gap_opening_penalty = gap_opening_penalty
         self.gap_extension_penalty = gap_extension_penalty
         self.algorithm_matrix = []
+        self.movement_map = bytearray()
         self.DEBUG = DEBUG
+        self.engine = engine
+        self.linear_space_threshold = linear_space_threshold
+        self.band_width = band_width # None (no band), a number of diagonals, or 'auto'
+        self.band_edge_reached = False
+        self.statistics = statistics # an AlignmentStatistics, or None
+        self.max_alignments = max_alignments # the most co-optimal local alignments to return, None for all
+        self.top_alignments = top_alignments # the number of non-intersecting local alignments to return, or None
+        self.cache = cache # an AlignmentResultCache, or None
+        self.tile_size = tile_size # if given, the matrix is filled in tiles of this size by tile_workers processes
+        self.tile_workers = tile_workers
+
+        # the matrices taking more bytes than memory_budget (None for no limit), or not
+        # fitting in memory, are kept in a temporary file in spill_directory (None for
+        # the default one) mapped to memory
+        self.memory_budget = memory_budget
+        self.spill_directory = spill_directory
+        self.spill_file = None
+        self.spill_map = None
+
+        # in incremental mode, the matrix is kept after an alignment, so that realign can
+        # fill again only the rows after the first position where sequence2 changes.
+        # reusable_rows is the number of rows still valid for the current sequences, and
+        # row_maxima the maximum of each of them, from which local alignment finds its best score.
+        self.incremental = incremental
+        self.reusable_rows = 0
+        self.row_maxima = [0]
+        if incremental and (band_width is not None or tile_size is not None or top_alignments is not None):
+            raise ValueError("Incremental alignment cannot be used together with a band, tiles or top alignments!")
+
+        # the best score of local alignment and where it occurs, tracked during the fill:
+        # the rows containing it (python engine) or the anti-diagonals (numpy engine), or
+        # the cells themselves when only the movements are kept
+        self.best_score = 0
+        self.best_rows = []
+        self.best_diagonals = []
+        self.best_cells = []
+
+        # the sequences encoded once as indexes into the scoring matrix.
+        # unknown residues raise ValueError here rather than during the alignment,
+        # naming the sequence with sequence_names.
+        self.sequence_names = sequence_names
+        self.encoded_sequence1 = scoring_matrix.encode_row_sequence(sequence1, sequence_names[0])
+        self.encoded_sequence2 = scoring_matrix.encode_column_sequence(sequence2, sequence_names[1])
+        self.sequence1_profile = None
+        self.sequence2_profile = None
+
+    def start_phase(self, phase):
+        if self.statistics is not None:
+            self.statistics.start_phase(phase)
+
+    def end_phase(self, phase):
+        if self.statistics is not None:
+            self.statistics.end_phase(phase)
+
+    def count(self, counter, value = 1):
+        if self.statistics is not None:
+            self.statistics.count(counter, value)
+
+    def get_sequence1_profile(self):
+        # for every residue of sequence2, its scores against the residues of sequence1
+        if self.sequence1_profile is None:
+            self.sequence1_profile = self.scoring_matrix.get_row_profile(self.encoded_sequence1)
+        return self.sequence1_profile
+
+    def get_sequence2_profile(self):
+        # for every residue of sequence1, its scores against the residues of sequence2
+        if self.sequence2_profile is None:
+            self.sequence2_profile = self.scoring_matrix.get_column_profile(self.encoded_sequence2)
+        return self.sequence2_profile
+
+    def get_numpy_scores_and_codes(self):
+        rows = len(self.scoring_matrix.get_row_titles())
+        scores = np.frombuffer(self.scoring_matrix.get_dense_matrix(), dtype=np.int64).reshape(rows, -1)
+        codes1 = np.frombuffer(self.encoded_sequence1, dtype=np.uint8).astype(np.intp)
+        codes2 = np.frombuffer(self.encoded_sequence2, dtype=np.uint8).astype(np.intp)
+        return scores, codes1, codes2
     
-    def calculate_percent_identities(self, list_of_sequence_pairs, round_to = 4):
-        results = []
-        for sequence1, sequence2 in list_of_sequence_pairs:
-            number_of_matches = 0
-            n = len(sequence1)
-            for i in range(n):
-                if sequence1[i] == sequence2[i]:
-                    number_of_matches += 1
-            
-            result = number_of_matches * 100 / n
-            factor = 10 ** round_to
-            results.append(round(result * factor) / factor)
-
-        return results
-
-
-    def calculate_raw_alignment_scores(self, list_of_sequence_pairs):
-        results = []
-
-        for sequence1, sequence2 in list_of_sequence_pairs:
-            nongap_score = 0
-            opening_gaps = 0
-            extended_gaps = 0
-
-            gap_extension_state_seq1 = False
-            gap_extension_state_seq2 = False
-
-            for i in range(len(sequence1)):
-                from_seq1 = sequence1[i]
-                from_seq2 = sequence2[i]
-
-                if from_seq1 != '-' and from_seq2 != '-':
-                    if gap_extension_state_seq1:
-                        gap_extension_state_seq1 = False
-                    if gap_extension_state_seq2:
-                        gap_extension_state_seq2 = False
-
-                    nongap_score += self.scoring_matrix.get_score_of_pair(from_seq1, from_seq2)
-
+    def create_result(self, path, i, j):
+        # the AlignmentResult of the alignment with the given path starting after cell (i, j).
+        # the score is counted as a gap of k columns costing gap_opening_penalty +
+        # (k - 1) * gap_extension_penalty, where a gap in a sequence continues until
+        # the next pair of residues. a single pass over the path counts everything.
+        sequence1 = self.sequence1
+        sequence2 = self.sequence2
+        profile = self.get_sequence1_profile()
+        encoded_sequence2 = self.encoded_sequence2
+        start_i, start_j = i, j
+        pair_scores = 0
+        matches = 0
+        gap_openings = 0
+        gap_extensions = 0
+        gap_in_sequence1 = False
+        gap_in_sequence2 = False
+
+        for movement in path:
+            if movement == self.DIAGONAL_MOVEMENT:
+                pair_scores += profile[encoded_sequence2[i]][j]
+                if sequence1[j] == sequence2[i]:
+                    matches += 1
+                gap_in_sequence1 = False
+                gap_in_sequence2 = False
+                i += 1
+                j += 1
+            elif movement == self.VERTICAL_MOVEMENT:
+                if gap_in_sequence1:
+                    gap_extensions += 1
                 else:
-                    if from_seq1 == '-':
-                        if gap_extension_state_seq1:
-                            extended_gaps += 1
-                        else:
-                            opening_gaps += 1
-                            gap_extension_state_seq1 = True
-                    
-                    if from_seq2 == '-':
-                        if gap_extension_state_seq2:
-                            extended_gaps += 1
-                        else:
-                            opening_gaps += 1
-                            gap_extension_state_seq2 = True
-        
-            results.append(nongap_score + (opening_gaps * self.gap_opening_penalty) + (extended_gaps * self.gap_extension_penalty))
-        return results
-
+                    gap_openings += 1
+                    gap_in_sequence1 = True
+                i += 1
+            else:
+                if gap_in_sequence2:
+                    gap_extensions += 1
+                else:
+                    gap_openings += 1
+                    gap_in_sequence2 = True
+                j += 1
+
+        score = pair_scores + gap_openings * self.gap_opening_penalty + gap_extensions * self.gap_extension_penalty
+        return AlignmentResult(sequence1[start_j:j], sequence2[start_i:i], bytes(path), start_j + 1, start_i + 1,
+                               score, matches, gap_openings, gap_extensions)
+
+    def get_cache_key(self):
+        # everything the result of align() depends on. the engine is left out, since
+        # all engines give the same results.
+        if self.get_algorithm() == 'banded':
+            algorithm = ('banded', self.band_width)
+        elif self.get_algorithm() == 'linear space':
+            algorithm = ('linear space',)
+        else:
+            algorithm = ('full',)
+        settings = [AlignmentResultCache.VERSION, self.sequence1, self.sequence2, self.scoring_matrix.get_fingerprint(), self.alignment_type,
+                    self.gap_opening_penalty, self.gap_extension_penalty, algorithm, self.max_alignments,
+                    self.top_alignments]
+        return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()
 
     def align(self):
-        if self.alignment_type == 'global':
+        # returns the alignments found, as a list of AlignmentResult
+        if self.cache is None:
+            return self.compute_alignment()
+
+        self.start_phase('cache')
+        key = self.get_cache_key()
+        cached = self.cache.get(key)
+        self.end_phase('cache')
+        if cached is not None:
+            self.count('cache hits')
+            self.band_edge_reached = cached['band_edge_reached']
+            return [AlignmentResult.from_cigar(self.sequence1, self.sequence2, *alignment) for alignment in cached['alignments']]
+
+        self.count('cache misses')
+        results = self.compute_alignment()
+        self.start_phase('cache')
+        # the aligned residues are taken from the sequences again when read
+        self.cache.put(key, {
+            'alignments': [(result.start1, result.start2, result.get_cigar(), result.score, result.matches,
+                            result.gap_openings, result.gap_extensions) for result in results],
+            'band_edge_reached': self.band_edge_reached,
+        })
+        self.end_phase('cache')
+        return results
+
+    def compute_alignment(self):
+        if self.get_algorithm() == 'banded':
+            algorithm = self.banded_alignment
+        elif self.get_algorithm() == 'tiled':
+            algorithm = self.tiled_alignment
+        elif self.get_algorithm() == 'linear space':
+            algorithm = self.linear_space_global_alignment
+        elif self.alignment_type == 'global':
             algorithm = self.global_alignment
+        elif self.alignment_type == 'local' and self.top_alignments is not None:
+            algorithm = self.top_local_alignments
         elif self.alignment_type == 'local':
             algorithm = self.local_alignment
 
-        results = algorithm()
-        sequence_match_strings = self.get_sequence_report_strings(results)
-        raw_alignment_scores = self.calculate_raw_alignment_scores(results)
-        percent_identities = self.calculate_percent_identities(results)
-        return results, sequence_match_strings, raw_alignment_scores, percent_identities
+        try:
+            results = algorithm()
+        finally:
+            self.release_algorithm_matrix()
+        self.count('alignments', len(results))
+
+        return results
+
+    def get_algorithm(self):
+        # the algorithm align() uses: banded, tiled, linear space or matrix. all but the
+        # linear space algorithm fill the matrix with the same recurrence, extending a gap
+        # only if the neighbouring cell has moved in the same direction; the linear space
+        # algorithm finds an optimal alignment under the affine gap penalties, which may
+        # score higher. calculate_score gives the score of the same algorithm.
+        if self.band_width is not None:
+            return 'banded'
+        if self.tile_size is not None:
+            return 'tiled'
+        if self.alignment_type == 'global' and not self.incremental and self.use_linear_space():
+            return 'linear space'
+        return 'matrix'
+
+    def use_linear_space(self):
+        # the linear space algorithm relies on opening a gap costing at least as much as extending one
+        number_of_cells = (self.sequence1_length + 1) * (self.sequence2_length + 1)
+        return (number_of_cells > self.linear_space_threshold
+                and self.gap_opening_penalty <= self.gap_extension_penalty)
 
     def create_algorithm_matrix(self):
+        self.start_phase('matrix creation')
         if self.alignment_type == 'global':
             m, n = self.create_algorithm_matrix_for_global_alignment()
         else:
             m, n = self.create_algorithm_matrix_for_local_alignment()
+        self.end_phase('matrix creation')
         
         return m, n
     
@@ -176,243 +903,2377 @@ class AlignmentProcessor:
         m = self.sequence2_length + 1 # number of rows
         n = self.sequence1_length + 1 # number of columns
 
-        self.algorithm_matrix = [[0 for j in range(n)] for i in range(m)] # m x n matrix
+        # both matrices are stored row by row in flat typed arrays: cell (i, j) is at i * n + j.
+        # the scores take 8 bytes per cell and the movements 1 byte per cell.
+        if self.reusable_rows > 0 and self.spill_file is None and (
+                self.memory_budget is None or m * n * self.CELL_SIZE <= self.memory_budget):
+            # in incremental mode, the rows still valid are kept and the others created again
+            kept_cells = self.reusable_rows * n
+            try:
+                del self.algorithm_matrix[kept_cells:]
+                del self.movement_map[kept_cells:]
+                self.algorithm_matrix.extend(array('q', [0]) * (m * n - kept_cells))
+                self.movement_map.extend(bytes([self.NO_MOVEMENT]) * (m * n - kept_cells))
+                return m, n
+            except MemoryError:
+                pass
+        self.reusable_rows = 0
+        self.allocate_algorithm_matrix(m * n) # m x n matrices
 
         return m, n
 
+    def allocate_algorithm_matrix(self, number_of_cells, keep_scores = True):
+        # the matrices are created in memory, unless they take more than the memory
+        # budget or there is not enough memory for them. without keep_scores, the
+        # matrix of the scores is left empty.
+        cell_size = self.CELL_SIZE if keep_scores else self.MOVEMENT_SIZE
+        if self.memory_budget is not None and number_of_cells * cell_size > self.memory_budget:
+            self.spill_algorithm_matrix(number_of_cells, keep_scores)
+            return
+        try:
+            self.algorithm_matrix = array('q', [0]) * (number_of_cells if keep_scores else 0)
+            self.movement_map = bytearray([self.NO_MOVEMENT]) * number_of_cells
+        except MemoryError:
+            self.algorithm_matrix = []
+            self.movement_map = bytearray()
+            self.spill_algorithm_matrix(number_of_cells, keep_scores)
+
+    def spill_algorithm_matrix(self, number_of_cells, keep_scores = True):
+        # keeps the matrices in a temporary file mapped to memory: the scores followed
+        # by the movements. the file has no name, so it is removed when closed, even if
+        # the process is killed. the fill writes both matrices row by row, so the pages
+        # written to the file are sequential and the operating system keeps only the
+        # recent ones in memory.
+        self.release_algorithm_matrix()
+        scores_size = number_of_cells * 8 if keep_scores else 0
+        size = scores_size + number_of_cells
+        self.count('spilled bytes', size)
+        self.spill_file = tempfile.TemporaryFile(prefix = "pairwise_alignment_", dir = self.spill_directory)
+        try:
+            if size == 0:
+                self.algorithm_matrix = array('q')
+                self.movement_map = bytearray()
+                return
+            # the space is reserved up front where possible: running out of disk space
+            # while writing to the mapped file would kill the process
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(self.spill_file.fileno(), 0, size)
+            else:
+                self.spill_file.truncate(size)
+            self.spill_map = mmap.mmap(self.spill_file.fileno(), size)
+            block = bytes([self.NO_MOVEMENT]) * (1 << 20)
+            for start in range(scores_size, size, len(block)):
+                self.spill_map[start:min(size, start + len(block))] = block[:size - start]
+            self.algorithm_matrix = memoryview(self.spill_map)[:scores_size].cast('q')
+            self.movement_map = memoryview(self.spill_map)[scores_size:]
+        except BaseException:
+            self.release_algorithm_matrix()
+            raise
+
+    def release_algorithm_matrix(self):
+        # removes the temporary file of spilled matrices
+        if self.spill_file is None:
+            return
+        self.reusable_rows = 0
+        self.algorithm_matrix = []
+        self.movement_map = bytearray()
+        if self.spill_map is not None:
+            try:
+                self.spill_map.close()
+            except BufferError: # still used by a numpy view, closed when it is freed
+                pass
+            self.spill_map = None
+        self.spill_file.close()
+        self.spill_file = None
+
     def create_algorithm_matrix_for_local_alignment(self):
+        # the skeleton is already filled with zeros
         m, n = self.create_algorith_matrix_skeleton()
-
-        for i in range(m):
-            self.algorithm_matrix[i][0] = 0
-        for j in range(n):
-            self.algorithm_matrix[0][j] = 0
-        
         return m, n
 
     def create_algorithm_matrix_for_global_alignment(self):
         m, n = self.create_algorith_matrix_skeleton()
-        self.algorithm_matrix[0][0] = 0
+        self.algorithm_matrix[0] = 0
 
         for i in range(1, min(2, m)):
-            self.algorithm_matrix[i][0] = self.gap_opening_penalty
+            self.algorithm_matrix[i * n] = self.gap_opening_penalty
         for j in range(1, min(2, n)):
-            self.algorithm_matrix[0][j] = self.gap_opening_penalty
+            self.algorithm_matrix[j] = self.gap_opening_penalty
 
         for i in range(2, m):
-            self.algorithm_matrix[i][0] = self.algorithm_matrix[i - 1][0] + self.gap_extension_penalty
+            self.algorithm_matrix[i * n] = self.algorithm_matrix[(i - 1) * n] + self.gap_extension_penalty
         for j in range(2, n):
-            self.algorithm_matrix[0][j] = self.algorithm_matrix[0][j - 1] + self.gap_extension_penalty
+            self.algorithm_matrix[j] = self.algorithm_matrix[j - 1] + self.gap_extension_penalty
         
         return m, n
 
-    def get_sequence_report_strings(self, list_of_sequence_pairs):
-        results = []
-        for x in list_of_sequence_pairs:
-            s = ""
-            seq1 = x[0]
-            seq2 = x[1]
-            for i in range(len(seq1)):
-                if seq1[i] == seq2[i]:
-                    s += '|'
-                else:
-                    s += ' '
-            results.append(s)
-        return results
-
-    def local_alignment(self):
-        # -1: gap in sequence1 (vertical movement)
-        #  0: diagonal movement
-        #  1: gap in sequence2 (horizontal movement)
-        #  2: 0 (none of above)
-
-        movement_map = {}
-        m, n = self.create_algorithm_matrix()
+    def print_algorithm_matrix(self, m, n):
+        for i in range(m):
+            for j in range(n):
+                print (str(self.algorithm_matrix[i * n + j]).rjust(4), end= ' ')
+            print ()
 
-        for i in range(1, m):
+    def print_movement_map(self, m, n):
+        for i in range(m):
+            print (' '.join(str(self.movement_map[i * n + j]) for j in range(n)))
+
+    def fill_algorithm_matrix(self, m, n):
+        # fills the rows from the first one, or in incremental mode from the first one not kept
+        first_row = max(1, self.reusable_rows) if self.incremental else 1
+        self.best_cells = []
+        self.start_phase('fill')
+        if self.engine == 'numpy':
+            self.fill_algorithm_matrix_numpy(m, n, first_row)
+        else:
+            self.fill_algorithm_matrix_python(m, n, first_row)
+        self.end_phase('fill')
+        self.count('cells', (m - first_row) * (n - 1))
+
+        if self.incremental:
+            self.update_row_maxima(first_row, m, n)
+            self.reusable_rows = m
+
+    def update_row_maxima(self, first_row, m, n):
+        # the best score of local alignment in the whole matrix, from the maxima of the
+        # kept rows and of the rows filled again
+        del self.row_maxima[first_row:]
+        if self.alignment_type != 'local':
+            return
+        if self.engine == 'numpy' and m > first_row and n > 1:
+            rows = np.frombuffer(self.algorithm_matrix, dtype=np.int64).reshape(m, n)[first_row:, 1:]
+            self.row_maxima.extend(rows.max(axis=1).tolist())
+        else:
+            self.row_maxima.extend(max(self.algorithm_matrix[i * n + 1:(i + 1) * n]) if n > 1 else 0 for i in range(first_row, m))
+        self.best_score = max(self.row_maxima)
+        self.best_rows = [i for i in range(1, m) if self.row_maxima[i] == self.best_score] if self.best_score > 0 else []
+        self.best_diagonals = []
+
+    def realign(self, sequence2):
+        # aligns sequence1 with a new sequence2, returning what align() returns. row i of
+        # the matrix depends only on sequence2[:i], so the rows of the common prefix of the
+        # old and the new sequence2 are kept and only the rows after it are filled again:
+        # appending to sequence2 or editing it near its end costs in proportion to the
+        # changed part. the sequence that changes should be given as sequence2.
+        if not self.incremental:
+            raise ValueError("realign can only be used in incremental mode!")
+        common_length = len(os.path.commonprefix([self.sequence2, sequence2]))
+        self.encoded_sequence2 = self.encoded_sequence2[:common_length] + self.scoring_matrix.encode_column_sequence(
+            sequence2[common_length:], self.sequence_names[1])
+        self.sequence2 = sequence2
+        self.sequence2_length = len(sequence2)
+        self.sequence2_profile = None
+        self.reusable_rows = min(self.reusable_rows, common_length + 1)
+        return self.align()
+
+    def fill_algorithm_matrix_python(self, m, n, first_row = 1):
+        # the reference implementation: fills the matrix one cell at a time.
+        local = self.alignment_type == 'local'
+        matrix = self.algorithm_matrix
+        movement_map = self.movement_map
+        profile = self.get_sequence1_profile()
+        self.best_score = 0
+        self.best_rows = []
+
+        for i in range(first_row, m):
+            if local and i > first_row and n > 1:
+                self.update_best_rows(i - 1, n)
+            scores_of_aminoacid_from_sequence2 = profile[self.encoded_sequence2[i - 1]]
             for j in range(1, n):
-                aminoacid_from_sequence1 = self.sequence1[j - 1]
-                aminoacid_from_sequence2 = self.sequence2[i - 1]
+                cell = i * n + j
 
-                if (i - 1, j) in movement_map and movement_map[(i - 1, j)] == -1:
+                if movement_map[cell - n] == self.VERTICAL_MOVEMENT:
                     vertical_score = self.gap_extension_penalty
                 else:
                     vertical_score = self.gap_opening_penalty
-                
-                if (i, j - 1) in movement_map and movement_map[(i, j - 1)] == 1:
+
+                if movement_map[cell - 1] == self.HORIZONTAL_MOVEMENT:
                     horizontal_score = self.gap_extension_penalty
                 else:
                     horizontal_score = self.gap_opening_penalty
-                
-                diagonal_score = self.scoring_matrix.get_score_of_pair(aminoacid_from_sequence1, aminoacid_from_sequence2)
 
-                vertical_movement_consequence = self.algorithm_matrix[i - 1][j] + vertical_score
-                diagonal_movement_consequence = self.algorithm_matrix[i - 1][j - 1] + diagonal_score
-                horizontal_movement_consequence = self.algorithm_matrix[i][j - 1] + horizontal_score
+                diagonal_score = scores_of_aminoacid_from_sequence2[j - 1]
+
+                vertical_movement_consequence = matrix[cell - n] + vertical_score
+                diagonal_movement_consequence = matrix[cell - n - 1] + diagonal_score
+                horizontal_movement_consequence = matrix[cell - 1] + horizontal_score
 
                 maximum = max(vertical_movement_consequence, diagonal_movement_consequence, horizontal_movement_consequence)
 
-                if maximum < 0:
-                    self.algorithm_matrix[i][j] = 0
-                    movement_map[(i, j)] = 2
+                if local and maximum < 0:
+                    matrix[cell] = 0
+                    movement_map[cell] = self.NO_MOVEMENT
                 else:
-                    self.algorithm_matrix[i][j] = maximum
+                    matrix[cell] = maximum
                     if maximum == diagonal_movement_consequence:
-                        movement_map[(i, j)] = 0
+                        movement_map[cell] = self.DIAGONAL_MOVEMENT
                     elif maximum == vertical_movement_consequence:
-                        movement_map[(i, j)] = -1
+                        movement_map[cell] = self.VERTICAL_MOVEMENT
                     else:
-                        movement_map[(i, j)] = 1
-                    
+                        movement_map[cell] = self.HORIZONTAL_MOVEMENT
+
+        if local and m > first_row and n > 1:
+            self.update_best_rows(m - 1, n)
+
+    def update_best_rows(self, i, n):
+        # the maximum of a filled row, taken at C speed, instead of scanning the whole matrix afterwards
+        row_maximum = max(self.algorithm_matrix[i * n + 1:(i + 1) * n])
+        if row_maximum > self.best_score:
+            self.best_score = row_maximum
+            self.best_rows = [i]
+        elif row_maximum == self.best_score and row_maximum > 0:
+            self.best_rows.append(i)
+
+    def fill_algorithm_matrix_numpy(self, m, n, first_row = 1):
+        # fills the matrix one anti-diagonal at a time. every cell on an
+        # anti-diagonal depends only on the two previous anti-diagonals
+        # (including the movements chosen there), so each of them can be
+        # computed as a single vector operation.
+        scores, codes1, codes2 = self.get_numpy_scores_and_codes()
+
+        # views sharing the memory of the typed arrays
+        matrix = np.frombuffer(self.algorithm_matrix, dtype=np.int64)
+        movements = np.frombuffer(self.movement_map, dtype=np.uint8)
+        self.best_score = 0
+        self.best_diagonals = []
+
+        # a spilled matrix is filled in strips of rows, one anti-diagonal of a strip at a
+        # time, so that the pages written stay sequential instead of spanning all the rows
+        strip_height = m
+        if self.spill_file is not None:
+            strip_height = self.MINIMUM_STRIP_HEIGHT
+            if self.memory_budget is not None:
+                strip_height = max(strip_height, self.memory_budget // (4 * self.CELL_SIZE * n))
+
+        for strip_row in range(first_row, m, strip_height):
+            last_row = min(m - 1, strip_row + strip_height - 1)
+            self.fill_strip_numpy(strip_row, last_row, n, matrix, movements, scores, codes1, codes2)
+
+    def fill_strip_numpy(self, first_row, last_row, n, matrix, movements, scores, codes1, codes2):
+        # fills rows first_row to last_row, one anti-diagonal at a time
+        local = self.alignment_type == 'local'
+        for d in range(first_row + 1, last_row + n):
+            i = np.arange(max(first_row, d - n + 1), min(last_row, d - 1) + 1)
+            j = d - i
+            cells = i * n + j
+            upper_cells = cells - n
+            left_cells = cells - 1
+
+            vertical_score = np.where(movements[upper_cells] == self.VERTICAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty)
+            horizontal_score = np.where(movements[left_cells] == self.HORIZONTAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty)
+            diagonal_score = scores[codes1[j - 1], codes2[i - 1]]
+
+            vertical_movement_consequence = matrix[upper_cells] + vertical_score
+            diagonal_movement_consequence = matrix[upper_cells - 1] + diagonal_score
+            horizontal_movement_consequence = matrix[left_cells] + horizontal_score
+
+            maximum = np.maximum(np.maximum(vertical_movement_consequence, diagonal_movement_consequence), horizontal_movement_consequence)
+            movement = np.where(maximum == diagonal_movement_consequence, self.DIAGONAL_MOVEMENT,
+                                np.where(maximum == vertical_movement_consequence, self.VERTICAL_MOVEMENT, self.HORIZONTAL_MOVEMENT))
+
+            if local:
+                clipped = maximum < 0
+                maximum[clipped] = 0
+                movement[clipped] = self.NO_MOVEMENT
+
+            matrix[cells] = maximum
+            movements[cells] = movement
+
+            if local:
+                diagonal_maximum = int(maximum.max(initial=0))
+                if diagonal_maximum > self.best_score:
+                    self.best_score = diagonal_maximum
+                    self.best_diagonals = [d]
+                elif diagonal_maximum == self.best_score and diagonal_maximum > 0:
+                    self.best_diagonals.append(d)
+
+    def create_and_fill_matrices(self):
+        # the scores are needed after the fill only to fill rows again in incremental mode,
+        # or to print them when debugging. otherwise only the movements are kept.
+        if self.incremental or self.DEBUG:
+            m, n = self.create_algorithm_matrix()
+            self.fill_algorithm_matrix(m, n)
+        else:
+            m, n = self.create_movement_map()
+            self.fill_movement_map(m, n)
+        return m, n
+
+    def create_movement_map(self):
+        # the movement map alone, 1 byte per cell, leaving the matrix of the scores empty
+        self.start_phase('matrix creation')
+        m = self.sequence2_length + 1 # number of rows
+        n = self.sequence1_length + 1 # number of columns
+        self.reusable_rows = 0
+        self.allocate_algorithm_matrix(m * n, keep_scores = False)
+        self.end_phase('matrix creation')
+
+        return m, n
+
+    def fill_movement_map(self, m, n):
+        # fills the movement map with the same recurrence as fill_algorithm_matrix, keeping
+        # the scores of two rows or anti-diagonals only. the traceback cannot look at the
+        # scores then, so in local alignment the cells with a score of 0 are given
+        # NO_MOVEMENT in the map, while the fill goes on with their movements for the gaps
+        # of their neighbours. the best cells are collected during the fill.
+        self.best_score = 0
+        self.best_rows = []
+        self.best_diagonals = []
+        self.best_cells = []
+        self.start_phase('fill')
+        if self.engine == 'numpy':
+            self.fill_movement_map_numpy(m, n)
+        else:
+            self.fill_movement_map_python(m, n)
+        self.end_phase('fill')
+        self.count('cells', (m - 1) * (n - 1))
+
+    def fill_movement_map_python(self, m, n):
+        # fills the movement map one cell at a time, row by row
+        local = self.alignment_type == 'local'
+        movement_map = self.movement_map
+        profile = self.get_sequence1_profile()
+
+        previous_scores = array('q', [0]) * n
+        previous_movements = bytearray([self.NO_MOVEMENT]) * n
+        current_scores = array('q', [0]) * n
+        current_movements = bytearray([self.NO_MOVEMENT]) * n
+        if not local:
+            for j in range(1, n):
+                previous_scores[j] = self.gap_opening_penalty + (j - 1) * self.gap_extension_penalty
+
+        for i in range(1, m):
+            if not local:
+                current_scores[0] = self.gap_opening_penalty + (i - 1) * self.gap_extension_penalty
+            scores_of_aminoacid_from_sequence2 = profile[self.encoded_sequence2[i - 1]]
+            row = i * n
+            for j in range(1, n):
+                if previous_movements[j] == self.VERTICAL_MOVEMENT:
+                    vertical_score = self.gap_extension_penalty
+                else:
+                    vertical_score = self.gap_opening_penalty
+
+                if current_movements[j - 1] == self.HORIZONTAL_MOVEMENT:
+                    horizontal_score = self.gap_extension_penalty
+                else:
+                    horizontal_score = self.gap_opening_penalty
+
+                vertical_movement_consequence = previous_scores[j] + vertical_score
+                diagonal_movement_consequence = previous_scores[j - 1] + scores_of_aminoacid_from_sequence2[j - 1]
+                horizontal_movement_consequence = current_scores[j - 1] + horizontal_score
+
+                maximum = max(vertical_movement_consequence, diagonal_movement_consequence, horizontal_movement_consequence)
+
+                if local and maximum < 0:
+                    current_scores[j] = 0
+                    current_movements[j] = self.NO_MOVEMENT
+                    movement_map[row + j] = self.NO_MOVEMENT
+                    continue
+
+                if maximum == diagonal_movement_consequence:
+                    movement = self.DIAGONAL_MOVEMENT
+                elif maximum == vertical_movement_consequence:
+                    movement = self.VERTICAL_MOVEMENT
+                else:
+                    movement = self.HORIZONTAL_MOVEMENT
+                current_scores[j] = maximum
+                current_movements[j] = movement
+                movement_map[row + j] = self.NO_MOVEMENT if local and maximum == 0 else movement
+
+            if local and n > 1:
+                row_maximum = max(current_scores[1:])
+                if row_maximum > self.best_score:
+                    self.best_score = row_maximum
+                    self.best_cells = []
+                if row_maximum == self.best_score and row_maximum > 0:
+                    self.best_cells.extend(row + j for j in range(1, n) if current_scores[j] == row_maximum)
+
+            previous_scores, current_scores = current_scores, previous_scores
+            previous_movements, current_movements = current_movements, previous_movements
+
+    def fill_movement_map_numpy(self, m, n):
+        # fills the movement map one anti-diagonal at a time, in strips of rows if it is
+        # spilled, keeping the scores and movements of the last row of a strip for the next one
+        scores, codes1, codes2 = self.get_numpy_scores_and_codes()
+        movements = np.frombuffer(self.movement_map, dtype=np.uint8)
+
+        top_scores = np.zeros(n, dtype=np.int64)
+        top_movements = np.full(n, self.NO_MOVEMENT, dtype=np.uint8)
+        if self.alignment_type == 'global' and n > 1:
+            top_scores[1:] = self.gap_opening_penalty + np.arange(n - 1) * self.gap_extension_penalty
+
+        strip_height = m
+        if self.spill_file is not None:
+            strip_height = self.MINIMUM_STRIP_HEIGHT
+            if self.memory_budget is not None:
+                strip_height = max(strip_height, self.memory_budget // (4 * self.MOVEMENT_SIZE * n))
+
+        for strip_row in range(1, m, strip_height):
+            last_row = min(m - 1, strip_row + strip_height - 1)
+            top_scores, top_movements = self.fill_movement_strip_numpy(strip_row, last_row, n, top_scores, top_movements,
+                                                                       movements, scores, codes1, codes2)
+
+        if self.best_cells:
+            self.best_cells = np.sort(np.concatenate(self.best_cells)).tolist()
+
+    def fill_movement_strip_numpy(self, first_row, last_row, n, top_scores, top_movements, movements, scores, codes1, codes2):
+        # fills the movements of rows first_row to last_row like calculate_score_numpy, the
+        # row above them taking the place of the first row. the anti-diagonal d holds the
+        # cells (first_row - 1 + k, d - k) for k = low, ..., high. returns the scores and
+        # movements of last_row.
+        local = self.alignment_type == 'local'
+        height = last_row - first_row + 1
+        bottom_scores = np.zeros(n, dtype=np.int64)
+        bottom_movements = np.full(n, self.NO_MOVEMENT, dtype=np.uint8)
+        previous_low = second_previous_low = 0
+        previous_scores = previous_movements = second_previous_scores = None
+
+        for d in range(height + n):
+            low = max(0, d - n + 1)
+            high = min(height, d)
+            k = np.arange(low, high + 1)
+            j = d - k
+
+            diagonal_scores = np.zeros(len(k), dtype=np.int64)
+            diagonal_movements = np.full(len(k), self.NO_MOVEMENT, dtype=np.uint8)
+
+            start = 0
+            stop = len(k)
+            if low == 0: # the cell on the row above the strip
+                diagonal_scores[0] = top_scores[d]
+                diagonal_movements[0] = top_movements[d]
+                start = 1
+            if high == d and d > 0: # the cell on the first column
+                if not local:
+                    diagonal_scores[-1] = self.gap_opening_penalty + (first_row + d - 2) * self.gap_extension_penalty
+                stop -= 1
+
+            if start < stop:
+                inner_k = k[start:stop]
+                inner_i = inner_k + first_row - 1
+                inner_j = j[start:stop]
+                upper_cells = inner_k - 1 - previous_low
+                left_cells = inner_k - previous_low
+                upper_left_cells = inner_k - 1 - second_previous_low
+
+                vertical_score = np.where(previous_movements[upper_cells] == self.VERTICAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty)
+                horizontal_score = np.where(previous_movements[left_cells] == self.HORIZONTAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty)
+                diagonal_score = scores[codes1[inner_j - 1], codes2[inner_i - 1]]
+
+                vertical_movement_consequence = previous_scores[upper_cells] + vertical_score
+                diagonal_movement_consequence = second_previous_scores[upper_left_cells] + diagonal_score
+                horizontal_movement_consequence = previous_scores[left_cells] + horizontal_score
+
+                maximum = np.maximum(np.maximum(vertical_movement_consequence, diagonal_movement_consequence), horizontal_movement_consequence)
+                movement = np.where(maximum == diagonal_movement_consequence, self.DIAGONAL_MOVEMENT,
+                                    np.where(maximum == vertical_movement_consequence, self.VERTICAL_MOVEMENT, self.HORIZONTAL_MOVEMENT))
+
+                cells = inner_i * n + inner_j
+                if local:
+                    clipped = maximum < 0
+                    maximum[clipped] = 0
+                    movement[clipped] = self.NO_MOVEMENT
+                    movements[cells] = np.where(maximum > 0, movement, self.NO_MOVEMENT)
+
+                    diagonal_maximum = int(maximum.max())
+                    if diagonal_maximum > self.best_score:
+                        self.best_score = diagonal_maximum
+                        self.best_cells = []
+                    if diagonal_maximum == self.best_score and diagonal_maximum > 0:
+                        self.best_cells.append(cells[maximum == diagonal_maximum])
+                else:
+                    movements[cells] = movement
+
+                diagonal_scores[start:stop] = maximum
+                diagonal_movements[start:stop] = movement
+
+            if high == height: # the cell on the last row
+                bottom_scores[d - height] = diagonal_scores[-1]
+                bottom_movements[d - height] = diagonal_movements[-1]
+
+            second_previous_low, second_previous_scores = previous_low, previous_scores
+            previous_low, previous_scores, previous_movements = low, diagonal_scores, diagonal_movements
+
+        return bottom_scores, bottom_movements
+
+    def local_alignment(self):
+        m, n = self.create_and_fill_matrices()
+
         if self.DEBUG:
-            for i in range(m):
-                for j in range(n):
-                    print (str(self.algorithm_matrix[i][j]).rjust(4), end= ' ')
-                print ()
+            self.print_algorithm_matrix(m, n)
+            self.print_movement_map(m, n)
 
-        # go from the bottom to the top: compose the alignment
-        top_line = "" # aligned sequence1
-        bottom_line = "" # aligned sequence2
+        self.start_phase('traceback')
+        results = list(itertools.islice(self.generate_local_alignments(m, n), self.max_alignments))
+        self.end_phase('traceback')
+        self.count('co-optimal local alignments', len(results))
+
+        return results
+
+    def generate_local_alignments(self, m, n):
+        # yields the co-optimal local alignments one by one, ending at the cells with
+        # the best score in row major order. the cells are found only when needed and
+        # each alignment is traced back only when asked for, so that taking the first
+        # few of them is cheap even if the best score occurs in many cells.
+        for i, j in self.find_max_locations_in_the_matrix(m, n):
+            path, i, j = self.trace_back(i, j, n)
+            yield self.create_result(path, i, j)
+
+    def find_max_locations_in_the_matrix(self, m, n):
+        # yields the cells with the best score, which is tracked during the fill
+        # together with the rows or anti-diagonals it occurs on (an anti-diagonal
+        # more than once if filled in strips). there are no locations if no pair
+        # of residues has a positive score.
+        if self.best_score <= 0:
+            return
 
-        max_locations = self.find_max_locations_in_the_matrix(self.algorithm_matrix)
         if self.DEBUG:
-            print (max_locations)
+            print (self.best_score, self.best_rows or self.best_diagonals)
+
+        if self.best_cells:
+            for cell in self.best_cells:
+                yield cell // n, cell % n
+            return
+
+        matrix = self.algorithm_matrix
+        if self.best_diagonals:
+            matrix = np.frombuffer(matrix, dtype=np.int64)
+            locations = []
+            for d in set(self.best_diagonals):
+                i = np.arange(max(1, d - n + 1), min(m - 1, d - 1) + 1)
+                cells = i * n + d - i
+                locations.append(cells[matrix[cells] == self.best_score])
+            for cell in np.sort(np.concatenate(locations)):
+                yield int(cell) // n, int(cell) % n
+            return
+
+        for i in self.best_rows:
+            for j in range(1, n):
+                if matrix[i * n + j] == self.best_score:
+                    yield i, j
+
+    def trace_back(self, i, j, n):
+        # follows the movements from cell (i, j) until the first row or column, or in
+        # local alignment until a cell with a score of 0, or with NO_MOVEMENT when only
+        # the movements are kept. the movements are collected backwards and reversed
+        # once, in linear time in the length of the alignment. returns the path and the
+        # cell where it stopped.
+        scores_kept = self.alignment_type == 'local' and len(self.algorithm_matrix) > 0
+        matrix = self.algorithm_matrix
+        movement_map = self.movement_map
+        path = bytearray()
 
+        while i > 0 and j > 0:
+            cell = i * n + j
+            movement = movement_map[cell]
+            if movement == self.NO_MOVEMENT or (scores_kept and matrix[cell] <= 0):
+                break
+
+            path.append(movement)
+            if movement == self.DIAGONAL_MOVEMENT:
+                i -= 1
+                j -= 1
+            elif movement == self.VERTICAL_MOVEMENT:
+                i -= 1
+            else:
+                j -= 1
+
+        path.reverse()
+        return path, i, j
+
+    def get_leading_gaps(self, i, j):
+        # the start of the path of a global alignment stopped at cell (i, j): the rest of
+        # the sequence that has not run out is aligned with gaps
+        return bytes([self.VERTICAL_MOVEMENT]) * i + bytes([self.HORIZONTAL_MOVEMENT]) * j
+
+    def tiled_alignment(self):
+        # the alignments of global_alignment or local_alignment, computed in parallel tiles
+        return TiledAlignment(self, self.tile_size, self.tile_workers).align()
+
+    def top_local_alignments(self):
+        # the method of Waterman and Eggert: finds the best local alignment, removes
+        # the cells it passes through from the matrix and finds the best one in what
+        # remains, until top_alignments alignments are found or no cell has a positive
+        # score. so the alignments never share a cell, i.e. a pair of aligned residues
+        # or a gap at the same place. after removing an alignment, only the cells whose
+        # scores or movements change are computed again.
+        m, n = self.create_algorithm_matrix()
+        self.fill_algorithm_matrix(m, n)
+
+        matrix = self.algorithm_matrix
+        blocked = bytearray(m * n) # the cells of the alignments found so far
+        row_maxima = [0] + [max(matrix[i * n + 1:(i + 1) * n]) if n > 1 else 0 for i in range(1, m)]
 
         results = []
-        for max_location in max_locations:
-            i, j = max_location
-
-            while self.algorithm_matrix[i][j] > 0 and i > 0 and j > 0:
-                movement = movement_map[(i, j)]
-                if movement == 0:
-                    top_line = self.sequence1[j - 1] + top_line
-                    bottom_line = self.sequence2[i - 1] + bottom_line
-                    i -= 1
-                    j -= 1
-                elif movement == -1:
-                    top_line = "-" + top_line
-                    bottom_line = self.sequence2[i - 1] + bottom_line
-                    i -= 1
-                elif movement == 1:
-                    top_line = self.sequence1[j - 1] + top_line
-                    bottom_line = "-" + bottom_line
-                    j -= 1
+        while len(results) < self.top_alignments:
+            best_score = max(row_maxima)
+            if best_score <= 0:
+                break
 
-            if self.DEBUG:
-                print(movement_map)
+            self.start_phase('traceback')
+            end_i = row_maxima.index(best_score)
+            end_j = matrix[end_i * n:(end_i + 1) * n].tolist().index(best_score, 1)
+            path, start_i, start_j = self.trace_back(end_i, end_j, n)
+            results.append(self.create_result(path, start_i, start_j))
+            self.end_phase('traceback')
 
-            results.append((top_line, bottom_line))
+            self.start_phase('recomputation')
+            cells = self.get_alignment_cells(path, end_i, end_j)
+            self.remove_alignment(cells, blocked, row_maxima, m, n)
+            self.end_phase('recomputation')
 
         return results
-    
-    def find_max_locations_in_the_matrix(self, matrix):
-        # matrix is a m x n matrix.
-        m = len(matrix)
-        n = len(matrix[0])
 
-        max_val = matrix[0][0]
+    def get_alignment_cells(self, path, i, j):
+        # returns the cells passed through by an alignment with the given path ending at cell
+        # (i, j), by rows: a dictionary mapping each row to the first and last column in it
+        cells = {}
+        for movement in reversed(path):
+            first_column, last_column = cells.get(i, (j, j))
+            cells[i] = (min(first_column, j), max(last_column, j))
+            if movement != self.VERTICAL_MOVEMENT:
+                j -= 1
+            if movement != self.HORIZONTAL_MOVEMENT:
+                i -= 1
+        return cells
+
+    def remove_alignment(self, cells, blocked, row_maxima, m, n):
+        # sets the cells of the alignment (by rows, as get_alignment_cells returns them) to 0 and computes again the cells depending on them.
+        # a cell depends on the cell above, on the left and on the upper left one, so the
+        # cells that may change in a row are those below and below on the right of the
+        # changed cells of the previous row, those of the path, and those following a changed
+        # cell on the left. the rows are computed from the first row of the path until none
+        # of these cells changes.
+        matrix = self.algorithm_matrix
+        movement_map = self.movement_map
+        profile = self.get_sequence1_profile()
+        first_changed_column = None # in the previous row
+        last_changed_column = None
+        recomputed_cells = 0
+
+        for i in range(min(cells), m):
+            path_columns = cells.get(i)
+            if path_columns is not None:
+                for j in range(path_columns[0], path_columns[1] + 1):
+                    blocked[i * n + j] = 1
+                if first_changed_column is None:
+                    first_column, last_column = path_columns
+                else:
+                    first_column = min(first_changed_column, path_columns[0])
+                    last_column = max(last_changed_column + 1, path_columns[1])
+            elif first_changed_column is not None:
+                first_column, last_column = first_changed_column, last_changed_column + 1
+            else:
+                break
 
-        for i in range(m):
-            for j in range(n):
-                if matrix[i][j] > max_val:
-                    max_val = matrix[i][j]
+            scores_of_aminoacid_from_sequence2 = profile[self.encoded_sequence2[i - 1]]
+            first_changed_column = None
+            left_changed = False
+            j = first_column
+            while j < n and (j <= last_column or left_changed):
+                cell = i * n + j
+                if blocked[cell]:
+                    maximum = 0
+                    movement = self.NO_MOVEMENT
+                else:
+                    if movement_map[cell - n] == self.VERTICAL_MOVEMENT:
+                        vertical_movement_consequence = matrix[cell - n] + self.gap_extension_penalty
+                    else:
+                        vertical_movement_consequence = matrix[cell - n] + self.gap_opening_penalty
 
-        max_locations = []
+                    if movement_map[cell - 1] == self.HORIZONTAL_MOVEMENT:
+                        horizontal_movement_consequence = matrix[cell - 1] + self.gap_extension_penalty
+                    else:
+                        horizontal_movement_consequence = matrix[cell - 1] + self.gap_opening_penalty
 
-        for i in range(m):
-            for j in range(n):
-                if matrix[i][j] == max_val:
-                    max_locations.append((i, j))
+                    diagonal_movement_consequence = matrix[cell - n - 1] + scores_of_aminoacid_from_sequence2[j - 1]
+
+                    maximum = max(vertical_movement_consequence, diagonal_movement_consequence, horizontal_movement_consequence)
+                    if maximum < 0:
+                        maximum = 0
+                        movement = self.NO_MOVEMENT
+                    elif maximum == diagonal_movement_consequence:
+                        movement = self.DIAGONAL_MOVEMENT
+                    elif maximum == vertical_movement_consequence:
+                        movement = self.VERTICAL_MOVEMENT
+                    else:
+                        movement = self.HORIZONTAL_MOVEMENT
+
+                recomputed_cells += 1
+                left_changed = maximum != matrix[cell] or movement != movement_map[cell]
+                if left_changed:
+                    matrix[cell] = maximum
+                    movement_map[cell] = movement
+                    if first_changed_column is None:
+                        first_changed_column = j
+                    last_changed_column = j
+                j += 1
+
+            if first_changed_column is not None:
+                row_maxima[i] = max(matrix[i * n + 1:(i + 1) * n])
 
-        return max_locations
+        self.count('recomputed cells', recomputed_cells)
 
     def global_alignment(self):
-        # -1: gap in sequence1 (vertical movement)
-        #  0: diagonal movement
-        #  1: gap in sequence2 (horizontal movement)
+        m, n = self.create_and_fill_matrices()
 
-        movement_map = {}
+        if self.DEBUG:
+            self.print_movement_map(m, n)
+
+        # go from the bottom to the top: compose the alignment
+        self.start_phase('traceback')
+        path, i, j = self.trace_back(m - 1, n - 1, n)
+        result = self.create_result(self.get_leading_gaps(i, j) + path, 0, 0)
+        self.end_phase('traceback')
+
+        if self.DEBUG:
+            self.print_algorithm_matrix(m, n)
+
+        return [result]
+
+    def get_band(self):
+        # returns the lowest and the highest diagonal (j - i) of the band. the band
+        # contains the diagonals between the first and the last cell of the matrix,
+        # and band_width more diagonals on both sides.
+        length_difference = self.sequence1_length - self.sequence2_length
+        band_width = self.band_width
+        if band_width == 'auto':
+            band_width = max(self.MINIMUM_BAND_WIDTH, abs(length_difference))
+
+        lowest = max(min(0, length_difference) - band_width, -self.sequence2_length)
+        highest = min(max(0, length_difference) + band_width, self.sequence1_length)
+        return lowest, highest
+
+    def create_banded_algorithm_matrix(self, lowest, highest):
+        # only the cells of the band are stored, row by row: cell (i, j) is at
+        # i * width + (j - i - lowest), where width is the number of diagonals in the band.
+        m = self.sequence2_length + 1 # number of rows
+        width = highest - lowest + 1
+
+        self.allocate_algorithm_matrix(m * width)
+
+        if self.alignment_type == 'global':
+            for j in range(1, highest + 1):
+                self.algorithm_matrix[j - lowest] = self.gap_opening_penalty + (j - 1) * self.gap_extension_penalty
+            for i in range(1, -lowest + 1):
+                self.algorithm_matrix[i * width - i - lowest] = self.gap_opening_penalty + (i - 1) * self.gap_extension_penalty
+
+        return m, width
+
+    def fill_banded_algorithm_matrix(self, lowest, highest, m, width):
+        local = self.alignment_type == 'local'
+        matrix = self.algorithm_matrix
+        movement_map = self.movement_map
+        minus_infinity = float('-inf')
+        profile = self.get_sequence1_profile()
 
-        m, n = self.create_algorithm_matrix()
-        # fill algorithm matrix
         for i in range(1, m):
-            for j in range(1, n):
-                aminoacid_from_sequence1 = self.sequence1[j - 1]
-                aminoacid_from_sequence2 = self.sequence2[i - 1]
-                if (i - 1, j) in movement_map and movement_map[(i - 1, j)] == -1:
-                    vertical_score = self.gap_extension_penalty
+            scores_of_aminoacid_from_sequence2 = profile[self.encoded_sequence2[i - 1]]
+            for j in range(max(1, i + lowest), min(self.sequence1_length, i + highest) + 1):
+                cell = i * width + j - i - lowest
+
+                # the cell above is outside the band on its highest diagonal,
+                # and the cell on the left on its lowest diagonal
+                if j - i == highest:
+                    vertical_movement_consequence = minus_infinity
+                elif movement_map[cell - width + 1] == self.VERTICAL_MOVEMENT:
+                    vertical_movement_consequence = matrix[cell - width + 1] + self.gap_extension_penalty
                 else:
-                    vertical_score = self.gap_opening_penalty
+                    vertical_movement_consequence = matrix[cell - width + 1] + self.gap_opening_penalty
 
-                diagonal_score = self.scoring_matrix.get_score_of_pair(aminoacid_from_sequence1, aminoacid_from_sequence2)
-
-                if (i, j - 1) in movement_map and movement_map[(i, j - 1)] == 1:
-                    horizontal_score = self.gap_extension_penalty
+                if j - i == lowest:
+                    horizontal_movement_consequence = minus_infinity
+                elif movement_map[cell - 1] == self.HORIZONTAL_MOVEMENT:
+                    horizontal_movement_consequence = matrix[cell - 1] + self.gap_extension_penalty
                 else:
-                    horizontal_score = self.gap_opening_penalty
+                    horizontal_movement_consequence = matrix[cell - 1] + self.gap_opening_penalty
 
-                vertical_movement_consequence = self.algorithm_matrix[i - 1][j] + vertical_score
-                diagonal_movement_consequence = self.algorithm_matrix[i - 1][j - 1] + diagonal_score
-                horizontal_movement_consequence = self.algorithm_matrix[i][j - 1] + horizontal_score
+                diagonal_movement_consequence = matrix[cell - width] + scores_of_aminoacid_from_sequence2[j - 1]
 
                 maximum = max(vertical_movement_consequence, diagonal_movement_consequence, horizontal_movement_consequence)
-                self.algorithm_matrix[i][j] = maximum
+
+                if local and maximum < 0:
+                    matrix[cell] = 0
+                    movement_map[cell] = self.NO_MOVEMENT
+                else:
+                    matrix[cell] = maximum
+                    if maximum == diagonal_movement_consequence:
+                        movement_map[cell] = self.DIAGONAL_MOVEMENT
+                    elif maximum == vertical_movement_consequence:
+                        movement_map[cell] = self.VERTICAL_MOVEMENT
+                    else:
+                        movement_map[cell] = self.HORIZONTAL_MOVEMENT
+
+    def fill_banded_algorithm_matrix_numpy(self, lowest, highest, m, width):
+        # fills the band one anti-diagonal at a time, as fill_strip_numpy fills the matrix
+        local = self.alignment_type == 'local'
+        scores, codes1, codes2 = self.get_numpy_scores_and_codes()
+        matrix = np.frombuffer(self.algorithm_matrix, dtype=np.int64)
+        movements = np.frombuffer(self.movement_map, dtype=np.uint8)
+        minus_infinity = np.iinfo(np.int64).min // 4
+
+        for d in range(2, m + self.sequence1_length):
+            # the cells (i, d - i) with 1 <= i < m, 1 <= d - i <= sequence1_length and lowest <= d - 2i <= highest
+            i = np.arange(max(1, d - self.sequence1_length, -((highest - d) // 2)), min(m - 1, d - 1, (d - lowest) // 2) + 1)
+            if len(i) == 0:
+                continue
+            j = d - i
+            cells = i * width + j - i - lowest
+            upper_cells = cells - width + 1
+            left_cells = cells - 1
+
+            # the cell above is outside the band on its highest diagonal,
+            # and the cell on the left on its lowest diagonal
+            vertical_movement_consequence = np.where(j - i == highest, minus_infinity, matrix[upper_cells] +
+                np.where(movements[upper_cells] == self.VERTICAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty))
+            horizontal_movement_consequence = np.where(j - i == lowest, minus_infinity, matrix[left_cells] +
+                np.where(movements[left_cells] == self.HORIZONTAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty))
+            diagonal_movement_consequence = matrix[cells - width] + scores[codes1[j - 1], codes2[i - 1]]
+
+            maximum = np.maximum(np.maximum(vertical_movement_consequence, diagonal_movement_consequence), horizontal_movement_consequence)
+            movement = np.where(maximum == diagonal_movement_consequence, self.DIAGONAL_MOVEMENT,
+                                np.where(maximum == vertical_movement_consequence, self.VERTICAL_MOVEMENT, self.HORIZONTAL_MOVEMENT))
+
+            if local:
+                clipped = maximum < 0
+                maximum[clipped] = 0
+                movement[clipped] = self.NO_MOVEMENT
+
+            matrix[cells] = maximum
+            movements[cells] = movement
+
+    def find_banded_max_locations(self, lowest, highest, m, width):
+        # the cells of the band with the best score of local alignment, in row major order.
+        # the positions of a row outside the band are left at 0.
+        if self.engine == 'numpy':
+            matrix = np.frombuffer(self.algorithm_matrix, dtype=np.int64)
+            max_val = int(matrix.max(initial=0))
+            if max_val <= 0:
+                return []
+            return [(int(cell) // width, int(cell) % width + int(cell) // width + lowest) for cell in np.flatnonzero(matrix == max_val)]
+
+        max_val = 0
+        end_locations = []
+        for i in range(m):
+            for j in range(max(0, i + lowest), min(self.sequence1_length, i + highest) + 1):
+                value = self.algorithm_matrix[i * width + j - i - lowest]
+                if value > max_val:
+                    max_val = value
+                    end_locations = [(i, j)]
+                elif value == max_val and value > 0:
+                    end_locations.append((i, j))
+        return end_locations
+
+    def banded_alignment(self):
+        # fills only the cells near the diagonal between the first and the last cell of the matrix.
+        # sets band_edge_reached if the alignment passes through the edge of the band, in which
+        # case a better alignment may exist outside of it.
+        lowest, highest = self.get_band()
+        self.start_phase('matrix creation')
+        m, width = self.create_banded_algorithm_matrix(lowest, highest)
+        self.end_phase('matrix creation')
+
+        self.start_phase('fill')
+        if self.engine == 'numpy':
+            self.fill_banded_algorithm_matrix_numpy(lowest, highest, m, width)
+        else:
+            self.fill_banded_algorithm_matrix(lowest, highest, m, width)
+        self.end_phase('fill')
+        if self.statistics is not None:
+            self.count('cells', sum(min(self.sequence1_length, i + highest) - max(1, i + lowest) + 1 for i in range(1, m)))
+
+        self.start_phase('find maximum')
+
+        if self.alignment_type == 'global':
+            end_locations = [(self.sequence2_length, self.sequence1_length)]
+        else:
+            end_locations = self.find_banded_max_locations(lowest, highest, m, width)
+
+        self.end_phase('find maximum')
+        if self.alignment_type == 'local':
+            end_locations = end_locations[:self.max_alignments]
+            self.count('co-optimal local alignments', len(end_locations))
+
+        self.start_phase('traceback')
+        lowest_edge = lowest if lowest > -self.sequence2_length else None
+        highest_edge = highest if highest < self.sequence1_length else None
+        self.band_edge_reached = False
+
+        results = []
+        for i, j in end_locations:
+            path = bytearray() # backwards
+
+            while i > 0 and j > 0:
+                cell = i * width + j - i - lowest
+                if self.alignment_type == 'local' and self.algorithm_matrix[cell] <= 0:
+                    break
+                if j - i == lowest_edge or j - i == highest_edge:
+                    self.band_edge_reached = True
+
+                movement = self.movement_map[cell]
+                path.append(movement)
+                if movement == self.DIAGONAL_MOVEMENT:
+                    i -= 1
+                    j -= 1
+                elif movement == self.VERTICAL_MOVEMENT:
+                    i -= 1
+                else:
+                    j -= 1
+
+            path.reverse()
+            if self.alignment_type == 'global':
+                results.append(self.create_result(self.get_leading_gaps(i, j) + path, 0, 0))
+            else:
+                results.append(self.create_result(path, i, j))
+
+        self.end_phase('traceback')
+        return results
+
+    def calculate_score(self):
+        # computes only the score of the alignment, without any traceback.
+        # returns the score and the cell (i, j) it is found at: the alignment ends
+        # after the i-th character of sequence2 and the j-th character of sequence1.
+        # for local alignment, this is the first of the cells with the maximum score.
+        # the schemes allowing it are scored with bit-parallel operations whatever the engine.
+        # when align() would use the linear space algorithm, the score is that of an optimal
+        # alignment under the affine gap penalties, as it finds.
+        self.start_phase('score only fill')
+        scheme = self.get_bit_parallel_scheme()
+        if scheme is not None:
+            result = self.calculate_score_bit_parallel(*scheme)
+        elif self.get_algorithm() == 'linear space':
+            result = self.calculate_optimal_score()
+        elif self.engine == 'numpy':
+            result = self.calculate_score_numpy()
+        else:
+            result = self.calculate_score_python()
+        self.end_phase('score only fill')
+        return result
+
+    def get_bit_parallel_scheme(self):
+        # global alignment with a gap penalty g for every gap position (opening = extension)
+        # and a matrix with one match score a and one mismatch score b reduces to the edit
+        # distance or to the longest common subsequence. with M matches, X mismatches and
+        # n1 + n2 - 2M - 2X gap positions, the score is g (n1 + n2) + (a - 2g) M + (b - 2g) X:
+        # - if b - 2g <= 0, a mismatch is never better than two gaps, and the best score is
+        #   g (n1 + n2) + (a - 2g) LCS, or g (n1 + n2) if a - 2g <= 0 too.
+        # - if a - 2g = 2 (b - 2g) > 0, the best score is g (n1 + n2) + (b - 2g) (n1 + n2 - edit distance).
+        # returns ('lcs' or 'edit distance', the weight of its term), or None for other schemes.
+        if self.alignment_type != 'global' or self.gap_opening_penalty != self.gap_extension_penalty:
+            return None
+        # only the residues of the sequences matter
+        match_and_mismatch_scores = self.scoring_matrix.get_match_and_mismatch_scores(
+            set(self.encoded_sequence1), set(self.encoded_sequence2))
+        if match_and_mismatch_scores is None or self.scoring_matrix.get_residue_class_tables() is None:
+            return None
+        match_score, mismatch_score = match_and_mismatch_scores
+        match_weight = match_score - 2 * self.gap_opening_penalty
+        mismatch_weight = mismatch_score - 2 * self.gap_opening_penalty
+        if mismatch_weight <= 0:
+            return 'lcs', max(0, match_weight)
+        if match_weight == 2 * mismatch_weight:
+            return 'edit distance', mismatch_weight
+        return None
+
+    def calculate_score_bit_parallel(self, scheme, weight):
+        # the residues are compared as numbers of residue classes, the same in both sequences.
+        # the longer sequence is the pattern, kept in the bits of integers (one bit per residue,
+        # with one integer per residue marking where it occurs), and the shorter one is read
+        # residue by residue, so that a whole column of the matrix is computed at each step.
+        row_table, column_table = self.scoring_matrix.get_residue_class_tables()
+        sequence1 = self.encoded_sequence1.translate(row_table)
+        sequence2 = self.encoded_sequence2.translate(column_table)
+        if len(sequence1) >= len(sequence2):
+            pattern, text = sequence1, sequence2
+        else:
+            pattern, text = sequence2, sequence1
+
+        total_length = self.sequence1_length + self.sequence2_length
+        score = self.gap_opening_penalty * total_length
+        # a column takes one operation per 64-bit word of the pattern, counted as a cell
+        words = -(-len(pattern) // 64)
+        if scheme == 'edit distance':
+            score += weight * (total_length - self.calculate_edit_distance_bit_parallel(pattern, text))
+            self.count('cells', words * len(text))
+        elif weight > 0:
+            score += weight * self.calculate_lcs_length_bit_parallel(pattern, text)
+            self.count('cells', words * len(text))
+        return score, (self.sequence2_length, self.sequence1_length)
+
+    def get_match_masks(self, pattern):
+        # for every residue class, an integer whose bit k is set if the pattern has it at position k
+        masks = [0] * 256
+        for residue_class in set(pattern):
+            table = bytearray(b'0') * 256
+            table[residue_class] = ord('1')
+            masks[residue_class] = int(pattern.translate(table)[::-1], 2)
+        return masks
+
+    def calculate_edit_distance_bit_parallel(self, pattern, text):
+        # Myers' algorithm, as given by Hyyrö for the edit distance of whole sequences: the
+        # differences between vertically adjacent cells of a column, +1 (positive) or -1
+        # (negative), are kept in the bits of two integers and the distance is followed on
+        # the last row
+        if not pattern:
+            return len(text)
+        masks = self.get_match_masks(pattern)
+        mask = (1 << len(pattern)) - 1
+        last_bit = 1 << (len(pattern) - 1)
+        positive = mask
+        negative = 0
+        distance = len(pattern)
+        for residue_class in text:
+            matches = masks[residue_class]
+            vertical = matches | negative
+            horizontal = (((matches & positive) + positive) ^ positive) | matches
+            horizontal_positive = negative | (~(horizontal | positive) & mask)
+            horizontal_negative = positive & horizontal
+            if horizontal_positive & last_bit:
+                distance += 1
+            elif horizontal_negative & last_bit:
+                distance -= 1
+            horizontal_positive = ((horizontal_positive << 1) | 1) & mask
+            horizontal_negative = (horizontal_negative << 1) & mask
+            positive = horizontal_negative | (~(vertical | horizontal_positive) & mask)
+            negative = horizontal_positive & vertical
+        return distance
+
+    def calculate_lcs_length_bit_parallel(self, pattern, text):
+        # the algorithm of Allison and Dix, as improved by Hyyrö: the zero bits of the
+        # integer are the positions of the pattern where the LCS length grows along a column
+        masks = self.get_match_masks(pattern)
+        mask = (1 << len(pattern)) - 1
+        column = mask
+        for residue_class in text:
+            matches = column & masks[residue_class]
+            column = ((column + matches) | (column - matches)) & mask
+        return len(pattern) - bin(column).count("1")
+
+    def calculate_score_python(self):
+        # keeps only two lines of the matrix in memory: two rows, or two columns
+        # if they are shorter. the cells depend on the same neighbours in both
+        # cases, so the scores do not depend on the direction of the lines.
+        local = self.alignment_type == 'local'
+        transposed = self.sequence2_length < self.sequence1_length
+        self.count('cells', self.sequence1_length * self.sequence2_length)
+
+        if transposed: # lines are columns
+            outer_sequence, profile = self.encoded_sequence1, self.get_sequence2_profile()
+            outer_movement, inner_movement = self.HORIZONTAL_MOVEMENT, self.VERTICAL_MOVEMENT
+        else: # lines are rows
+            outer_sequence, profile = self.encoded_sequence2, self.get_sequence1_profile()
+            outer_movement, inner_movement = self.VERTICAL_MOVEMENT, self.HORIZONTAL_MOVEMENT
+
+        length = min(self.sequence1_length, self.sequence2_length) + 1
+        previous_scores = array('q', [0]) * length
+        previous_movements = bytearray([self.NO_MOVEMENT]) * length
+        current_scores = array('q', [0]) * length
+        current_movements = bytearray([self.NO_MOVEMENT]) * length
+
+        if not local:
+            for q in range(1, length):
+                previous_scores[q] = self.gap_opening_penalty + (q - 1) * self.gap_extension_penalty
+
+        best_score = 0
+        best_location = (0, 0)
+
+        for p in range(1, len(outer_sequence) + 1):
+            if not local:
+                current_scores[0] = self.gap_opening_penalty + (p - 1) * self.gap_extension_penalty
+
+            pair_scores = profile[outer_sequence[p - 1]]
+            for q in range(1, length):
+                if previous_movements[q] == outer_movement:
+                    outer_score = self.gap_extension_penalty
+                else:
+                    outer_score = self.gap_opening_penalty
+
+                if current_movements[q - 1] == inner_movement:
+                    inner_score = self.gap_extension_penalty
+                else:
+                    inner_score = self.gap_opening_penalty
+
+                outer_movement_consequence = previous_scores[q] + outer_score
+                diagonal_movement_consequence = previous_scores[q - 1] + pair_scores[q - 1]
+                inner_movement_consequence = current_scores[q - 1] + inner_score
+
+                if transposed:
+                    vertical_movement_consequence = inner_movement_consequence
+                else:
+                    vertical_movement_consequence = outer_movement_consequence
+
+                maximum = max(outer_movement_consequence, diagonal_movement_consequence, inner_movement_consequence)
+
+                if local and maximum < 0:
+                    current_scores[q] = 0
+                    current_movements[q] = self.NO_MOVEMENT
+                    continue
+
+                current_scores[q] = maximum
                 if maximum == diagonal_movement_consequence:
-                    movement_map[(i, j)] = 0
+                    current_movements[q] = self.DIAGONAL_MOVEMENT
                 elif maximum == vertical_movement_consequence:
-                    movement_map[(i, j)] = -1
+                    current_movements[q] = self.VERTICAL_MOVEMENT
                 else:
-                    movement_map[(i, j)] = 1
-        
-        if self.DEBUG:
-            print (movement_map)
+                    current_movements[q] = self.HORIZONTAL_MOVEMENT
+
+                if local and maximum >= best_score:
+                    location = (q, p) if transposed else (p, q)
+                    if maximum > best_score or location < best_location:
+                        best_score = maximum
+                        best_location = location
+
+            previous_scores, current_scores = current_scores, previous_scores
+            previous_movements, current_movements = current_movements, previous_movements
+
+        if local:
+            return best_score, best_location
+        return previous_scores[length - 1], (self.sequence2_length, self.sequence1_length)
+
+    def calculate_score_numpy(self):
+        # keeps only the last two anti-diagonals of the matrix in memory.
+        local = self.alignment_type == 'local'
+        m = self.sequence2_length + 1
+        n = self.sequence1_length + 1
+        self.count('cells', self.sequence1_length * self.sequence2_length)
+
+        scores, codes1, codes2 = self.get_numpy_scores_and_codes()
+
+        best_score = 0
+        best_location = (0, 0)
+
+        # the anti-diagonal d holds the cells (i, d - i) for i = low, ..., high
+        previous_low = second_previous_low = 0
+        previous_scores = previous_movements = second_previous_scores = None
+
+        for d in range(m + n - 1):
+            low = max(0, d - n + 1)
+            high = min(m - 1, d)
+            i = np.arange(low, high + 1)
+            j = d - i
+
+            diagonal_scores = np.zeros(len(i), dtype=np.int64)
+            diagonal_movements = np.full(len(i), self.NO_MOVEMENT, dtype=np.uint8)
+
+            start = 0
+            stop = len(i)
+            if low == 0: # the cell on the first row
+                if not local and d > 0:
+                    diagonal_scores[0] = self.gap_opening_penalty + (d - 1) * self.gap_extension_penalty
+                start = 1
+            if high == d and d > 0: # the cell on the first column
+                if not local:
+                    diagonal_scores[-1] = self.gap_opening_penalty + (d - 1) * self.gap_extension_penalty
+                stop -= 1
+
+            if start < stop:
+                inner_i = i[start:stop]
+                inner_j = j[start:stop]
+                upper_cells = inner_i - 1 - previous_low
+                left_cells = inner_i - previous_low
+                upper_left_cells = inner_i - 1 - second_previous_low
+
+                vertical_score = np.where(previous_movements[upper_cells] == self.VERTICAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty)
+                horizontal_score = np.where(previous_movements[left_cells] == self.HORIZONTAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty)
+                diagonal_score = scores[codes1[inner_j - 1], codes2[inner_i - 1]]
+
+                vertical_movement_consequence = previous_scores[upper_cells] + vertical_score
+                diagonal_movement_consequence = second_previous_scores[upper_left_cells] + diagonal_score
+                horizontal_movement_consequence = previous_scores[left_cells] + horizontal_score
+
+                maximum = np.maximum(np.maximum(vertical_movement_consequence, diagonal_movement_consequence), horizontal_movement_consequence)
+                movement = np.where(maximum == diagonal_movement_consequence, self.DIAGONAL_MOVEMENT,
+                                    np.where(maximum == vertical_movement_consequence, self.VERTICAL_MOVEMENT, self.HORIZONTAL_MOVEMENT))
+
+                if local:
+                    clipped = maximum < 0
+                    maximum[clipped] = 0
+                    movement[clipped] = self.NO_MOVEMENT
+
+                    k = int(np.argmax(maximum))
+                    location = (int(inner_i[k]), int(inner_j[k]))
+                    if maximum[k] > best_score or (maximum[k] == best_score and location < best_location):
+                        best_score = int(maximum[k])
+                        best_location = location
+
+                diagonal_scores[start:stop] = maximum
+                diagonal_movements[start:stop] = movement
+
+            second_previous_low, second_previous_scores = previous_low, previous_scores
+            previous_low, previous_scores, previous_movements = low, diagonal_scores, diagonal_movements
+
+        if local:
+            return best_score, best_location
+        return int(previous_scores[-1]), (self.sequence2_length, self.sequence1_length)
+
+    def calculate_scores_numpy(self, codes2):
+        # scores sequence1 against many versions of sequence2 of the same length at once:
+        # codes2 holds their column indexes, one version per row. the anti-diagonals of
+        # all the matrices are computed together, one row of the arrays per version.
+        # returns the scores of calculate_score, without their locations.
+        local = self.alignment_type == 'local'
+        count = len(codes2)
+        m = codes2.shape[1] + 1
+        n = self.sequence1_length + 1
+
+        scores, codes1, _ = self.get_numpy_scores_and_codes()
+        codes2 = codes2.astype(np.intp)
+        best_scores = np.zeros(count, dtype=np.int64)
+
+        previous_low = second_previous_low = 0
+        previous_scores = previous_movements = second_previous_scores = None
+
+        for d in range(m + n - 1):
+            low = max(0, d - n + 1)
+            high = min(m - 1, d)
+            i = np.arange(low, high + 1)
+            j = d - i
+
+            diagonal_scores = np.zeros((count, len(i)), dtype=np.int64)
+            diagonal_movements = np.full((count, len(i)), self.NO_MOVEMENT, dtype=np.uint8)
+
+            start = 0
+            stop = len(i)
+            if low == 0: # the cell on the first row
+                if not local and d > 0:
+                    diagonal_scores[:, 0] = self.gap_opening_penalty + (d - 1) * self.gap_extension_penalty
+                start = 1
+            if high == d and d > 0: # the cell on the first column
+                if not local:
+                    diagonal_scores[:, -1] = self.gap_opening_penalty + (d - 1) * self.gap_extension_penalty
+                stop -= 1
+
+            if start < stop:
+                inner_i = i[start:stop]
+                inner_j = j[start:stop]
+                upper_cells = inner_i - 1 - previous_low
+                left_cells = inner_i - previous_low
+                upper_left_cells = inner_i - 1 - second_previous_low
+
+                vertical_score = np.where(previous_movements[:, upper_cells] == self.VERTICAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty)
+                horizontal_score = np.where(previous_movements[:, left_cells] == self.HORIZONTAL_MOVEMENT, self.gap_extension_penalty, self.gap_opening_penalty)
+                diagonal_score = scores[codes1[inner_j - 1], codes2[:, inner_i - 1]]
+
+                vertical_movement_consequence = previous_scores[:, upper_cells] + vertical_score
+                diagonal_movement_consequence = second_previous_scores[:, upper_left_cells] + diagonal_score
+                horizontal_movement_consequence = previous_scores[:, left_cells] + horizontal_score
+
+                maximum = np.maximum(np.maximum(vertical_movement_consequence, diagonal_movement_consequence), horizontal_movement_consequence)
+                movement = np.where(maximum == diagonal_movement_consequence, self.DIAGONAL_MOVEMENT,
+                                    np.where(maximum == vertical_movement_consequence, self.VERTICAL_MOVEMENT, self.HORIZONTAL_MOVEMENT))
+
+                if local:
+                    clipped = maximum < 0
+                    maximum[clipped] = 0
+                    movement[clipped] = self.NO_MOVEMENT
+                    np.maximum(best_scores, maximum.max(axis=1), out=best_scores)
+
+                diagonal_scores[:, start:stop] = maximum
+                diagonal_movements[:, start:stop] = movement
+
+            second_previous_low, second_previous_scores = previous_low, previous_scores
+            previous_low, previous_scores, previous_movements = low, diagonal_scores, diagonal_movements
+
+        if local:
+            return best_scores.tolist()
+        return previous_scores[:, -1].tolist()
+
+    def linear_space_global_alignment(self):
+        # Myers and Miller's divide and conquer algorithm, i.e. Hirschberg's
+        # algorithm extended to affine gap penalties. it finds an optimal global
+        # alignment while keeping only two rows of scores in memory at a time.
+        # the gap opening penalty must not be greater than the gap extension penalty.
+        self.start_phase('linear space alignment')
+        self.count('linear space alignments')
+        path = bytearray()
+        self.linear_space_align(0, self.sequence2_length, 0, self.sequence1_length,
+                                self.gap_opening_penalty - self.gap_extension_penalty,
+                                self.gap_opening_penalty - self.gap_extension_penalty, path)
+        result = self.create_result(path, 0, 0)
+        self.end_phase('linear space alignment')
+
+        return [result]
+
+    def calculate_optimal_score(self):
+        # the score of an optimal global alignment under the affine gap penalties: the
+        # last cell of the forward pass of the linear space algorithm over the whole matrix
+        self.count('linear space alignments')
+        CC, DD = self.linear_space_last_row(0, self.sequence2_length, 0, self.sequence1_length,
+                                            self.gap_opening_penalty - self.gap_extension_penalty, False)
+        return int(CC[self.sequence1_length]), (self.sequence2_length, self.sequence1_length)
+
+    def linear_space_align(self, a_start, a_end, b_start, b_end, tb, te, path):
+        # aligns a = sequence2[a_start:a_end] with b = sequence1[b_start:b_end] and appends
+        # the movements of the alignment to path. a gap of length k costs g + k * h;
+        # tb and te replace g for a gap in b touching the beginning or the end,
+        # they are 0 when the gap continues one from the neighbouring part.
+        g = self.gap_opening_penalty - self.gap_extension_penalty
+        h = self.gap_extension_penalty
+        m = a_end - a_start
+        n = b_end - b_start
+
+        vertical = bytes([self.VERTICAL_MOVEMENT])
+        horizontal = bytes([self.HORIZONTAL_MOVEMENT])
+
+        if n == 0:
+            path += vertical * m
+        elif m == 0:
+            path += horizontal * n
+        elif m == 1:
+            # either a[0] is deleted and all of b is inserted,
+            # or a[0] is aligned with one character of b.
+            pair_scores = self.get_sequence1_profile()[self.encoded_sequence2[a_start]]
+            best_score = max(tb, te) + h + g + n * h
+            best_j = 0
+            for j in range(1, n + 1):
+                score = pair_scores[b_start + j - 1]
+                if j > 1:
+                    score += g + (j - 1) * h
+                if j < n:
+                    score += g + (n - j) * h
+                if score > best_score:
+                    best_score = score
+                    best_j = j
+
+            if best_j == 0 and tb >= te:
+                path += vertical + horizontal * n
+            elif best_j == 0:
+                path += horizontal * n + vertical
+            else:
+                path += horizontal * (best_j - 1) + bytes([self.DIAGONAL_MOVEMENT]) + horizontal * (n - best_j)
+        else:
+            middle = a_start + m // 2
+            CC, DD = self.linear_space_last_row(a_start, middle, b_start, b_end, tb, False)
+            RR, SS = self.linear_space_last_row(middle, a_end, b_start, b_end, te, True)
+
+            # the optimal path crosses the middle row either at some column j (type 1),
+            # or in a gap in b spanning the rows middle and middle + 1 (type 2).
+            best_score = CC[0] + RR[n]
+            best_j = 0
+            best_type = 1
+            for j in range(n + 1):
+                if CC[j] + RR[n - j] > best_score:
+                    best_score = CC[j] + RR[n - j]
+                    best_j = j
+                    best_type = 1
+                if DD[j] + SS[n - j] - g > best_score:
+                    best_score = DD[j] + SS[n - j] - g
+                    best_j = j
+                    best_type = 2
+
+            if best_type == 1:
+                self.linear_space_align(a_start, middle, b_start, b_start + best_j, tb, g, path)
+                self.linear_space_align(middle, a_end, b_start + best_j, b_end, g, te, path)
+            else:
+                self.linear_space_align(a_start, middle - 1, b_start, b_start + best_j, tb, 0, path)
+                path += vertical * 2
+                self.linear_space_align(middle + 1, a_end, b_start + best_j, b_end, 0, te, path)
+
+    def linear_space_last_row(self, a_start, a_end, b_start, b_end, tb, reverse):
+        # returns the last rows of the scores of aligning a = sequence2[a_start:a_end]
+        # with the prefixes of b = sequence1[b_start:b_end] (with the suffixes, both
+        # sequences read backwards, if reverse is True): CC[j] is the best score of
+        # aligning a with the first j characters of b, DD[j] the best score among
+        # those alignments that end with a gap in b. the numpy engine computes the
+        # rows with vector operations, unless they are too short to gain from it.
+        if self.engine == 'numpy' and b_end - b_start >= self.MINIMUM_NUMPY_ROW_LENGTH:
+            return self.linear_space_last_row_numpy(a_start, a_end, b_start, b_end, tb, reverse)
+
+        g = self.gap_opening_penalty - self.gap_extension_penalty
+        h = self.gap_extension_penalty
+        n = b_end - b_start
+        minus_infinity = float('-inf')
+        profile = self.get_sequence1_profile()
+
+        rows = range(a_start, a_end)
+        if reverse:
+            rows = reversed(rows)
+
+        CC = [0] * (n + 1)
+        DD = [minus_infinity] * (n + 1)
+        t = g
+        for j in range(1, n + 1):
+            t += h
+            CC[j] = t
+
+        self.count('cells', (a_end - a_start) * n)
+        t = tb
+        for row in rows:
+            pair_scores = profile[self.encoded_sequence2[row]][b_start:b_end]
+            if reverse:
+                pair_scores.reverse()
+
+            s = CC[0]
+            t += h
+            c = t
+            CC[0] = c
+            DD[0] = c
+            e = minus_infinity
+            for j in range(1, n + 1):
+                e = max(e, c + g) + h
+                DD[j] = max(DD[j], CC[j] + g) + h
+                c = max(DD[j], e, s + pair_scores[j - 1])
+                s = CC[j]
+                CC[j] = c
+
+        return CC, DD
+
+    def linear_space_last_row_numpy(self, a_start, a_end, b_start, b_end, tb, reverse):
+        # the rows of linear_space_last_row, each one computed with vector operations. the
+        # best gap in a ending at column j starts after the column k < j maximizing
+        # CC[k] - k * h, found with a running maximum; the cells ending with such a gap can
+        # be left out of it, since extending their gap costs no more than opening another one.
+        # returns CC and DD as lists.
+        g = self.gap_opening_penalty - self.gap_extension_penalty
+        h = self.gap_extension_penalty
+        n = b_end - b_start
+        minus_infinity = np.iinfo(np.int64).min // 4
+        scores, codes1, codes2 = self.get_numpy_scores_and_codes()
+        codes1 = codes1[b_start:b_end]
+        rows = range(a_start, a_end)
+        if reverse:
+            codes1 = codes1[::-1]
+            rows = reversed(rows)
+
+        columns = np.arange(n + 1, dtype=np.int64)
+        CC = g + columns * h
+        CC[0] = 0
+        DD = np.full(n + 1, minus_infinity, dtype=np.int64)
+
+        self.count('cells', (a_end - a_start) * n)
+        t = tb
+        for row in rows:
+            t += h
+            DD = np.maximum(DD, CC + g) + h
+            DD[0] = t
+            current = np.empty(n + 1, dtype=np.int64)
+            current[0] = t
+            current[1:] = np.maximum(DD[1:], CC[:-1] + scores[codes1, codes2[row]])
+            best_starts = np.maximum.accumulate(current - columns * h)
+            current[1:] = np.maximum(current[1:], best_starts[:-1] + g + columns[1:] * h)
+            CC = current
+
+        return CC.tolist(), DD.tolist()
+
+class TiledAlignment:
+    # fills the matrix of an AlignmentProcessor in square tiles of tile_size rows and
+    # columns. a tile depends only on the row above it and the column on its left, so
+    # the tiles on an anti-diagonal of tiles (a wave) are filled in parallel by a pool
+    # of worker processes, one wave after the other. only the last row and the last
+    # column of every tile are kept, in shared memory, where the tiles below and on
+    # the right read them: instead of the m x n matrix, about (m + n) x (m + n) / tile_size
+    # cells are stored. the traceback fills again, from these rows and columns, only
+    # the tiles the alignment passes through.
+
+    DEFAULT_TILE_SIZE = 1024
+
+    # the settings and the shared memory of the current worker process
+    worker_settings = None
+    worker_memory = None
+
+    def __init__(self, processor, tile_size = DEFAULT_TILE_SIZE, workers = None):
+        self.processor = processor
+        self.tile_size = tile_size
+        self.workers = workers or os.cpu_count() or 1
+        self.m = processor.sequence2_length + 1 # number of rows
+        self.n = processor.sequence1_length + 1 # number of columns
+        self.tile_rows = max(1, -(-(self.m - 1) // tile_size))
+        self.tile_columns = max(1, -(-(self.n - 1) // tile_size))
+        self.recomputed_tile = None # (tile, processor filled for it), kept for the next traceback
+
+    def get_settings(self, values_name, movements_name):
+        processor = self.processor
+        return (processor.sequence1, processor.sequence2, processor.alignment_type, processor.scoring_matrix,
+                processor.gap_opening_penalty, processor.gap_extension_penalty, processor.engine,
+                processor.max_alignments, self.tile_size, self.tile_rows, self.tile_columns, values_name, movements_name)
 
-        # go from the bottom to the top: compose the alignment
-        top_line = "" # aligned sequence1
-        bottom_line = "" # aligned sequence2
+    def align(self):
+        # returns the same alignments as AlignmentProcessor.global_alignment or local_alignment
+        processor = self.processor
+        number_of_boundary_cells = (self.tile_rows + 1) * self.n + (self.tile_columns + 1) * self.m
+        values_memory = shared_memory.SharedMemory(create = True, size = 8 * number_of_boundary_cells)
+        movements_memory = shared_memory.SharedMemory(create = True, size = number_of_boundary_cells)
+        try:
+            # this process uses the shared memory it created, the workers attach to it
+            TiledAlignment.worker_settings = self.get_settings(values_memory.name, movements_memory.name)
+            TiledAlignment.worker_memory = (values_memory, movements_memory, values_memory.buf.cast('q'), movements_memory.buf)
+            self.initialize_boundaries()
+
+            processor.start_phase('fill')
+            best_score, locations = self.fill()
+            processor.end_phase('fill')
+            processor.count('cells', (self.m - 1) * (self.n - 1))
+
+            processor.start_phase('traceback')
+            if processor.alignment_type == 'global':
+                path, i, j = self.trace_back(self.m - 1, self.n - 1)
+                results = [processor.create_result(processor.get_leading_gaps(i, j) + path, 0, 0)]
+            elif best_score <= 0:
+                results = []
+            else:
+                results = []
+                for i, j in itertools.islice(locations, processor.max_alignments):
+                    path, i, j = self.trace_back(i, j)
+                    results.append(processor.create_result(path, i, j))
+                processor.count('co-optimal local alignments', len(results))
+            processor.end_phase('traceback')
+        finally:
+            if TiledAlignment.worker_memory is not None:
+                TiledAlignment.worker_memory[2].release()
+                TiledAlignment.worker_memory = None
+            self.recomputed_tile = None
+            values_memory.close()
+            values_memory.unlink()
+            movements_memory.close()
+            movements_memory.unlink()
 
-        i = m - 1
-        j = n - 1
+        return results
+
+    def initialize_boundaries(self):
+        # the first row and column of the matrix, wherever the tiles read them
+        values, movements = TiledAlignment.worker_memory[2:]
+        processor = self.processor
+        m, n = self.m, self.n
+        column_part = (self.tile_rows + 1) * n
+        movements[:] = bytes([processor.NO_MOVEMENT]) * len(movements)
+
+        def first_row_value(j):
+            if processor.alignment_type == 'local' or j == 0:
+                return 0
+            return processor.gap_opening_penalty + (j - 1) * processor.gap_extension_penalty
+        first_column_value = first_row_value
+
+        for j in range(n):
+            values[j] = first_row_value(j)
+        for i in range(m):
+            values[column_part + i] = first_column_value(i)
+        for k in range(1, self.tile_rows + 1):
+            values[k * n] = first_column_value(min(k * self.tile_size, m - 1))
+        for l in range(1, self.tile_columns + 1):
+            values[column_part + l * m] = first_row_value(min(l * self.tile_size, n - 1))
+
+    def fill(self):
+        # fills the tiles wave by wave; returns the best score of local alignment and
+        # an iterator over the cells holding it, in row major order
+        tiles_by_wave = [[(k, d - k) for k in range(max(0, d - self.tile_columns + 1), min(d, self.tile_rows - 1) + 1)]
+                         for d in range(self.tile_rows + self.tile_columns - 1)]
+
+        if self.workers == 1:
+            tile_results = [TiledAlignment.fill_tile(tile) for tiles in tiles_by_wave for tile in tiles]
+        else:
+            tile_results = []
+            settings = TiledAlignment.worker_settings
+            with multiprocessing.Pool(self.workers, TiledAlignment.initialize_worker, (settings,)) as pool:
+                for tiles in tiles_by_wave:
+                    tile_results.extend(pool.map(TiledAlignment.fill_tile, tiles, 1))
+
+        best_score = max([tile_result[0] for tile_result in tile_results] + [0])
+        locations = sorted(location for tile_result in tile_results if tile_result[0] == best_score
+                           for location in tile_result[1])
+        return best_score, iter(locations)
+
+    @staticmethod
+    def initialize_worker(settings):
+        TiledAlignment.worker_settings = settings
+        values_name, movements_name = settings[-2:]
+        values_memory = TiledAlignment.attach_shared_memory(values_name)
+        movements_memory = TiledAlignment.attach_shared_memory(movements_name)
+        TiledAlignment.worker_memory = (values_memory, movements_memory,
+                                        values_memory.buf.cast('q'), movements_memory.buf)
+
+    @staticmethod
+    def attach_shared_memory(name):
+        # the creating process removes the shared memory. the worker processes share its
+        # resource tracker, so the registration made when they attach is the same one.
+        try:
+            return shared_memory.SharedMemory(name = name, track = False)
+        except TypeError: # before Python 3.13
+            return shared_memory.SharedMemory(name = name)
+
+    @staticmethod
+    def get_tile_processor(tile):
+        # returns an AlignmentProcessor for the part of the sequences of a tile, with the
+        # row above the tile and the column on its left as its first row and column,
+        # and the bounds of the tile in the matrix
+        (sequence1, sequence2, alignment_type, scoring_matrix, gap_opening_penalty, gap_extension_penalty, engine,
+         max_alignments, tile_size, tile_rows, tile_columns, values_name, movements_name) = TiledAlignment.worker_settings
+        values, movements = TiledAlignment.worker_memory[2:]
+        m = len(sequence2) + 1
+        n = len(sequence1) + 1
+        column_part = (tile_rows + 1) * n
+
+        k, l = tile
+        first_row = 1 + k * tile_size
+        end_row = min(m, first_row + tile_size)
+        first_column = 1 + l * tile_size
+        end_column = min(n, first_column + tile_size)
+
+        processor = AlignmentProcessor(sequence1[first_column - 1:end_column - 1], sequence2[first_row - 1:end_row - 1],
+                                       alignment_type, scoring_matrix, gap_opening_penalty, gap_extension_penalty,
+                                       False, engine, max_alignments = max_alignments)
+        tile_m = end_row - first_row + 1
+        tile_n = end_column - first_column + 1
+        processor.algorithm_matrix = array('q', [0]) * (tile_m * tile_n)
+        processor.movement_map = bytearray([processor.NO_MOVEMENT]) * (tile_m * tile_n)
+
+        top = k * n + first_column - 1
+        memoryview(processor.algorithm_matrix)[0:tile_n] = values[top:top + tile_n]
+        processor.movement_map[0:tile_n] = movements[top:top + tile_n]
+        left = column_part + l * m + first_row - 1
+        for a in range(1, tile_m):
+            processor.algorithm_matrix[a * tile_n] = values[left + a]
+            processor.movement_map[a * tile_n] = movements[left + a]
+
+        return processor, (first_row, end_row, first_column, end_column)
+
+    @staticmethod
+    def fill_tile(tile):
+        # fills a tile and writes its last row and column to the shared memory. returns the
+        # best score of local alignment in the tile and the cells holding it
+        tile_rows, tile_columns = TiledAlignment.worker_settings[9:11]
+        values, movements = TiledAlignment.worker_memory[2:]
+        processor, (first_row, end_row, first_column, end_column) = TiledAlignment.get_tile_processor(tile)
+        m = len(TiledAlignment.worker_settings[1]) + 1
+        n = len(TiledAlignment.worker_settings[0]) + 1
+        column_part = (tile_rows + 1) * n
+        tile_m = end_row - first_row + 1
+        tile_n = end_column - first_column + 1
+        processor.fill_algorithm_matrix(tile_m, tile_n)
+
+        k, l = tile
+        bottom = (k + 1) * n + first_column
+        last_row = (tile_m - 1) * tile_n
+        values[bottom:bottom + tile_n - 1] = memoryview(processor.algorithm_matrix)[last_row + 1:last_row + tile_n]
+        movements[bottom:bottom + tile_n - 1] = processor.movement_map[last_row + 1:last_row + tile_n]
+        right = column_part + (l + 1) * m + first_row - 1
+        for a in range(1, tile_m):
+            values[right + a] = processor.algorithm_matrix[a * tile_n + tile_n - 1]
+            movements[right + a] = processor.movement_map[a * tile_n + tile_n - 1]
+
+        if processor.alignment_type == 'global' or processor.best_score <= 0:
+            return 0, []
+        locations = itertools.islice(processor.find_max_locations_in_the_matrix(tile_m, tile_n), processor.max_alignments)
+        return processor.best_score, [(first_row - 1 + a, first_column - 1 + b) for a, b in locations]
+
+    def trace_back(self, i, j):
+        # follows the alignment ending at cell (i, j) through the tiles, filling each of them again.
+        # returns the path and the cell where it stopped, as AlignmentProcessor.trace_back
+        processor = self.processor
+        parts = [] # of the path, backwards
         while i > 0 and j > 0:
-            movement = movement_map[(i, j)]
-            if movement == 0:
-                top_line = self.sequence1[j - 1] + top_line
-                bottom_line = self.sequence2[i - 1] + bottom_line
-                i -= 1
-                j -= 1
-            elif movement == -1:
-                top_line = "-" + top_line
-                bottom_line = self.sequence2[i - 1] + bottom_line
-                i -= 1
+            tile = ((i - 1) // self.tile_size, (j - 1) // self.tile_size)
+            if self.recomputed_tile is None or self.recomputed_tile[0] != tile:
+                tile_processor, bounds = TiledAlignment.get_tile_processor(tile)
+                first_row, end_row, first_column, end_column = bounds
+                tile_processor.fill_algorithm_matrix(end_row - first_row + 1, end_column - first_column + 1)
+                self.recomputed_tile = (tile, tile_processor, bounds)
+                processor.count('recomputed cells', (end_row - first_row) * (end_column - first_column))
+            tile, tile_processor, (first_row, end_row, first_column, end_column) = self.recomputed_tile
+
+            path, a, b = tile_processor.trace_back(i - first_row + 1, j - first_column + 1, end_column - first_column + 1)
+            parts.append(path)
+            stopped_in_tile = a > 0 and b > 0 # in local alignment, at a cell with a score of 0
+            i = first_row - 1 + a
+            j = first_column - 1 + b
+            if stopped_in_tile:
+                break
+
+        return bytearray().join(reversed(parts)), i, j
+
+class BatchAlignmentProcessor:
+    # aligns many pairs of sequences on a pool of worker processes.
+    # the scoring matrix is sent to each worker only once, when it starts.
+
+    # the alignment settings of the current worker process
+    worker_settings = None
+
+    # the number of pairs sent to a worker at once when the number of pairs is not known
+    DEFAULT_CHUNK_SIZE = 16
+
+    def __init__(self, queries, targets, alignment_type, scoring_matrix, gap_opening_penalty,
+     gap_extension_penalty, engine = 'python', linear_space_threshold = AlignmentProcessor.DEFAULT_LINEAR_SPACE_THRESHOLD,
+     score_only = False, workers = None, chunk_size = None, ordered = True, band_width = None, statistics = None,
+     max_alignments = None, cache = None, memory_budget = None):
+        # queries is a list of (id, sequence) records, targets an iterable of them,
+        # which is read only once (e.g. SequenceFileReader.read_records()). every query
+        # is aligned with every target; if targets is None, every query is aligned
+        # with every other query (all vs all). the statistics collected by the
+        # workers are merged into statistics, if it is not None.
+        self.queries = queries
+        self.targets = targets
+        self.statistics = statistics
+        self.settings = (alignment_type, scoring_matrix, gap_opening_penalty, gap_extension_penalty,
+                         engine, linear_space_threshold, score_only, band_width, statistics is not None, max_alignments, cache,
+                         memory_budget)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.ordered = ordered
+
+    def get_number_of_pairs(self):
+        # returns None if the targets are not counted in advance
+        if self.targets is None:
+            return len(self.queries) * (len(self.queries) - 1) // 2
+        if isinstance(self.targets, (list, tuple)):
+            return len(self.queries) * len(self.targets)
+        return None
+
+    def get_pairs(self):
+        # yields (query id, query, target id, target) tuples,
+        # target by target so that the targets are read only once
+        if self.targets is None:
+            for i in range(len(self.queries)):
+                for j in range(i + 1, len(self.queries)):
+                    yield self.queries[i] + self.queries[j]
+        else:
+            for target in self.targets:
+                for query in self.queries:
+                    yield query + target
+
+    def align(self):
+        # yields (query id, target id, result, error, algorithm) tuples, where result is
+        # what AlignmentProcessor.align() returns, or AlignmentProcessor.calculate_score()
+        # if only the scores are wanted, and algorithm what AlignmentProcessor.get_algorithm()
+        # returns. a pair that cannot be aligned (e.g. a sequence with a residue missing
+        # from the scoring matrix) has None as its result and algorithm and the error
+        # message as error; the other pairs are aligned all the same.
+        # unless ordered is False, the results come in the order of the pairs;
+        # otherwise they come as soon as they are ready.
+        if self.workers == 1:
+            BatchAlignmentProcessor.initialize_worker(self.settings)
+            for pair in self.get_pairs():
+                yield self.collect(BatchAlignmentProcessor.align_pair(pair))
+            return
+
+        chunk_size = self.chunk_size
+        number_of_pairs = self.get_number_of_pairs()
+        if chunk_size is None and number_of_pairs is None:
+            chunk_size = self.DEFAULT_CHUNK_SIZE
+        elif chunk_size is None:
+            # a few chunks per worker balances the load without much communication
+            chunk_size = max(1, number_of_pairs // (self.workers * 4))
+
+        with multiprocessing.Pool(self.workers, BatchAlignmentProcessor.initialize_worker, (self.settings,)) as pool:
+            if self.ordered:
+                results = pool.imap(BatchAlignmentProcessor.align_pair, self.get_pairs(), chunk_size)
             else:
-                top_line = self.sequence1[j - 1] + top_line
-                bottom_line = "-" + bottom_line
-                j -= 1
+                results = pool.imap_unordered(BatchAlignmentProcessor.align_pair, self.get_pairs(), chunk_size)
+            for result in results:
+                yield self.collect(result)
+
+    def collect(self, result):
+        # merges the statistics sent with a result
+        query_id, target_id, alignment_result, error, algorithm, statistics = result
+        if statistics is not None:
+            self.statistics.merge(statistics)
+            self.statistics.count('pairs')
+        return query_id, target_id, alignment_result, error, algorithm
+
+    @staticmethod
+    def initialize_worker(settings):
+        BatchAlignmentProcessor.worker_settings = settings
+
+    @staticmethod
+    def align_pair(pair):
+        query_id, query, target_id, target = pair
+        (alignment_type, scoring_matrix, gap_opening_penalty, gap_extension_penalty,
+         engine, linear_space_threshold, score_only, band_width, collect_statistics,
+         max_alignments, cache, memory_budget) = BatchAlignmentProcessor.worker_settings
+
+        statistics = AlignmentStatistics() if collect_statistics else None
+        try:
+            alignment_processor = AlignmentProcessor(query, target, alignment_type, scoring_matrix,
+                                                     gap_opening_penalty, gap_extension_penalty, False,
+                                                     engine, linear_space_threshold, band_width, statistics, max_alignments,
+                                                     cache = cache, memory_budget = memory_budget,
+                                                     sequence_names = ("query {}".format(query_id), "target {}".format(target_id)))
+            if score_only:
+                result = alignment_processor.calculate_score()
+            else:
+                result = alignment_processor.align()
+            return query_id, target_id, result, None, alignment_processor.get_algorithm(), statistics
+        except (ValueError, OSError) as e:
+            # only this pair fails, not the chunk of pairs it is sent to a worker with
+            return query_id, target_id, None, str(e), None, statistics
 
-        while i > 0:
-            top_line = "-" + top_line
-            bottom_line = self.sequence2[i - 1] + bottom_line
-            i -= 1
-        
-        while j > 0:
-            top_line = self.sequence1[j - 1] + top_line
-            bottom_line = "-" + bottom_line
-            j -= 1
+class SignificanceTest:
+    # estimates how significant the score of a local alignment is: sequence1 is scored
+    # against shuffles of sequence2, which keep its composition, and the score of the
+    # pair is compared with theirs. the numpy engine scores the shuffles sent to a
+    # worker process all at once. the shuffles depend only on the seed.
 
-        if self.DEBUG:
-            for i in range(m):
-                for j in range(n):
-                    print (str(self.algorithm_matrix[i][j]).rjust(4), end= ' ')
-                print ()
+    # the alignment settings of the current worker process
+    worker_settings = None
 
-        return [(top_line, bottom_line)]
+    EULER_GAMMA = 0.5772156649015329
+
+    def __init__(self, sequence1, sequence2, scoring_matrix, gap_opening_penalty, gap_extension_penalty,
+     shuffles, engine = 'python', workers = None, seed = 0, statistics = None):
+        self.sequence1 = sequence1
+        self.sequence2 = sequence2
+        self.shuffles = shuffles
+        self.engine = engine
+        self.workers = workers or 1
+        self.seed = seed
+        self.statistics = statistics
+        self.settings = (sequence1, sequence2, scoring_matrix, gap_opening_penalty, gap_extension_penalty, engine)
+
+    def generate_shuffles(self):
+        # the encoded residues of the shuffles, one shuffle per row (numpy engine), or
+        # the shuffles as strings
+        if self.engine == 'numpy':
+            processor = SignificanceTest.create_processor(self.settings)
+            codes2 = np.frombuffer(processor.encoded_sequence2, dtype=np.uint8)
+            return np.random.default_rng(self.seed).permuted(np.tile(codes2, (self.shuffles, 1)), axis=1)
+        generator = random.Random(self.seed)
+        return ["".join(generator.sample(self.sequence2, len(self.sequence2))) for i in range(self.shuffles)]
+
+    def calculate_scores(self):
+        # returns the scores of the shuffles, split into one chunk per worker process
+        shuffles = self.generate_shuffles()
+        chunk_size = max(1, -(-self.shuffles // self.workers))
+        chunks = [shuffles[k:k + chunk_size] for k in range(0, self.shuffles, chunk_size)]
+
+        if self.workers == 1 or len(chunks) == 1:
+            SignificanceTest.initialize_worker(self.settings)
+            results = [SignificanceTest.score_shuffles(chunk) for chunk in chunks]
+        else:
+            with multiprocessing.Pool(len(chunks), SignificanceTest.initialize_worker, (self.settings,)) as pool:
+                results = pool.map(SignificanceTest.score_shuffles, chunks)
+        return [score for chunk_scores in results for score in chunk_scores]
+
+    def run(self):
+        # returns the score of the pair and the statistics of the scores of the shuffles:
+        # their mean and standard deviation, the Z-score of the pair, and the parameters
+        # lambda and mu of the extreme value (Gumbel) distribution fitted to them by the
+        # method of moments, with the E-value (the expected number of alignments scoring
+        # at least as high by chance) and the P-value they give. the values that cannot be
+        # computed because all the shuffles have the same score are None.
+        score = SignificanceTest.create_processor(self.settings).calculate_score()[0]
+        scores = self.calculate_scores()
+        # the shuffles are scored by processors without statistics, some of them in other
+        # processes, so their cells and those of the pair are counted here
+        if self.statistics is not None:
+            self.statistics.count('shuffles', len(scores))
+            self.statistics.count('cells', (len(scores) + 1) * len(self.sequence1) * len(self.sequence2))
+
+        mean = sum(scores) / len(scores)
+        standard_deviation = math.sqrt(sum((x - mean) ** 2 for x in scores) / max(1, len(scores) - 1))
+        report = {
+            'score': score,
+            'shuffles': len(scores),
+            'mean': mean,
+            'standard_deviation': standard_deviation,
+            'z_score': None,
+            'lambda': None,
+            'mu': None,
+            'e_value': None,
+            'p_value': None,
+        }
+        if standard_deviation > 0:
+            report['z_score'] = (score - mean) / standard_deviation
+            report['lambda'] = math.pi / (standard_deviation * math.sqrt(6))
+            report['mu'] = mean - self.EULER_GAMMA / report['lambda']
+            report['e_value'] = math.exp(-report['lambda'] * (score - report['mu']))
+            report['p_value'] = -math.expm1(-report['e_value'])
+        return report
+
+    @staticmethod
+    def create_processor(settings, sequence2 = None):
+        sequence1, original_sequence2, scoring_matrix, gap_opening_penalty, gap_extension_penalty, engine = settings
+        if sequence2 is None:
+            sequence2 = original_sequence2
+        return AlignmentProcessor(sequence1, sequence2, 'local', scoring_matrix, gap_opening_penalty,
+                                  gap_extension_penalty, False, engine)
+
+    @staticmethod
+    def initialize_worker(settings):
+        SignificanceTest.worker_settings = settings
+
+    @staticmethod
+    def score_shuffles(shuffles):
+        settings = SignificanceTest.worker_settings
+        if settings[-1] == 'numpy':
+            return SignificanceTest.create_processor(settings).calculate_scores_numpy(shuffles)
+        return [SignificanceTest.create_processor(settings, shuffle).calculate_score()[0] for shuffle in shuffles]
+
+class SeedIndex:
+    # an index of the seeds of the sequences in a sequence file: for every seed,
+    # the positions where it occurs. a seed is given as a pattern of 1s and 0s,
+    # e.g. 111 (3-mers) or 1101011 (a spaced seed, which matches two pieces of
+    # sequence with the same residues at the positions of the 1s). the positions
+    # are counted in the concatenation of the sequences. the index is kept next to
+    # the sequence file, or in the cache directory if that one cannot be written, and
+    # built again when the file changes.
+
+    DEFAULT_SEED = "111"
+
+    def __init__(self, path, seed = DEFAULT_SEED):
+        if not seed or set(seed) - set("01") or not seed.startswith("1") or not seed.endswith("1"):
+            raise ValueError("Invalid seed!: '{}'\nA seed is a pattern of 1s and 0s starting and ending with 1".format(seed))
+        self.path = path
+        self.seed = seed
+        self.offsets = [i for i in range(len(seed)) if seed[i] == '1']
+        self.ids = [] # of the sequences, in the order of the file
+        self.records = [] # (start, end) of the sequences in the file
+        self.starts = array('Q') # of the sequences in the concatenation
+        self.postings = {} # seed: the positions where it occurs, as the bytes of an array('Q')
+
+    def get_index_path(self):
+        return "{}.{}.seeds".format(self.path, self.seed)
+
+    def get_cached_index_path(self):
+        # the path of the index in the cache directory, named after the path of the sequence file
+        name = hashlib.sha256(os.path.abspath(self.path).encode("utf-8")).hexdigest()
+        return os.path.join(SequenceFileReader.get_cache_directory(), "{}.{}.seeds".format(name, self.seed))
+
+    def get_source_stamp(self):
+        # marshal's format may change between Python versions, so the version is a part of the stamp
+        file_status = os.stat(self.path)
+        return file_status.st_size, file_status.st_mtime_ns, sys.version_info[0], sys.version_info[1]
+
+    def get_seeds(self, sequence):
+        # yields (position, seed) pairs for every position of the sequence where a seed fits
+        span = len(self.seed)
+        if len(self.offsets) == span:
+            for position in range(len(sequence) - span + 1):
+                yield position, sequence[position:position + span]
+        else:
+            for position in range(len(sequence) - span + 1):
+                yield position, "".join([sequence[position + offset] for offset in self.offsets])
+
+    def build(self):
+        reader = SequenceFileReader(self.path)
+        postings = {}
+        position = 0
+        for record_id, sequence, start, end in reader.parse_records(reader.read_lines()):
+            self.ids.append(record_id)
+            self.records.append((start, end))
+            self.starts.append(position)
+            for offset, seed in self.get_seeds(sequence.upper()):
+                positions = postings.get(seed)
+                if positions is None:
+                    positions = postings[seed] = array('Q')
+                positions.append(position + offset)
+            position += len(sequence)
+        self.postings = {seed: positions.tobytes() for seed, positions in postings.items()}
+
+        # written next to the sequence file, or to the cache directory if that fails. the
+        # index is only kept to save building it again: failing to write it is not an error.
+        for index_path in (self.get_index_path(), self.get_cached_index_path()):
+            if self.write(index_path):
+                return
+
+    def write(self, index_path):
+        # written to a temporary file first, so that other processes never read a partial index
+        temporary_path = "{}.{}.tmp".format(index_path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(index_path) or ".", exist_ok = True)
+            with open(temporary_path, 'wb') as f:
+                marshal.dump((self.get_source_stamp(), self.seed, self.ids, self.records, self.starts.tobytes(), self.postings), f)
+            os.replace(temporary_path, index_path)
+        except OSError:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def read(self, index_path):
+        # returns True if the index file exists and belongs to this version of the sequence file
+        try:
+            with open(index_path, 'rb') as f:
+                source_stamp, seed, ids, records, starts, postings = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if tuple(source_stamp) != self.get_source_stamp() or seed != self.seed:
+            return False
+        self.ids, self.records, self.postings = ids, records, postings
+        self.starts = array('Q')
+        self.starts.frombytes(starts)
+        return True
+
+    def load(self):
+        # loads the index file, building it first if it is missing or belongs to another version of the sequence file
+        for index_path in (self.get_index_path(), self.get_cached_index_path()):
+            if self.read(index_path):
+                return
+        self.ids, self.records, self.starts, self.postings = [], [], array('Q'), {}
+        self.build()
+
+    def get_positions(self, seed):
+        positions = self.postings.get(seed)
+        if positions is None:
+            return ()
+        return memoryview(positions).cast('Q')
+
+    def locate(self, position):
+        # returns the number of the sequence containing a position and the position in it
+        number = bisect.bisect_right(self.starts, position) - 1
+        return number, position - self.starts[number]
+
+    def get_sequence(self, number):
+        start, end = self.records[number]
+        return SequenceFileReader(self.path).read_record_at(start, end)
+
+class SeedSearch:
+    # finds the best local alignments of a query with the sequences of a seed indexed
+    # file in the way of BLAST: the seeds shared by the query and a sequence are extended
+    # without gaps in both directions until the score falls x_drop_ungapped below the
+    # best one seen. the extensions scoring at least ungapped_cutoff are extended again
+    # from their middle, with gaps, until the score falls x_drop_gapped below the best
+    # one, and the region they reach is aligned with local alignment. only these regions
+    # are aligned, instead of the whole sequences. the alignments scoring less than
+    # minimum_score are left out.
+
+    DEFAULT_X_DROP_UNGAPPED = 16
+    DEFAULT_UNGAPPED_CUTOFF = 40
+    DEFAULT_X_DROP_GAPPED = 40
+    DEFAULT_MINIMUM_SCORE = 40
+
+    def __init__(self, seed_index, scoring_matrix, gap_opening_penalty, gap_extension_penalty, engine = 'python',
+     x_drop_ungapped = DEFAULT_X_DROP_UNGAPPED, ungapped_cutoff = DEFAULT_UNGAPPED_CUTOFF,
+     x_drop_gapped = DEFAULT_X_DROP_GAPPED, minimum_score = DEFAULT_MINIMUM_SCORE, statistics = None):
+        self.seed_index = seed_index
+        self.scoring_matrix = scoring_matrix
+        self.gap_opening_penalty = gap_opening_penalty
+        self.gap_extension_penalty = gap_extension_penalty
+        self.engine = engine
+        self.x_drop_ungapped = x_drop_ungapped
+        self.ungapped_cutoff = ungapped_cutoff
+        self.x_drop_gapped = x_drop_gapped
+        self.minimum_score = minimum_score
+        self.statistics = statistics # an AlignmentStatistics, or None
+        self.scores = scoring_matrix.get_dense_matrix()
+        self.number_of_columns = len(scoring_matrix.get_column_titles())
+        self.targets = {} # sequence number: (sequence, its encoded residues), or the error encoding it
+        self.skipped_targets = [] # (sequence id, error) of the sequences the last search could not align
+
+    def get_target(self, number):
+        # returns the sequence and its encoded residues, read and encoded once for all the searches.
+        # raises ValueError if it has residues missing from the scoring matrix.
+        if number not in self.targets:
+            target = self.seed_index.get_sequence(number)
+            try:
+                self.targets[number] = (target, self.scoring_matrix.encode_column_sequence(
+                    target, "sequence {}".format(self.seed_index.ids[number])))
+            except ValueError as e:
+                self.targets[number] = str(e)
+        if isinstance(self.targets[number], str):
+            raise ValueError(self.targets[number])
+        return self.targets[number]
+
+    def start_phase(self, phase):
+        if self.statistics is not None:
+            self.statistics.start_phase(phase)
+
+    def end_phase(self, phase):
+        if self.statistics is not None:
+            self.statistics.end_phase(phase)
+
+    def count(self, counter, value = 1):
+        if self.statistics is not None:
+            self.statistics.count(counter, value)
+
+    def search(self, query):
+        # returns the alignments found, from the best score down, as (sequence id, AlignmentResult)
+        # tuples. the query is sequence1 of the results and the sequence sequence2. the sequences
+        # that cannot be aligned with the query are skipped, and listed in skipped_targets.
+        query_codes = self.scoring_matrix.encode_row_sequence(query, 'query')
+        self.skipped_targets = []
+
+        self.start_phase('seeding')
+        hits = {} # sequence number: [(diagonal, position in the sequence, position in the query)]
+        for query_position, seed in self.seed_index.get_seeds(query.upper()):
+            for position in self.seed_index.get_positions(seed):
+                number, target_position = self.seed_index.locate(position)
+                hits.setdefault(number, []).append((target_position - query_position, target_position, query_position))
+        self.end_phase('seeding')
+        self.count('seed hits', sum(len(target_hits) for target_hits in hits.values()))
+
+        results = []
+        for number in sorted(hits):
+            target_id = self.seed_index.ids[number]
+            try:
+                target, target_codes = self.get_target(number)
+            except ValueError as e:
+                # only this sequence fails, not the search
+                self.skipped_targets.append((target_id, str(e)))
+                continue
+
+            self.start_phase('ungapped extension')
+            segments = self.extend_hits(hits[number], query_codes, target_codes)
+            self.end_phase('ungapped extension')
+
+            for score, query_start, target_start, length in sorted(segments, reverse = True):
+                middle = length // 2
+                query_middle = query_start + middle
+                target_middle = target_start + middle
+                if any(positions[0] <= query_middle + 1 <= positions[1] and positions[2] <= target_middle + 1 <= positions[3]
+                       for positions in [result.get_positions() for result_id, result in results if result_id == target_id]):
+                    continue # already in an alignment found with another segment
+
+                self.start_phase('gapped extension')
+                query_region, target_region = self.extend_gapped(query_codes, target_codes, query_middle, target_middle)
+                self.end_phase('gapped extension')
+                self.count('gapped extensions')
+
+                self.start_phase('region alignment')
+                result = self.align_region(query, target, query_region, target_region)
+                self.end_phase('region alignment')
+                if (result is not None and result.score >= self.minimum_score
+                        and (target_id, result.get_positions()) not in [(result_id, other.get_positions()) for result_id, other in results]):
+                    results.append((target_id, result))
+
+        results.sort(key = lambda result: -result[1].score)
+        return results
+
+    def extend_hits(self, target_hits, query_codes, target_codes):
+        # returns the (score, start in the query, start in the sequence, length) of the
+        # ungapped extensions of the hits scoring at least ungapped_cutoff. a hit inside
+        # an extension already made on its diagonal is not extended again.
+        span = len(self.seed_index.seed)
+        extended_until = {} # diagonal: the end of the last extension on it, in the sequence
+        segments = []
+        for diagonal, target_position, query_position in sorted(target_hits):
+            if target_position < extended_until.get(diagonal, -1):
+                continue
+            self.count('ungapped extensions')
+            segment = self.extend_ungapped(query_codes, target_codes, query_position, target_position, span)
+            score, query_start, target_start, length = segment
+            extended_until[diagonal] = target_start + length
+            if score >= self.ungapped_cutoff:
+                segments.append(segment)
+        return segments
+
+    def extend_ungapped(self, query_codes, target_codes, query_position, target_position, span):
+        scores = self.scores
+        columns = self.number_of_columns
+        score = 0
+        for k in range(span):
+            score += scores[query_codes[query_position + k] * columns + target_codes[target_position + k]]
+
+        # to the right of the seed
+        best_score = score
+        end = span
+        k = span
+        while query_position + k < len(query_codes) and target_position + k < len(target_codes):
+            score += scores[query_codes[query_position + k] * columns + target_codes[target_position + k]]
+            k += 1
+            if score > best_score:
+                best_score = score
+                end = k
+            elif score < best_score - self.x_drop_ungapped:
+                break
+
+        # to the left of the seed
+        score = best_score
+        start = 0
+        k = -1
+        while query_position + k >= 0 and target_position + k >= 0:
+            score += scores[query_codes[query_position + k] * columns + target_codes[target_position + k]]
+            if score > best_score:
+                best_score = score
+                start = k
+            elif score < best_score - self.x_drop_ungapped:
+                break
+            k -= 1
+
+        return best_score, query_position + start, target_position + start, end - start
+
+    def extend_gapped(self, query_codes, target_codes, query_position, target_position):
+        # returns the (start, end) of the regions of the query and of the sequence reached by
+        # extending with gaps from the pair of residues at the given positions in both directions
+        right_score, query_right, target_right = self.extend_gapped_in_one_direction(
+            query_codes[query_position:], target_codes[target_position:])
+        left_score, query_left, target_left = self.extend_gapped_in_one_direction(
+            query_codes[:query_position][::-1], target_codes[:target_position][::-1])
+        return ((query_position - query_left, query_position + query_right),
+                (target_position - target_left, target_position + target_right))
+
+    def extend_gapped_in_one_direction(self, query_codes, target_codes):
+        # aligns the beginnings of the two sequences, ending anywhere, with affine gap
+        # penalties: returns the best score and the lengths of the aligned parts. the
+        # cells scoring more than x_drop_gapped below the best score so far are dropped,
+        # and the extension stops when a row has no cells left. each row is kept as
+        # the scores from its first remaining column on.
+        scores = self.scores
+        columns = self.number_of_columns
+        minus_infinity = float('-inf')
+        n = len(target_codes)
+
+        best_score = 0
+        best_i = best_j = 0
+
+        # the first row: gaps in the query
+        h_row = [0] # the best scores
+        f_row = [minus_infinity] # the best scores ending with a gap in the sequence
+        score = self.gap_opening_penalty
+        while len(h_row) <= n and score >= -self.x_drop_gapped:
+            h_row.append(score)
+            f_row.append(minus_infinity)
+            score += self.gap_extension_penalty
+        first_column = 0
+
+        for i in range(1, len(query_codes) + 1):
+            row_offset = query_codes[i - 1] * columns
+            previous_h, previous_f, previous_first_column = h_row, f_row, first_column
+            previous_length = len(previous_h)
+            h_row = []
+            f_row = []
+            e = minus_infinity # the best score ending with a gap in the query
+            h_left = minus_infinity
+            threshold = best_score - self.x_drop_gapped
+
+            j = previous_first_column
+            while j <= n:
+                k = j - previous_first_column
+                if 1 <= k <= previous_length:
+                    diagonal = previous_h[k - 1] + scores[row_offset + target_codes[j - 1]]
+                else:
+                    diagonal = minus_infinity
+                if k < previous_length:
+                    f = max(previous_h[k] + self.gap_opening_penalty, previous_f[k] + self.gap_extension_penalty)
+                else:
+                    f = minus_infinity
+                e = max(h_left + self.gap_opening_penalty, e + self.gap_extension_penalty)
+                h = max(diagonal, e, f)
+
+                if h < threshold:
+                    h = e = f = minus_infinity
+                    if k > previous_length: # nothing can reach the rest of the row
+                        break
+                h_row.append(h)
+                f_row.append(f)
+                h_left = h
+                j += 1
+
+            finite = [k for k in range(len(h_row)) if h_row[k] != minus_infinity]
+            if not finite:
+                break
+            first_column = previous_first_column + finite[0]
+            h_row = h_row[finite[0]:finite[-1] + 1]
+            f_row = f_row[finite[0]:finite[-1] + 1]
+
+            for k in range(len(h_row)):
+                if h_row[k] > best_score:
+                    best_score = h_row[k]
+                    best_i = i
+                    best_j = first_column + k
+
+        return best_score, best_i, best_j
+
+    def align_region(self, query, target, query_region, target_region):
+        # the best local alignment of the regions, with the positions in the whole sequences,
+        # or None if there is none
+        query_start, query_end = query_region
+        target_start, target_end = target_region
+        alignment_processor = AlignmentProcessor(query[query_start:query_end], target[target_start:target_end], 'local',
+                                                 self.scoring_matrix, self.gap_opening_penalty, self.gap_extension_penalty,
+                                                 False, self.engine, top_alignments = 1)
+        results = alignment_processor.align()
+        if not results:
+            return None
+
+        result = results[0]
+        result.start1 += query_start
+        result.start2 += target_start
+        return result
+
+class AlignmentWriter:
+    # writes alignments in a format meant for other programs, one line per alignment,
+    # as soon as each of them is given:
+    # cigar: query id, target id, score, positions and the CIGAR string, separated by tabs
+    # jsonl: a JSON object per line
+    # tabular: the columns of BLAST's tabular output, with the raw score in place of the
+    # e-value and the bit score
+    # the query is sequence1 and the target sequence2. in the CIGAR strings, M stands
+    # for a pair of aligned residues, I for a residue of the query aligned with a gap
+    # and D for a residue of the target aligned with a gap.
+
+    FORMATS = ('cigar', 'jsonl', 'tabular')
+
+    # the size of the buffer the lines are collected in before being written
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, f, output_format):
+        self.f = f
+        self.write_line = getattr(self, "write_{}_line".format(output_format))
+        self.number_of_alignments = 0
+
+    @staticmethod
+    def open(path, output_format):
+        # a writer to the file at path, or to the standard output if path is None
+        if path is None:
+            return AlignmentWriter(sys.stdout, output_format)
+        return AlignmentWriter(open(path, "w", encoding="utf-8", buffering = AlignmentWriter.BUFFER_SIZE), output_format)
+
+    def close(self):
+        if self.f is sys.stdout:
+            self.f.flush()
+        else:
+            self.f.close()
+
+    def write(self, query_id, target_id, result):
+        # result is an AlignmentResult
+        self.number_of_alignments += 1
+        self.write_line(query_id, target_id, result)
+
+    def write_cigar_line(self, query_id, target_id, result):
+        self.f.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(query_id, target_id, result.score, *result.get_positions(),
+                                                                 result.get_cigar()))
+
+    def write_jsonl_line(self, query_id, target_id, result):
+        query_start, query_end, target_start, target_end = result.get_positions()
+        self.f.write(json.dumps({
+            'query': query_id,
+            'target': target_id,
+            'score': result.score,
+            'identity': result.get_percent_identity(),
+            'length': result.get_length(),
+            'mismatches': result.get_mismatches(),
+            'gaps': result.get_number_of_gaps(),
+            'query_start': query_start,
+            'query_end': query_end,
+            'target_start': target_start,
+            'target_end': target_end,
+            'cigar': result.get_cigar(),
+        }) + "\n")
+
+    def write_tabular_line(self, query_id, target_id, result):
+        # query id, target id, percent identity, alignment length, mismatches, gap openings,
+        # query start, query end, target start, target end, raw score
+        self.f.write("{}\t{}\t{:.2f}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+            query_id, target_id, result.get_percent_identity(), result.get_length(), result.get_mismatches(),
+            result.get_number_of_gaps(), *result.get_positions(), result.score))
 
 class Main:
     def __init__(self, args, DEBUG):
         self.DEBUG = DEBUG
         self.args = args
-        input_path, alignment_type, scoring_matrix_path, gap_opening_penalty, gap_extension_penalty, output_path = self.check_args(args)
+        input_path, alignment_type, scoring_matrix_path, gap_opening_penalty, gap_extension_penalty, optional_values = self.check_args(args)
+        output_path = optional_values["--output"]
+        engine = optional_values["--engine"] or 'python'
+        linear_space_threshold = optional_values["--linear-space-threshold"] or AlignmentProcessor.DEFAULT_LINEAR_SPACE_THRESHOLD
+        score_only = optional_values["--score-only"]
+        targets_path = optional_values["--targets"]
+        workers = optional_values["--workers"]
+        all_vs_all = optional_values["--all-vs-all"]
+        unordered = optional_values["--unordered"]
+        band_width = optional_values["--band-width"]
+        statistics_format = optional_values["--stats"]
+        max_alignments = optional_values["--max-alignments"]
+        top_alignments = optional_values["--top"]
+        cache_path = optional_values["--cache"]
+        search_path = optional_values["--search"]
+        seed = optional_values["--seed"] or SeedIndex.DEFAULT_SEED
+        search_settings = {'x_drop_ungapped': optional_values["--x-drop-ungapped"],
+                           'ungapped_cutoff': optional_values["--ungapped-cutoff"],
+                           'x_drop_gapped': optional_values["--x-drop-gapped"],
+                           'minimum_score': optional_values["--minimum-score"]}
+        tile_size = optional_values["--tile-size"]
+        memory_budget = optional_values["--memory-budget"]
+        output_format = optional_values["--format"] or 'text'
+        shuffles = optional_values["--significance"]
+        batch = all_vs_all or targets_path is not None
         initial_error = False
         output_file = False
 
@@ -434,8 +3295,162 @@ class Main:
                 initial_error = True
         gap_opening_penalty, gap_extension_penalty = numbers
 
+        try:
+            linear_space_threshold = int(linear_space_threshold)
+            if linear_space_threshold < 0:
+                print ("\nLinear space threshold cannot be negative!")
+                initial_error = True
+        except ValueError:
+            print ("\nInvalid value for linear space threshold!: '{}'".format(linear_space_threshold))
+            initial_error = True
+
+        if workers is not None:
+            try:
+                workers = int(workers)
+                if workers < 1:
+                    print ("\nNumber of workers must be positive!")
+                    initial_error = True
+            except ValueError:
+                print ("\nInvalid value for number of workers!: '{}'".format(workers))
+                initial_error = True
+
+        if band_width is not None and band_width != 'auto':
+            try:
+                band_width = int(band_width)
+                if band_width < 0:
+                    print ("\nBand width cannot be negative!")
+                    initial_error = True
+            except ValueError:
+                print ("\nInvalid value for band width!: '{}'\nBand width can be either a number or auto".format(band_width))
+                initial_error = True
+        if band_width is not None and score_only:
+            print ("\n--band-width cannot be used together with --score-only!")
+            initial_error = True
+
+        if max_alignments is not None:
+            try:
+                max_alignments = int(max_alignments)
+                if max_alignments < 1:
+                    print ("\nMaximum number of alignments must be positive!")
+                    initial_error = True
+            except ValueError:
+                print ("\nInvalid value for maximum number of alignments!: '{}'".format(max_alignments))
+                initial_error = True
+
+        if top_alignments is not None:
+            try:
+                top_alignments = int(top_alignments)
+                if top_alignments < 1:
+                    print ("\nNumber of top alignments must be positive!")
+                    initial_error = True
+            except ValueError:
+                print ("\nInvalid value for number of top alignments!: '{}'".format(top_alignments))
+                initial_error = True
+
+            if alignment_type != 'local':
+                print ("\n--top can only be used with local alignment!")
+                initial_error = True
+            if batch or score_only or band_width is not None:
+                print ("\n--top cannot be used together with --targets, --all-vs-all, --score-only or --band-width!")
+                initial_error = True
+
+        if search_path is not None:
+            if alignment_type != 'local':
+                print ("\n--search can only be used with local alignment!")
+                initial_error = True
+            if batch or score_only or band_width is not None or top_alignments is not None:
+                print ("\n--search cannot be used together with --targets, --all-vs-all, --score-only, --band-width or --top!")
+                initial_error = True
+        if seed != SeedIndex.DEFAULT_SEED and search_path is None:
+            print ("\n--seed can only be used with --search!")
+            initial_error = True
+        for name in list(search_settings):
+            marker = "--" + name.replace('_', '-')
+            value = search_settings[name]
+            if value is None: # the default of SeedSearch
+                del search_settings[name]
+                continue
+            if search_path is None:
+                print ("\n{} can only be used with --search!".format(marker))
+                initial_error = True
+            try:
+                search_settings[name] = int(value)
+                if search_settings[name] < 0:
+                    print ("\n{} cannot be negative!".format(marker))
+                    initial_error = True
+            except ValueError:
+                print ("\nInvalid value for {}!: '{}'".format(marker, value))
+                initial_error = True
+
+        if tile_size is not None:
+            try:
+                tile_size = int(tile_size)
+                if tile_size < 1:
+                    print ("\nTile size must be positive!")
+                    initial_error = True
+            except ValueError:
+                print ("\nInvalid value for tile size!: '{}'".format(tile_size))
+                initial_error = True
+            if batch or score_only or band_width is not None or top_alignments is not None or search_path is not None:
+                print ("\n--tile-size cannot be used together with --targets, --all-vs-all, --score-only, --band-width, --top or --search!")
+                initial_error = True
+        elif workers is not None and not batch and shuffles is None:
+            print ("\n--workers can only be used with --targets, --all-vs-all, --tile-size or --significance!")
+            initial_error = True
+
+        if shuffles is not None:
+            try:
+                shuffles = int(shuffles)
+                if shuffles < 2:
+                    print ("\nNumber of shuffles must be at least 2!")
+                    initial_error = True
+            except ValueError:
+                print ("\nInvalid value for number of shuffles!: '{}'".format(shuffles))
+                initial_error = True
+
+            if alignment_type != 'local':
+                print ("\n--significance can only be used with local alignment!")
+                initial_error = True
+            if batch or search_path is not None:
+                print ("\n--significance cannot be used together with --targets, --all-vs-all or --search!")
+                initial_error = True
+
+        if memory_budget is not None:
+            try:
+                memory_budget = int(float(memory_budget) * 2 ** 20) # given in megabytes
+                if memory_budget < 0:
+                    print ("\nMemory budget cannot be negative!")
+                    initial_error = True
+            except ValueError:
+                print ("\nInvalid value for memory budget!: '{}'".format(memory_budget))
+                initial_error = True
+
+        if output_format not in ('text',) + AlignmentWriter.FORMATS:
+            print ('\nInvalid value for format!: {}\nFormat can be either text, cigar, jsonl or tabular'.format(output_format))
+            initial_error = True
+        elif output_format != 'text' and score_only:
+            print ("\n--format can only be text with --score-only!")
+            initial_error = True
+
+        if statistics_format not in (None, 'text', 'json'):
+            print ('\nInvalid value for stats!: {}\nStats can be either text or json'.format(statistics_format))
+            initial_error = True
+
+        if all_vs_all and targets_path is not None:
+            print ("\n--all-vs-all cannot be used together with --targets!")
+            initial_error = True
+
+        if not os.path.exists(scoring_matrix_path) and ScoringMatrixFileReader.get_built_in_path(scoring_matrix_path) is not None:
+            scoring_matrix_path = ScoringMatrixFileReader.get_built_in_path(scoring_matrix_path)
+
         paths = [input_path, scoring_matrix_path]
         path_names = ('input path', 'scoring matrix path')
+        if targets_path is not None:
+            paths.append(targets_path)
+            path_names += ('targets path',)
+        if search_path is not None:
+            paths.append(search_path)
+            path_names += ('search path',)
         for i in range(len(paths)):
             name = path_names[i]
             paths[i] = os.path.abspath(paths[i])
@@ -443,12 +3458,27 @@ class Main:
             if not os.path.exists(path):
                 print ("\nThe path given for {} does not exist!: {}".format(name, path))
                 initial_error = True
-        input_path, scoring_matrix_path = paths
+        input_path, scoring_matrix_path = paths[:2]
+        if targets_path is not None:
+            targets_path = paths[2]
+        if search_path is not None:
+            search_path = paths[-1]
 
         if alignment_type not in ('local', 'global'):
             print ('\nInvalid value for alignment type!: {}\nAlignment type can be either local or global'.format(alignment_type))
             initial_error = True
 
+        if engine not in ('python', 'numpy'):
+            print ('\nInvalid value for engine!: {}\nEngine can be either python or numpy'.format(engine))
+            initial_error = True
+        elif engine == 'numpy' and np is None:
+            print ('\nThe numpy engine requires NumPy to be installed!')
+            initial_error = True
+
+        if score_only and output_path is not None:
+            print ("\n--score-only cannot be used together with --output!")
+            initial_error = True
+
         if output_path is not None and os.path.exists(output_path):
             print ("\nThe specified output path already exists!: '{}'\nPlease specify a non-existing output path.".format(output_path))
             initial_error = True
@@ -466,72 +3496,359 @@ class Main:
             output_path = os.path.abspath(output_path)           
 
 
-        sequence1, sequence2 = self.read_input(input_path)
-        if self.DEBUG:
-            print (sequence1, sequence2)
+        self.statistics = None
+        if statistics_format is not None:
+            self.statistics = AlignmentStatistics()
+            self.statistics.start_phase('total')
+
+        cache = None
+        if cache_path is not None:
+            cache = AlignmentResultCache(os.path.abspath(cache_path))
+            try:
+                cache.connect()
+            except sqlite3.Error as e:
+                print ("\nCannot use the path {} as the result cache!\nError!: {}".format(cache_path, str(e)))
+                sys.exit()
 
+        self.start_phase('read scoring matrix')
         score_matrix_file_reader = ScoringMatrixFileReader(scoring_matrix_path)
         scoring_matrix = score_matrix_file_reader.read_matrix()
+        self.end_phase('read scoring matrix')
 
-        alignment_processor = AlignmentProcessor(sequence1, sequence2, alignment_type,
-                                                    scoring_matrix, gap_opening_penalty,
-                                                    gap_extension_penalty, self.DEBUG)
+        if search_path is not None:
+            self.start_phase('read input')
+            query_id, query = next(SequenceFileReader(input_path).read_records()) # the first sequence
+            self.end_phase('read input')
 
-        aligned_sequences, match_strings, raw_alignment_scores, percent_identities = alignment_processor.align()
+            try:
+                seed_index = SeedIndex(search_path, seed)
+                self.start_phase('seed index')
+                seed_index.load()
+                self.end_phase('seed index')
+                seed_search = SeedSearch(seed_index, scoring_matrix, gap_opening_penalty, gap_extension_penalty,
+                                         engine, statistics = self.statistics, **search_settings)
+                results = seed_search.search(query)
+            except (ValueError, OSError) as e:
+                print ("\n{}".format(e))
+                sys.exit()
+            for target_id, error in seed_search.skipped_targets:
+                # written to the standard error, so that it does not break the format. the error names the sequence.
+                print (error, file = sys.stderr)
+
+            self.start_phase('output')
+            if output_format == 'text':
+                self.report_search_results(results, output_path)
+            else:
+                self.write_search_results(results, query_id, output_path, output_format)
+            self.end_phase('output')
+
+        elif batch:
+            queries = list(SequenceFileReader(input_path).read_records())
+            targets = None if all_vs_all else SequenceFileReader(targets_path).read_records()
+            batch_alignment_processor = BatchAlignmentProcessor(queries, targets, alignment_type, scoring_matrix,
+                                                                gap_opening_penalty, gap_extension_penalty,
+                                                                engine, linear_space_threshold, score_only,
+                                                                workers, ordered = not unordered, band_width = band_width,
+                                                                statistics = self.statistics, max_alignments = max_alignments,
+                                                                cache = cache, memory_budget = memory_budget)
+            try:
+                if output_format == 'text':
+                    self.report_batch_results(batch_alignment_processor.align(), alignment_type, score_only, output_path)
+                else:
+                    self.write_batch_results(batch_alignment_processor.align(), output_path, output_format)
+            except ValueError as e:
+                print ("\n{}".format(e))
+                sys.exit()
 
-        # The first part of the output
-        if not output_file:
-            for i in range(len(aligned_sequences)):
-                print (aligned_sequences[i][0])
-                print (match_strings[i])
-                print (aligned_sequences[i][1])
-                print ("Raw alignment score: {}".format(raw_alignment_scores[i]))
-                print ("The percent identity between two aligned sequences: {}%".format(percent_identities[i]))
+        else:
+            self.start_phase('read input')
+            (id1, sequence1), (id2, sequence2) = self.read_input(input_path)
+            self.end_phase('read input')
+            if self.DEBUG:
+                print (sequence1, sequence2)
 
-                if i != len(aligned_sequences) - 1:
-                    print ("\n\n")
+            try:
+                alignment_processor = AlignmentProcessor(sequence1, sequence2, alignment_type,
+                                                            scoring_matrix, gap_opening_penalty,
+                                                            gap_extension_penalty, self.DEBUG, engine,
+                                                            linear_space_threshold, band_width, self.statistics,
+                                                            max_alignments, top_alignments, cache, tile_size, workers,
+                                                            memory_budget)
+            except ValueError as e:
+                print ("\n{}".format(e))
+                sys.exit()
+
+            if score_only:
+                self.print_score(alignment_processor.calculate_score(), alignment_type)
+                if alignment_processor.get_algorithm() == 'linear space':
+                    self.print_linear_space_note()
+            else:
+                try:
+                    results = alignment_processor.align()
+                except OSError as e:
+                    print ("\nCannot keep the alignment matrices in a temporary file!\nError!: {}".format(e))
+                    sys.exit()
+
+                self.start_phase('output')
+                # The first part of the output
+                # the positions are reported only for the top alignments
+                show_positions = top_alignments is not None
+                if output_format != 'text':
+                    writer = AlignmentWriter.open(output_path, output_format)
+                    try:
+                        for result in results:
+                            writer.write(id1, id2, result)
+                    finally:
+                        writer.close()
+                    if output_file:
+                        print ("The alignment output has been recorded to the following path: {}".format(output_path))
+
+                elif not output_file:
+                    self.print_alignments(results, show_positions)
 
+                else:
+                    with open(output_path, "w", encoding="utf-8") as f:
+                        self.write_alignments(f, results)
+                    print ("The alignment output has been recorded to the following path: {}".format(output_path))
+                    if len(results) > 1:
+                        print ("There were more than 1 results. The results given below belong to the alignments recorded in the output file in the same order.")
+                    
+                    self.print_scores(results, show_positions)
+                self.end_phase('output')
+
+                if alignment_processor.band_edge_reached:
+                    # written to the standard error if the alignments are written to the standard output in another format
+                    print ("\nThe alignment reached the edge of the band. A better alignment may be found with a wider band.",
+                           file = sys.stdout if output_format == 'text' or output_file else sys.stderr)
+                if alignment_processor.get_algorithm() == 'linear space':
+                    self.print_linear_space_note(sys.stdout if output_format == 'text' or output_file else sys.stderr)
+
+            if shuffles is not None:
+                self.start_phase('significance')
+                significance_test = SignificanceTest(sequence1, sequence2, scoring_matrix, gap_opening_penalty,
+                                                     gap_extension_penalty, shuffles, engine, workers,
+                                                     statistics = self.statistics)
+                # written to the standard error if the alignments are written to the standard output in another format
+                self.print_significance(significance_test.run(),
+                                        sys.stdout if output_format == 'text' or output_file else sys.stderr)
+                self.end_phase('significance')
+
+        if cache is not None:
+            cache.close()
+
+        if self.statistics is not None:
+            self.statistics.end_phase('total')
+            # written to the standard error, so that they do not mix with the results
+            if statistics_format == 'json':
+                print (self.statistics.format_json(), file = sys.stderr)
+            else:
+                print ("\n" + self.statistics.format_text(), file = sys.stderr)
+
+    def start_phase(self, phase):
+        if self.statistics is not None:
+            self.statistics.start_phase(phase)
+
+    def end_phase(self, phase):
+        if self.statistics is not None:
+            self.statistics.end_phase(phase)
+
+    def print_alignments(self, results, show_positions = False):
+        if not results:
+            print ("No local alignment with a positive score exists.")
+        for i in range(len(results)):
+            if show_positions:
+                self.print_positions(i, results[i].get_positions())
+            top_line, bottom_line = results[i].get_aligned_sequences()
+            print (top_line)
+            print (results[i].get_match_string())
+            print (bottom_line)
+            print ("Raw alignment score: {}".format(results[i].score))
+            print ("The percent identity between two aligned sequences: {}%".format(results[i].get_percent_identity()))
+
+            if i != len(results) - 1:
+                print ("\n\n")
+
+    def write_alignments(self, f, results):
+        for i in range(len(results)):
+            top_line, bottom_line = results[i].get_aligned_sequences()
+            f.write(top_line + "\n")
+            f.write(results[i].get_match_string() + "\n")
+            f.write(bottom_line + "\n")
+            if i != len(results) - 1:
+                f.write("\n\n")
+
+    def print_scores(self, results, show_positions = False):
+        if not results:
+            print ("No local alignment with a positive score exists.")
+        for i in range(len(results)):
+            if show_positions:
+                self.print_positions(i, results[i].get_positions())
+            # The second part of the output
+            print ("Raw alignment score: {}".format(results[i].score))
+            # The third part of the output
+            print ("The percent identity between two aligned sequences: {}%".format(results[i].get_percent_identity()))
+
+            if i != len(results) - 1:
+                print ("\n\n")
+
+    def print_positions(self, i, positions):
+        print ("Alignment {}: positions {}-{} of sequence1 and {}-{} of sequence2".format(i + 1, *positions))
+
+    def print_linear_space_note(self, f = sys.stdout, number_of_pairs = None):
+        # the linear space algorithm optimizes the affine gap penalties, unlike the matrix fill
+        explanation = "the linear space algorithm, which finds an optimal alignment under the affine gap penalties and may score higher than the matrix fill used below --linear-space-threshold cells"
+        if number_of_pairs is None:
+            print ("\nThe alignment was computed with {}.".format(explanation), file = f)
         else:
-            with open(output_path, "w", encoding="utf-8") as f:
-                for i in range(len(aligned_sequences)):
-                    f.write(aligned_sequences[i][0] + "\n")
-                    f.write(match_strings[i] + "\n")
-                    f.write(aligned_sequences[i][1] + "\n")
-                    if i != len(aligned_sequences) - 1:
+            print ("\nPairs aligned with {}: {}".format(explanation, number_of_pairs), file = f)
+
+    def print_score(self, score_and_location, alignment_type):
+        score, (i, j) = score_and_location
+        print ("Raw alignment score: {}".format(score))
+        if alignment_type == 'local':
+            print ("The alignment ends at position {} of sequence1 and position {} of sequence2".format(j, i))
+
+    def print_significance(self, report, f):
+        print ("\nSignificance of the score {} against {} shuffles of sequence2:".format(report['score'], report['shuffles']), file = f)
+        print ("Mean score of the shuffles: {:.2f}, standard deviation: {:.2f}".format(report['mean'], report['standard_deviation']), file = f)
+        if report['z_score'] is None:
+            print ("All the shuffles have the same score; the Z-score and the E-value cannot be estimated.", file = f)
+            return
+        print ("Z-score: {:.2f}".format(report['z_score']), file = f)
+        print ("E-value: {:.3g} (P-value: {:.3g}; extreme value distribution fitted with lambda = {:.4f}, mu = {:.2f})".format(
+            report['e_value'], report['p_value'], report['lambda'], report['mu']), file = f)
+
+    def report_batch_results(self, batch_results, alignment_type, score_only, output_path):
+        f = None
+        if output_path is not None:
+            f = open(output_path, "w", encoding="utf-8")
+
+        try:
+            first = True
+            for query_id, target_id, result, error, algorithm in batch_results:
+                header = "Query {} vs target {}".format(query_id, target_id)
+                if not first:
+                    print ("\n\n")
+                    if f is not None:
                         f.write("\n\n")
-            print ("The alignment output has been recorded to the following path: {}".format(output_path))
-            if len(aligned_sequences) > 1:
-                print ("There were more than 1 results. The results given below belong to the alignments recorded in the output file in the same order.")
-            
-            for i in range(len(aligned_sequences)):
-                # The second part of the output
-                print ("Raw alignment score: {}".format(raw_alignment_scores[i]))
-                # The third part of the output
-                print ("The percent identity between two aligned sequences: {}%".format(percent_identities[i]))
-
-                if i != len(aligned_sequences) - 1:
+                first = False
+
+                print (header)
+                if error is not None:
+                    print (error)
+                    if f is not None:
+                        f.write(header + "\n" + error + "\n")
+                    continue
+                if score_only:
+                    self.print_score(result, alignment_type)
+                elif f is None:
+                    self.print_alignments(result)
+                else:
+                    f.write(header + "\n")
+                    self.write_alignments(f, result)
+                    self.print_scores(result)
+                if algorithm == 'linear space':
+                    self.print_linear_space_note()
+        finally:
+            if f is not None:
+                f.close()
+
+        if f is not None:
+            print ("\nThe alignment output has been recorded to the following path: {}".format(output_path))
+
+    def report_search_results(self, results, output_path):
+        f = None
+        if output_path is not None:
+            f = open(output_path, "w", encoding="utf-8")
+
+        try:
+            if not results:
+                print ("No alignment scoring at least the minimum score was found.")
+            for i in range(len(results)):
+                target_id, result = results[i]
+                header = "Hit {}: {}, positions {}-{} of the query and {}-{} of the sequence".format(i + 1, target_id, *result.get_positions())
+                if i > 0:
                     print ("\n\n")
+                    if f is not None:
+                        f.write("\n\n")
+
+                print (header)
+                if f is None:
+                    self.print_alignments([result])
+                else:
+                    f.write(header + "\n")
+                    self.write_alignments(f, [result])
+                    self.print_scores([result])
+        finally:
+            if f is not None:
+                f.close()
+
+        if f is not None:
+            print ("\nThe alignment output has been recorded to the following path: {}".format(output_path))
+
+    def write_batch_results(self, batch_results, output_path, output_format):
+        # writes every alignment as soon as the alignment of its pair is done
+        writer = AlignmentWriter.open(output_path, output_format)
+        linear_space_pairs = 0
+        try:
+            for query_id, target_id, results, error, algorithm in batch_results:
+                if error is not None:
+                    # written to the standard error, so that it does not break the format
+                    print ("Query {} vs target {}: {}".format(query_id, target_id, error), file = sys.stderr)
+                    continue
+                if algorithm == 'linear space':
+                    linear_space_pairs += 1
+                for result in results:
+                    writer.write(query_id, target_id, result)
+        finally:
+            writer.close()
+
+        if linear_space_pairs > 0:
+            self.print_linear_space_note(sys.stderr, linear_space_pairs)
+
+        if output_path is not None:
+            print ("The alignment output has been recorded to the following path: {}".format(output_path))
+
+    def write_search_results(self, results, query_id, output_path, output_format):
+        writer = AlignmentWriter.open(output_path, output_format)
+        try:
+            for target_id, result in results:
+                writer.write(query_id, target_id, result)
+        finally:
+            writer.close()
+
+        if output_path is not None:
+            print ("The alignment output has been recorded to the following path: {}".format(output_path))
 
     def read_input(self, path):
-        with open(path) as f:
-            content = f.read().strip().splitlines()
-        
-        clear_content = [i for i in content if i.strip()]
+        # returns the first two (id, sequence) records
+        records = SequenceFileReader(path).read_records()
 
-        sequence1 = clear_content[0]
-        sequence2 = clear_content[1]
+        record1 = next(records)
+        record2 = next(records)
 
-        return (sequence1, sequence2)
+        return (record1, record2)
 
     def check_args(self, args):
-        if len(args) != 11 and len(args) != 13:
+        # returns the values of the expected arguments in order, followed by a
+        # dictionary that maps each optional argument marker to its value (None if not given)
+        # and each optional flag to whether it is given.
+        expected_arg_markers = ("--input", "--alignment", "--scoring-matrix", "--gap-opening-penalty", "--gap-extension-penalty")
+        optional_arg_markers = ("--output", "--engine", "--linear-space-threshold", "--targets", "--workers", "--band-width", "--stats", "--max-alignments", "--top", "--cache", "--search", "--seed", "--x-drop-ungapped", "--ungapped-cutoff", "--x-drop-gapped", "--minimum-score", "--tile-size", "--memory-budget", "--format", "--significance")
+        optional_flag_markers = ("--score-only", "--all-vs-all", "--unordered")
+
+        given_optional_markers = [marker for marker in optional_arg_markers if marker in args]
+        given_flag_markers = [marker for marker in optional_flag_markers if marker in args]
+        if len(args) != 1 + 2 * (len(expected_arg_markers) + len(given_optional_markers)) + len(given_flag_markers):
             self.print_usage_and_exit(args)
 
-        expected_arg_markers = ("--input", "--alignment", "--scoring-matrix", "--gap-opening-penalty", "--gap-extension-penalty")
-        optional_output_marker = "--output"
+        for marker in given_flag_markers:
+            if args.count(marker) > 1:
+                self.print_usage_and_exit(args)
+
         arg_markers_indexes = []
         terminate = False
-        for marker in expected_arg_markers:
+        for marker in expected_arg_markers + tuple(given_optional_markers):
             try:
                 index = args.index(marker)
                 arg_markers_indexes.append(index)
@@ -539,34 +3856,32 @@ class Main:
                 terminate = True
                 break
 
-            if index > len(args) - 2 or args.count(marker) > 1:
+            if index > len(args) - 2 or args.count(marker) > 1 or args[index + 1] in optional_flag_markers:
                 terminate = True
                 break
         
         if terminate:
             self.print_usage_and_exit(args)
 
-        if optional_output_marker in args:
-            arg_markers_indexes.append(args.index(optional_output_marker))
-            if arg_markers_indexes[-1] > len(args) - 2:
-                self.print_usage_and_exit(args)
-        else:
-            arg_markers_indexes.append(None)
-
         results = []
 
-        for i in range(len(arg_markers_indexes)):
+        for i in range(len(expected_arg_markers)):
             index = arg_markers_indexes[i]
-            if index is None:
-                results.append(None)
-            else:
-                results.append(args[index + 1])
+            results.append(args[index + 1])
+
+        optional_values = {marker: None for marker in optional_arg_markers}
+        for i in range(len(given_optional_markers)):
+            index = arg_markers_indexes[len(expected_arg_markers) + i]
+            optional_values[given_optional_markers[i]] = args[index + 1]
+        for marker in optional_flag_markers:
+            optional_values[marker] = marker in given_flag_markers
+        results.append(optional_values)
 
         return results
 
     def print_usage(self, args):
         fn = os.path.split(args[0])[1]
-        print ("Usage: python3 {} --input <path to input text file containing amino acid sequences> --alignment <local or global> --scoring-matrix <path to scoring matrix> --gap-opening-penalty <a negative number> --gap-extension-penalty <a negative number> --output <path to output file>\n--output is optional".format(fn))
+        print ("Usage: python3 {} --input <path to input text file containing amino acid sequences> --alignment <local or global> --scoring-matrix <path to scoring matrix or name of a built-in one> --gap-opening-penalty <a negative number> --gap-extension-penalty <a negative number> --output <path to output file> --engine <python or numpy> --linear-space-threshold <number of cells> --score-only --targets <path to text file containing target sequences> --all-vs-all --workers <number of worker processes> --unordered --band-width <number or auto> --stats <text or json> --max-alignments <number> --top <number> --cache <path to result cache database> --search <path to sequence file to search> --seed <pattern of 1s and 0s> --x-drop-ungapped <score> --ungapped-cutoff <score> --x-drop-gapped <score> --minimum-score <score> --tile-size <number of rows and columns> --memory-budget <megabytes> --format <text, cigar, jsonl or tabular> --significance <number of shuffles>\nAll arguments after --gap-extension-penalty are optional\n--score-only cannot be used together with --output\n--targets aligns every sequence in the input file with every sequence in the targets file, --all-vs-all aligns every pair of sequences in the input file\n--x-drop-ungapped, --ungapped-cutoff, --x-drop-gapped and --minimum-score set the extension of the seeds and the lowest score reported by --search\n--tile-size fills the matrix of a single pair in tiles, using --workers processes\n--memory-budget keeps larger alignment matrices in a temporary file\n--format writes one line per alignment in a format other than text (the default)\n--significance estimates the Z-score and the E-value of a local alignment score from shuffles of sequence2, using --workers processes\nBuilt-in scoring matrices: {}".format(fn, ", ".join(ScoringMatrixFileReader.BUILT_IN_SCORING_MATRICES)))
         
     def print_usage_and_exit(self , args):
         self.print_usage(args)
@@ -0,0 +1,268 @@
+import random
+import unittest
+
+from pairwise_sequence_alignment import AlignmentProcessor, ScoringMatrixFileReader
+
+# the alignments of small random pairs, computed in different ways that must agree.
+# the pairs use a few residues only, so that they have co-optimal alignments and gaps.
+
+PROTEIN_RESIDUES = "ARNDCQEGHILKMFPSTWYV"
+GAP_PENALTIES = [(-10, -1), (-5, -2), (-3, -3), (-1, -4), (-2, 0), (0, 0), (-8, -8)]
+
+def random_sequence(rng, residues, max_length = 20):
+    return ''.join(rng.choice(residues) for _ in range(rng.randint(0, max_length)))
+
+def random_pairs(seed, number_of_pairs, residues = PROTEIN_RESIDUES):
+    # (sequence1, sequence2, alignment type, gap opening penalty, gap extension penalty)
+    rng = random.Random(seed)
+    for _ in range(number_of_pairs):
+        alphabet = residues[:rng.randint(1, len(residues))]
+        gap_opening_penalty, gap_extension_penalty = rng.choice(GAP_PENALTIES)
+        yield (random_sequence(rng, alphabet), random_sequence(rng, alphabet), rng.choice(('global', 'local')),
+               gap_opening_penalty, gap_extension_penalty)
+
+def describe(results):
+    # what two computations of the same alignments must agree on
+    return [(result.get_aligned_sequences(), result.start1, result.start2, result.score) for result in results]
+
+class AlignmentTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scoring_matrix = ScoringMatrixFileReader("BLOSUM62").read_matrix()
+
+    def create_processor(self, sequence1, sequence2, alignment_type, gap_opening_penalty, gap_extension_penalty, **options):
+        # the linear space algorithm finds other alignments than the matrix, so it is left out unless asked for
+        options.setdefault('linear_space_threshold', 10 ** 9)
+        return AlignmentProcessor(sequence1, sequence2, alignment_type, self.scoring_matrix,
+                                  gap_opening_penalty, gap_extension_penalty, False, **options)
+
+    def align(self, *pair, **options):
+        return describe(self.create_processor(*pair, **options).align())
+
+class TestEngines(AlignmentTestCase):
+    def test_python_and_numpy_engines_agree(self):
+        for pair in random_pairs(1, 300):
+            with self.subTest(pair = pair):
+                self.assertEqual(self.align(*pair, engine = 'python'), self.align(*pair, engine = 'numpy'))
+
+    def test_engines_agree_on_the_score_only(self):
+        for pair in random_pairs(2, 300):
+            with self.subTest(pair = pair):
+                score, location = self.create_processor(*pair, engine = 'python').calculate_score()
+                self.assertEqual(self.create_processor(*pair, engine = 'numpy').calculate_score(), (score, location))
+                # when opening a gap costs less than extending one, the score of a cell may count
+                # as openings the parts of a gap that the alignment counts as extensions
+                if pair[3] <= pair[4]:
+                    results = self.create_processor(*pair).align()
+                    self.assertEqual(score, results[0].score if results else 0)
+
+    def test_scores_are_those_of_the_alignments(self):
+        # the score counted from the aligned sequences, with a gap of k columns costing
+        # gap_opening_penalty + (k - 1) * gap_extension_penalty, where a gap in a sequence
+        # continues until the next pair of residues
+        for sequence1, sequence2, alignment_type, gap_opening_penalty, gap_extension_penalty in random_pairs(3, 200):
+            processor = self.create_processor(sequence1, sequence2, alignment_type, gap_opening_penalty, gap_extension_penalty)
+            for result in processor.align():
+                aligned_sequence1, aligned_sequence2 = result.get_aligned_sequences()
+                score = 0
+                gaps = set() # the sequences with a gap since the last pair of residues
+                for x, y in zip(aligned_sequence1, aligned_sequence2):
+                    if x == '-' or y == '-':
+                        gap = 1 if x == '-' else 2
+                        score += gap_extension_penalty if gap in gaps else gap_opening_penalty
+                        gaps.add(gap)
+                    else:
+                        score += self.scoring_matrix.get_score_of_pair(x, y)
+                        gaps.clear()
+                self.assertEqual(result.score, score)
+                self.assertEqual(aligned_sequence1.replace('-', ''), result.residues1)
+                self.assertEqual(aligned_sequence2.replace('-', ''), result.residues2)
+                if alignment_type == 'global':
+                    self.assertEqual((result.residues1, result.residues2), (sequence1, sequence2))
+
+class TestModes(AlignmentTestCase):
+    def test_banded_alignment_at_full_width(self):
+        # a band covering the whole matrix gives the alignments of the full matrix
+        for pair in random_pairs(4, 200):
+            band_width = len(pair[0]) + len(pair[1])
+            for engine in ('python', 'numpy'):
+                with self.subTest(pair = pair, engine = engine):
+                    self.assertEqual(self.align(*pair, engine = engine, band_width = band_width),
+                                     self.align(*pair, engine = engine))
+
+    def test_banded_alignment_engines_agree(self):
+        # including the alignments reaching the edge of a narrow band
+        for pair in random_pairs(11, 300):
+            for band_width in (0, 2, 'auto'):
+                with self.subTest(pair = pair, band_width = band_width):
+                    processors = [self.create_processor(*pair, engine = engine, band_width = band_width) for engine in ('python', 'numpy')]
+                    self.assertEqual(*[(describe(processor.align()), processor.band_edge_reached) for processor in processors])
+
+    def test_tiled_alignment(self):
+        for pair in random_pairs(5, 12):
+            expected = self.align(*pair)
+            for tile_size, tile_workers in ((3, 1), (4, 2), (7, 2)):
+                with self.subTest(pair = pair, tile_size = tile_size, tile_workers = tile_workers):
+                    self.assertEqual(self.align(*pair, tile_size = tile_size, tile_workers = tile_workers), expected)
+
+    def test_spilled_matrices(self):
+        # a memory budget of 0 keeps every matrix in a temporary file, filled in strips
+        # of a few rows by the numpy engine
+        for pair in random_pairs(6, 200):
+            for engine in ('python', 'numpy'):
+                with self.subTest(pair = pair, engine = engine):
+                    processor = self.create_processor(*pair, engine = engine, memory_budget = 0)
+                    processor.MINIMUM_STRIP_HEIGHT = 3
+                    self.assertEqual(describe(processor.align()), self.align(*pair, engine = engine))
+                    self.assertIsNone(processor.spill_file)
+
+    def test_top_alignments_in_spilled_matrices(self):
+        for pair in random_pairs(7, 100):
+            pair = (pair[0], pair[1], 'local') + pair[3:]
+            for engine in ('python', 'numpy'):
+                with self.subTest(pair = pair, engine = engine):
+                    self.assertEqual(self.align(*pair, engine = engine, top_alignments = 3, memory_budget = 0),
+                                     self.align(*pair, engine = engine, top_alignments = 3))
+
+    def test_incremental_realign(self):
+        # each new sequence2 is an edit of the previous one, aligned again with the rows
+        # of their common prefix kept
+        rng = random.Random(8)
+        for sequence1, sequence2, alignment_type, gap_opening_penalty, gap_extension_penalty in random_pairs(8, 60):
+            for engine in ('python', 'numpy'):
+                processor = self.create_processor(sequence1, sequence2, alignment_type, gap_opening_penalty,
+                                                  gap_extension_penalty, engine = engine, incremental = True)
+                self.assertEqual(describe(processor.align()), self.align(sequence1, sequence2, alignment_type,
+                                                                         gap_opening_penalty, gap_extension_penalty))
+                new_sequence2 = sequence2
+                for _ in range(4):
+                    position = rng.randint(0, len(new_sequence2))
+                    new_sequence2 = (new_sequence2[:position] + random_sequence(rng, PROTEIN_RESIDUES, 3)
+                                     + new_sequence2[position + rng.randint(0, 3):])
+                    with self.subTest(sequence1 = sequence1, sequence2 = new_sequence2, engine = engine):
+                        self.assertEqual(describe(processor.realign(new_sequence2)),
+                                         self.align(sequence1, new_sequence2, alignment_type,
+                                                    gap_opening_penalty, gap_extension_penalty))
+
+    def test_linear_space_score_only(self):
+        # the score of the linear space algorithm, found without a traceback
+        for sequence1, sequence2, _, gap_opening_penalty, gap_extension_penalty in random_pairs(9, 200):
+            pair = (sequence1, sequence2, 'global', gap_opening_penalty, gap_extension_penalty)
+            if gap_opening_penalty > gap_extension_penalty:
+                continue
+            for engine in ('python', 'numpy'):
+                with self.subTest(pair = pair, engine = engine):
+                    processor = self.create_processor(*pair, engine = engine, linear_space_threshold = 0)
+                    self.assertEqual(processor.get_algorithm(), 'linear space')
+                    self.assertEqual(processor.calculate_score()[0], processor.align()[0].score)
+
+class TestMaxAlignments(AlignmentTestCase):
+    def test_first_co_optimal_alignments(self):
+        # the cap keeps the first of the co-optimal local alignments, in every mode
+        capped_pairs = 0
+        for pair in random_pairs(10, 60, "AW"):
+            pair = (pair[0] * 2, pair[1] * 2, 'local') + pair[3:]
+            expected = self.align(*pair)
+            capped_pairs += len(expected) > 3
+            for options in ({'engine': 'python'}, {'engine': 'numpy'}, {'band_width': len(pair[0]) + len(pair[1])},
+                            {'tile_size': 4, 'tile_workers': 1}, {'memory_budget': 0}):
+                for max_alignments in (1, 2, 3):
+                    with self.subTest(pair = pair, options = options, max_alignments = max_alignments):
+                        self.assertEqual(self.align(*pair, max_alignments = max_alignments, **options),
+                                         expected[:max_alignments])
+        self.assertGreater(capped_pairs, 20)
+
+class TestTopAlignments(AlignmentTestCase):
+    def naive_top_alignments(self, sequence1, sequence2, gap_opening_penalty, gap_extension_penalty, top_alignments):
+        # the method of Waterman and Eggert, filling the whole matrix again after each alignment
+        # with the cells of the alignments found so far set to 0. the cells of an alignment are
+        # those between its first and last cell in each row. returns (start1, start2, aligned
+        # sequences, score) for each alignment.
+        m, n = len(sequence2) + 1, len(sequence1) + 1
+        diagonal, vertical, horizontal, none = (AlignmentProcessor.DIAGONAL_MOVEMENT, AlignmentProcessor.VERTICAL_MOVEMENT,
+                                                AlignmentProcessor.HORIZONTAL_MOVEMENT, AlignmentProcessor.NO_MOVEMENT)
+        blocked = set()
+        alignments = []
+        while len(alignments) < top_alignments:
+            scores = [[0] * n for _ in range(m)]
+            movements = [[none] * n for _ in range(m)]
+            for i in range(1, m):
+                for j in range(1, n):
+                    if (i, j) in blocked:
+                        continue
+                    vertical_score = scores[i - 1][j] + (gap_extension_penalty if movements[i - 1][j] == vertical else gap_opening_penalty)
+                    horizontal_score = scores[i][j - 1] + (gap_extension_penalty if movements[i][j - 1] == horizontal else gap_opening_penalty)
+                    diagonal_score = scores[i - 1][j - 1] + self.scoring_matrix.get_score_of_pair(sequence1[j - 1], sequence2[i - 1])
+                    maximum = max(vertical_score, diagonal_score, horizontal_score)
+                    if maximum >= 0:
+                        scores[i][j] = maximum
+                        movements[i][j] = diagonal if maximum == diagonal_score else vertical if maximum == vertical_score else horizontal
+
+            best_score, end_i, end_j = max((scores[i][j], -i, -j) for i in range(m) for j in range(n))
+            if best_score <= 0:
+                break
+            i, j = -end_i, -end_j
+
+            aligned_sequence1 = aligned_sequence2 = ''
+            columns = {}
+            while i > 0 and j > 0 and scores[i][j] > 0:
+                columns.setdefault(i, []).append(j)
+                movement = movements[i][j]
+                if movement != horizontal:
+                    i -= 1
+                if movement != vertical:
+                    j -= 1
+                aligned_sequence1 = (sequence1[j] if movement != vertical else '-') + aligned_sequence1
+                aligned_sequence2 = (sequence2[i] if movement != horizontal else '-') + aligned_sequence2
+            for row, row_columns in columns.items():
+                blocked.update((row, column) for column in range(min(row_columns), max(row_columns) + 1))
+            alignments.append(((aligned_sequence1, aligned_sequence2), j + 1, i + 1, best_score))
+        return alignments
+
+    def test_top_alignments_against_recomputing_the_matrix(self):
+        for sequence1, sequence2, _, gap_opening_penalty, gap_extension_penalty in random_pairs(10, 150):
+            expected = self.naive_top_alignments(sequence1, sequence2, gap_opening_penalty, gap_extension_penalty, 4)
+            for engine in ('python', 'numpy'):
+                with self.subTest(sequence1 = sequence1, sequence2 = sequence2, engine = engine):
+                    self.assertEqual(self.align(sequence1, sequence2, 'local', gap_opening_penalty, gap_extension_penalty,
+                                                engine = engine, top_alignments = 4), expected)
+
+class TestBitParallelScores(AlignmentTestCase):
+    # global alignment with opening = extension and one match and one mismatch score is
+    # scored with the longest common subsequence or the edit distance
+    def create_nucleotide_matrix(self, match_score, mismatch_score):
+        titles = list("ACGT")
+        matrix = [[match_score if x == y else mismatch_score for y in titles] for x in titles]
+        return ScoringMatrixFileReader().create_scoring_matrix(matrix, titles, titles)
+
+    def check_against_the_matrix(self, scoring_matrix, gap_penalty, expected_scheme, seed):
+        # the scores of the pairs of residues that do not occur in the sequences do not
+        # matter, but a pair without any common residue has no match score to go by
+        rng = random.Random(seed)
+        bit_parallel_scores = 0
+        for _ in range(200):
+            sequence1 = random_sequence(rng, "ACGT", 30)
+            sequence2 = random_sequence(rng, "ACGT", 30)
+            for engine in ('python', 'numpy'):
+                with self.subTest(sequence1 = sequence1, sequence2 = sequence2, engine = engine):
+                    processor = AlignmentProcessor(sequence1, sequence2, 'global', scoring_matrix, gap_penalty, gap_penalty,
+                                                   False, engine = engine, linear_space_threshold = 10 ** 9)
+                    scheme = processor.get_bit_parallel_scheme()
+                    if set(sequence1) & set(sequence2):
+                        self.assertEqual(scheme[0], expected_scheme)
+                        bit_parallel_scores += 1
+                    self.assertEqual(processor.calculate_score(), processor.calculate_score_python())
+        self.assertGreater(bit_parallel_scores, 300)
+
+    def test_longest_common_subsequence(self):
+        nucleotide_matrix = ScoringMatrixFileReader("NUC.4.4").read_matrix()
+        self.check_against_the_matrix(nucleotide_matrix, -2, 'lcs', 11)
+        self.check_against_the_matrix(self.create_nucleotide_matrix(1, -3), -1, 'lcs', 12)
+        self.check_against_the_matrix(self.create_nucleotide_matrix(-1, -5), -1, 'lcs', 13)
+
+    def test_edit_distance(self):
+        self.check_against_the_matrix(self.create_nucleotide_matrix(2, 0), -1, 'edit distance', 14)
+        self.check_against_the_matrix(self.create_nucleotide_matrix(0, -1), -1, 'edit distance', 15)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import itertools
+import unittest
+
+from pairwise_sequence_alignment import AlignmentResult
+
+from tests.test_alignment import AlignmentTestCase, describe, random_pairs
+
+# the values counted when an alignment is traced back, against those read from its aligned sequences
+
+class TestAlignmentResult(AlignmentTestCase):
+    def results(self, seed):
+        for pair in random_pairs(seed, 200):
+            for result in self.create_processor(*pair).align():
+                yield pair, result
+
+    def test_summary(self):
+        for (sequence1, sequence2, _, gap_opening_penalty, gap_extension_penalty), result in self.results(50):
+            top_line, bottom_line = result.get_aligned_sequences()
+            with self.subTest(top_line = top_line, bottom_line = bottom_line):
+                self.assertEqual(len(top_line), result.get_length())
+                self.assertEqual(len(bottom_line), result.get_length())
+                self.assertEqual(result.get_match_string(), "".join('|' if x == y else ' ' for x, y in zip(top_line, bottom_line)))
+                self.assertEqual(result.matches, result.get_match_string().count('|'))
+                self.assertEqual(result.get_mismatches(), sum(x != y and '-' not in (x, y) for x, y in zip(top_line, bottom_line)))
+
+                start1, end1, start2, end2 = result.get_positions()
+                self.assertEqual(top_line.replace('-', ''), sequence1[start1 - 1:end1])
+                self.assertEqual(bottom_line.replace('-', ''), sequence2[start2 - 1:end2])
+
+                # a run of gaps in one of the sequences is one gap, opened once
+                gaps = [key for key, run in itertools.groupby(zip(top_line, bottom_line), lambda pair: '-' if pair[0] == '-' else
+                                                              '+' if pair[1] == '-' else ' ') if key != ' ']
+                self.assertEqual(result.get_number_of_gaps(), len(gaps))
+                self.assertEqual(result.gap_openings + result.gap_extensions, top_line.count('-') + bottom_line.count('-'))
+
+                expected_identity = round(result.matches * 100 / result.get_length(), 4) if result.get_length() else 0.0
+                self.assertAlmostEqual(result.get_percent_identity(), expected_identity)
+
+    def test_cigar_round_trip(self):
+        for (sequence1, sequence2, *_), result in self.results(51):
+            with self.subTest(sequence1 = sequence1, sequence2 = sequence2, cigar = result.get_cigar()):
+                copy = AlignmentResult.from_cigar(sequence1, sequence2, result.start1, result.start2, result.get_cigar(),
+                                                  result.score, result.matches, result.gap_openings, result.gap_extensions)
+                self.assertEqual(describe([copy]), describe([result]))
+                self.assertEqual((copy.path, copy.residues1, copy.residues2), (result.path, result.residues1, result.residues2))
+                self.assertEqual(copy.get_cigar(), result.get_cigar())
+
+    def test_cigar(self):
+        result = AlignmentResult.from_cigar("HEAGAWGHEE", "PAWHEAE", 5, 2, "2M1I2M1D1M", 25, 5, 2, 0)
+        self.assertEqual(result.get_aligned_sequences(), ("AWGHE-E", "AW-HEAE"))
+        self.assertEqual(result.get_positions(), (5, 10, 2, 7))
+        self.assertEqual(AlignmentResult.from_cigar("A", "", 1, 1, "", 0, 0, 0, 0).get_aligned_sequences(), ("", ""))
+
+    def test_slots(self):
+        result = AlignmentResult.from_cigar("HEAGAWGHEE", "PAWHEAE", 5, 2, "2M1I2M1D1M", 25, 5, 2, 0)
+        with self.assertRaises(AttributeError):
+            result.comment = "no other attributes"
+
+if __name__ == '__main__':
+    unittest.main()
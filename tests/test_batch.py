@@ -0,0 +1,92 @@
+import random
+import unittest
+
+from pairwise_sequence_alignment import AlignmentProcessor, AlignmentStatistics, BatchAlignmentProcessor, ScoringMatrixFileReader
+
+from tests.test_alignment import PROTEIN_RESIDUES, describe, random_sequence
+
+# the pairs of a batch are aligned as AlignmentProcessor aligns them one by one, whatever
+# the number of workers and the order the results are collected in
+
+def random_records(seed, prefix, number_of_records):
+    rng = random.Random(seed)
+    return [("{}{}".format(prefix, k + 1), random_sequence(rng, PROTEIN_RESIDUES, 30)) for k in range(number_of_records)]
+
+class TestBatchAlignment(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scoring_matrix = ScoringMatrixFileReader("BLOSUM62").read_matrix()
+        cls.queries = random_records(1, "q", 3)
+        cls.targets = random_records(2, "t", 4)
+
+    def create_batch(self, queries, targets, alignment_type = 'local', **options):
+        return BatchAlignmentProcessor(queries, targets, alignment_type, self.scoring_matrix, -10, -1, **options)
+
+    def expected_results(self, pairs, alignment_type = 'local', score_only = False):
+        results = []
+        for query_id, query, target_id, target in pairs:
+            processor = AlignmentProcessor(query, target, alignment_type, self.scoring_matrix, -10, -1, False)
+            result = processor.calculate_score() if score_only else describe(processor.align())
+            results.append((query_id, target_id, result, None, 'matrix'))
+        return results
+
+    def collect(self, batch):
+        return [(query_id, target_id, result if isinstance(result, tuple) else describe(result), error, algorithm)
+                for query_id, target_id, result, error, algorithm in batch.align()]
+
+    def test_one_vs_many(self):
+        # target by target, every query in turn
+        pairs = [query + target for target in self.targets for query in self.queries]
+        for workers in (1, 2):
+            for alignment_type in ('global', 'local'):
+                with self.subTest(workers = workers, alignment_type = alignment_type):
+                    batch = self.create_batch(self.queries, self.targets, alignment_type, workers = workers)
+                    self.assertEqual(self.collect(batch), self.expected_results(pairs, alignment_type))
+
+    def test_all_vs_all(self):
+        records = self.queries + self.targets
+        pairs = [records[i] + records[j] for i in range(len(records)) for j in range(i + 1, len(records))]
+        batch = self.create_batch(records, None, workers = 2, chunk_size = 3)
+        self.assertEqual(batch.get_number_of_pairs(), len(pairs))
+        self.assertEqual(self.collect(batch), self.expected_results(pairs))
+
+    def test_unordered_results_and_targets_read_once(self):
+        # the targets are not counted in advance when they are read from an iterator
+        pairs = [query + target for target in self.targets for query in self.queries]
+        batch = self.create_batch(self.queries, iter(self.targets), workers = 2, ordered = False)
+        self.assertIsNone(batch.get_number_of_pairs())
+        self.assertEqual(sorted(self.collect(batch)), sorted(self.expected_results(pairs)))
+
+    def test_score_only(self):
+        pairs = [query + target for target in self.targets for query in self.queries]
+        batch = self.create_batch(self.queries, self.targets, 'global', score_only = True, workers = 2)
+        self.assertEqual(self.collect(batch), self.expected_results(pairs, 'global', score_only = True))
+
+    def test_pairs_that_cannot_be_aligned(self):
+        # U is not in BLOSUM62: the pairs with t2 fail with an error naming it, the others are aligned
+        targets = [("t1", "HEAGAWGHEE"), ("t2", "MKUAW"), ("t3", "PAWHEAE")]
+        queries = [("q1", "HEAGAWGHEE"), ("q2", "PAWHEAE")]
+        for workers in (1, 2):
+            with self.subTest(workers = workers):
+                results = list(self.create_batch(queries, targets, workers = workers, chunk_size = 6).align())
+                self.assertEqual([(query_id, target_id) for query_id, target_id, *_ in results],
+                                 [(query_id, target_id) for target_id, _ in targets for query_id, _ in queries])
+                for query_id, target_id, result, error, algorithm in results:
+                    if target_id == "t2":
+                        self.assertIsNone(result)
+                        self.assertIsNone(algorithm)
+                        self.assertEqual(error, "Unknown residue 'U' at position 3 of target t2!")
+                    else:
+                        self.assertIsNone(error)
+                        self.assertTrue(result)
+
+    def test_statistics_are_merged(self):
+        statistics = AlignmentStatistics()
+        batch = self.create_batch(self.queries, self.targets, 'global', workers = 2, statistics = statistics)
+        list(batch.align())
+        self.assertEqual(statistics.counters['pairs'], len(self.queries) * len(self.targets))
+        self.assertEqual(statistics.counters['cells'], sum(len(query) * len(target) for _, query in self.queries
+                                                           for _, target in self.targets))
+
+if __name__ == '__main__':
+    unittest.main()
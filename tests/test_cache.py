@@ -0,0 +1,98 @@
+import itertools
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+from pairwise_sequence_alignment import AlignmentResultCache, AlignmentStatistics, ScoringMatrixFileReader
+
+from tests.test_alignment import AlignmentTestCase, describe, random_pairs
+
+class TestAlignmentResultCache(AlignmentTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = self.create_cache()
+
+    def create_cache(self, **options):
+        cache = AlignmentResultCache(os.path.join(self.directory.name, "cache.sqlite"), **options)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_cached_results(self):
+        # read back as they were computed, whatever the engine reading them
+        for pair in random_pairs(20, 100):
+            for band_width in (None, 2):
+                with self.subTest(pair = pair, band_width = band_width):
+                    computing, reading = [self.create_processor(*pair, engine = engine, band_width = band_width, cache = self.cache)
+                                          for engine in ('python', 'numpy')]
+                    misses = self.cache.misses
+                    self.assertEqual(describe(computing.align()), self.align(*pair, band_width = band_width))
+                    self.assertEqual(self.cache.misses, misses + 1)
+                    self.assertEqual(describe(reading.align()), self.align(*pair, band_width = band_width))
+                    self.assertEqual(reading.band_edge_reached, computing.band_edge_reached)
+                    self.assertEqual(self.cache.misses, misses + 1)
+
+    def test_hits_and_misses(self):
+        statistics = AlignmentStatistics()
+        pair = ("HEAGAWGHEE", "PAWHEAE", 'local', -10, -1)
+        for _ in range(3):
+            self.create_processor(*pair, cache = self.cache, statistics = statistics).align()
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+        self.assertEqual((statistics.counters['cache hits'], statistics.counters['cache misses']), (2, 1))
+        self.assertEqual(self.cache.get_number_of_entries(), 1)
+
+    def test_keys(self):
+        # the same for the settings giving the same results, different for the others
+        pair = ("HEAGAWGHEE", "PAWHEAE", 'local', -10, -1)
+        key = self.create_processor(*pair).get_cache_key()
+        for options in ({'engine': 'numpy'}, {'tile_size': 4}, {'memory_budget': 0}):
+            with self.subTest(options = options):
+                self.assertEqual(self.create_processor(*pair, **options).get_cache_key(), key)
+
+        keys = [key]
+        global_pair = pair[:2] + ('global',) + pair[3:]
+        for other_pair in (("HEAGAWGHEE", "PAWHEAW") + pair[2:], global_pair, pair[:3] + (-8, -1), pair[:4] + (-2,)):
+            keys.append(self.create_processor(*other_pair).get_cache_key())
+        for options in ({'band_width': 2}, {'band_width': 3}, {'max_alignments': 1}, {'top_alignments': 2}):
+            keys.append(self.create_processor(*pair, **options).get_cache_key())
+        keys.append(self.create_processor(*global_pair, linear_space_threshold = 0).get_cache_key())
+        processor = self.create_processor(*pair)
+        processor.scoring_matrix = ScoringMatrixFileReader("BLOSUM50").read_matrix()
+        keys.append(processor.get_cache_key())
+        self.assertEqual(len(set(keys)), len(keys))
+
+    def test_least_recently_used_results_are_removed(self):
+        cache = self.create_cache(max_entries = 3)
+        cache.EVICTION_INTERVAL = 1
+        # a distinct time for every use
+        with mock.patch('time.time', side_effect = itertools.count(1)):
+            for key in ("a", "b", "c"):
+                cache.put(key, key)
+            self.assertEqual(cache.get("a"), "a")
+            cache.put("d", "d")
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual([cache.get(key) for key in ("a", "c", "d")], ["a", "c", "d"])
+        self.assertEqual(cache.get_number_of_entries(), 3)
+
+    def test_results_are_removed_when_closed(self):
+        # the results stored since the last check, fewer than EVICTION_INTERVAL
+        cache = self.create_cache(max_entries = 3)
+        with mock.patch('time.time', side_effect = itertools.count(1)):
+            for key in range(5):
+                cache.put(str(key), key)
+        self.assertEqual(cache.get_number_of_entries(), 5)
+        cache.close()
+        self.assertEqual(cache.get_number_of_entries(), 3)
+        self.assertEqual([cache.get(str(key)) for key in range(5)], [None, None, 2, 3, 4])
+
+    def test_sent_without_the_connection(self):
+        self.cache.put("a", [1, 2])
+        copy = pickle.loads(pickle.dumps(self.cache))
+        self.assertIsNone(copy.connection)
+        self.assertEqual(copy.get("a"), [1, 2])
+        copy.close()
+
+if __name__ == '__main__':
+    unittest.main()
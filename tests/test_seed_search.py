@@ -0,0 +1,146 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from pairwise_sequence_alignment import AlignmentProcessor, AlignmentStatistics, ScoringMatrixFileReader, SeedIndex, SeedSearch
+
+from tests.test_alignment import PROTEIN_RESIDUES
+
+# a database of random sequences, some of which hold a copy of a part of the query
+
+def random_protein(rng, length):
+    return ''.join(rng.choice(PROTEIN_RESIDUES) for _ in range(length))
+
+class SeedTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scoring_matrix = ScoringMatrixFileReader("BLOSUM62").read_matrix()
+        rng = random.Random(40)
+        cls.query = random_protein(rng, 200)
+        cls.records = []
+        for k in range(12):
+            sequence = random_protein(rng, rng.randint(50, 150))
+            if k % 4 == 1:
+                sequence = sequence[:20] + cls.query[40 + k:100 + k] + sequence[20:]
+            cls.records.append(("t{}".format(k), sequence))
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch.dict(os.environ, {"PAIRWISE_ALIGNMENT_CACHE_DIR": os.path.join(self.directory.name, "cache")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = self.write_records(self.records)
+
+    def write_records(self, records):
+        # a FASTA file with sequences spanning several lines
+        path = os.path.join(self.directory.name, "database.fa")
+        with open(path, "w") as f:
+            for record_id, sequence in records:
+                f.write(">{} description\n".format(record_id))
+                for k in range(0, len(sequence), 60):
+                    f.write(sequence[k:k + 60] + "\n")
+        return path
+
+    def load_index(self, seed = SeedIndex.DEFAULT_SEED):
+        seed_index = SeedIndex(self.path, seed)
+        seed_index.load()
+        return seed_index
+
+class TestSeedIndex(SeedTestCase):
+    def test_invalid_seeds(self):
+        for seed in ("", "0110", "1102", "110"):
+            with self.subTest(seed = seed):
+                with self.assertRaises(ValueError):
+                    SeedIndex(self.path, seed)
+
+    def test_seeds(self):
+        self.assertEqual(list(SeedIndex(self.path, "111").get_seeds("HEAGAW")), [(0, "HEA"), (1, "EAG"), (2, "AGA"), (3, "GAW")])
+        self.assertEqual(list(SeedIndex(self.path, "1101").get_seeds("HEAGAW")), [(0, "HEG"), (1, "EAA"), (2, "AGW")])
+
+    def test_positions(self):
+        # every seed of every sequence, at its position in the concatenation of the sequences
+        for seed in ("111", "11011"):
+            with self.subTest(seed = seed):
+                seed_index = self.load_index(seed)
+                self.assertEqual(seed_index.ids, [record_id for record_id, _ in self.records])
+                for number, (record_id, sequence) in enumerate(self.records):
+                    self.assertEqual(seed_index.get_sequence(number), sequence)
+                    for position, word in seed_index.get_seeds(sequence):
+                        located = [seed_index.locate(p) for p in seed_index.get_positions(word)]
+                        self.assertIn((number, position), located)
+
+    def test_index_file(self):
+        seed_index = self.load_index()
+        self.assertTrue(os.path.exists(seed_index.get_index_path()))
+        loaded = SeedIndex(self.path)
+        self.assertTrue(loaded.read(seed_index.get_index_path()))
+        self.assertEqual((loaded.ids, loaded.records, loaded.starts, loaded.postings),
+                         (seed_index.ids, seed_index.records, seed_index.starts, seed_index.postings))
+
+        # built again when the file changes
+        os.utime(seed_index.get_index_path(), (0, 0))
+        self.path = self.write_records(self.records[:3])
+        self.assertEqual(self.load_index().ids, ["t0", "t1", "t2"])
+
+    def test_index_in_the_cache_directory(self):
+        # when the directory of the file cannot be written
+        with mock.patch.object(SeedIndex, 'get_index_path', lambda seed_index: os.path.join(self.path, "not a directory.seeds")):
+            seed_index = self.load_index()
+            self.assertTrue(os.path.exists(seed_index.get_cached_index_path()))
+            self.assertTrue(SeedIndex(self.path).read(seed_index.get_cached_index_path()))
+
+class TestSeedSearch(SeedTestCase):
+    def search(self, **options):
+        return SeedSearch(self.load_index(), self.scoring_matrix, -11, -1, **options).search(self.query)
+
+    def test_copies_are_found(self):
+        # with the score of the local alignment of the whole sequences
+        for engine in ('python', 'numpy'):
+            with self.subTest(engine = engine):
+                results = self.search(engine = engine)
+                self.assertEqual(sorted(target_id for target_id, _ in results[:3]), ["t1", "t5", "t9"])
+                for target_id, result in results:
+                    target = dict(self.records)[target_id]
+                    best = AlignmentProcessor(self.query, target, 'local', self.scoring_matrix, -11, -1, False).align()[0]
+                    self.assertLessEqual(result.score, best.score)
+                    if target_id in ("t1", "t5", "t9"):
+                        self.assertEqual(result.score, best.score)
+                    positions = result.get_positions()
+                    self.assertEqual(result.residues1, self.query[positions[0] - 1:positions[1]])
+                    self.assertEqual(result.residues2, target[positions[2] - 1:positions[3]])
+                self.assertEqual([result.score for _, result in results], sorted([result.score for _, result in results], reverse = True))
+
+    def test_minimum_score(self):
+        scores = [result.score for _, result in self.search(minimum_score = 0)]
+        self.assertEqual([result.score for _, result in self.search(minimum_score = 200)], [score for score in scores if score >= 200])
+
+    def test_sequences_that_cannot_be_aligned(self):
+        # U is not in BLOSUM62: the search goes on with the other sequences
+        records = list(self.records)
+        records[5] = ("t5", records[5][1][:30] + "U" + records[5][1][31:])
+        self.path = self.write_records(records)
+        seed_search = SeedSearch(self.load_index(), self.scoring_matrix, -11, -1)
+        results = seed_search.search(self.query)
+        self.assertEqual(sorted(target_id for target_id, _ in results[:2]), ["t1", "t9"])
+        self.assertEqual(seed_search.skipped_targets, [("t5", "Unknown residue 'U' at position 31 of sequence t5!")])
+
+        # read and encoded once
+        with mock.patch.object(SeedIndex, 'get_sequence') as get_sequence:
+            self.assertEqual([(target_id, result.get_positions()) for target_id, result in seed_search.search(self.query)],
+                             [(target_id, result.get_positions()) for target_id, result in results])
+            get_sequence.assert_not_called()
+            self.assertEqual(len(seed_search.skipped_targets), 1)
+
+    def test_statistics(self):
+        statistics = AlignmentStatistics()
+        self.search(statistics = statistics)
+        for counter in ('seed hits', 'ungapped extensions', 'gapped extensions'):
+            self.assertGreater(statistics.counters[counter], 0)
+        for phase in ('seeding', 'ungapped extension', 'gapped extension', 'region alignment'):
+            self.assertIn(phase, statistics.phases)
+
+if __name__ == '__main__':
+    unittest.main()
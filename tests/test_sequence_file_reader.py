@@ -0,0 +1,95 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pairwise_sequence_alignment import SequenceFileReader
+
+FASTA = b""">sp|P1 first protein
+HEAGA
+WGHEE
+; a comment line
+
+>p2
+PAWHEAE
+>p3 empty
+>p4
+MK VL
+"""
+
+FASTA_RECORDS = [("sp|P1", "HEAGAWGHEE"), ("p2", "PAWHEAE"), ("p3", ""), ("p4", "MKVL")]
+
+class TestSequenceFileReader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # the indexes that cannot be written next to their file go to this directory
+        patcher = mock.patch.dict(os.environ, {"PAIRWISE_ALIGNMENT_CACHE_DIR": os.path.join(self.directory.name, "cache")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, content, compressed = False):
+        path = os.path.join(self.directory.name, name)
+        with (gzip.open(path, 'wb') if compressed else open(path, 'wb')) as f:
+            f.write(content)
+        return path
+
+    def test_fasta_records(self):
+        path = self.write("sequences.fa", FASTA)
+        self.assertEqual(list(SequenceFileReader(path).read_records()), FASTA_RECORDS)
+
+    def test_plain_records(self):
+        # one sequence on each non-empty line, identified by its number
+        path = self.write("sequences.txt", b"HEAGAWGHEE\n\n  PAWHEAE  \nMKVL")
+        self.assertEqual(list(SequenceFileReader(path).read_records()), [("1", "HEAGAWGHEE"), ("2", "PAWHEAE"), ("3", "MKVL")])
+
+    def test_empty_file(self):
+        self.assertEqual(list(SequenceFileReader(self.write("empty.fa", b"")).read_records()), [])
+
+    def test_compressed_records(self):
+        path = self.write("sequences.fa.gz", FASTA, compressed = True)
+        reader = SequenceFileReader(path)
+        self.assertEqual(list(reader.read_records()), FASTA_RECORDS)
+        records = list(reader.parse_records(reader.read_lines()))
+        self.assertEqual([reader.read_record_at(start, end) for _, _, start, end in records],
+                         [sequence for _, sequence in FASTA_RECORDS])
+
+    def test_records_read_through_the_index(self):
+        path = self.write("sequences.fa", FASTA)
+        reader = SequenceFileReader(path)
+        for record_id, sequence in reversed(FASTA_RECORDS):
+            self.assertEqual(reader.get_record(record_id), sequence)
+        self.assertTrue(os.path.exists(path + ".idx"))
+        with self.assertRaises(KeyError):
+            reader.get_record("p5")
+
+        # read from the index file by another reader, and built again when the file changes
+        self.assertEqual(SequenceFileReader(path).load_index(), reader.index)
+        os.utime(path + ".idx", (0, 0))
+        path = self.write("sequences.fa", FASTA.replace(b"PAWHEAE", b"PAW"))
+        self.assertEqual(SequenceFileReader(path).get_record("p2"), "PAW")
+
+    def test_index_in_the_cache_directory(self):
+        # when the directory of the file cannot be written
+        path = self.write("sequences.fa", FASTA)
+        with mock.patch.object(SequenceFileReader, 'get_index_path', lambda reader: os.path.join(path, "not a directory.idx")):
+            reader = SequenceFileReader(path)
+            self.assertEqual(reader.get_record("p2"), "PAWHEAE")
+            self.assertTrue(os.path.exists(reader.get_cached_index_path()))
+            self.assertEqual(SequenceFileReader(path).get_record("p4"), "MKVL")
+
+    def test_duplicate_ids(self):
+        path = self.write("sequences.fa", FASTA + b">p2 again\nMKVL\n")
+        with self.assertRaises(ValueError) as context:
+            SequenceFileReader(path).get_record("p2")
+        self.assertEqual(str(context.exception), "Duplicate record id 'p2' in {}!".format(path))
+        self.assertFalse(os.path.exists(path + ".idx"))
+
+    def test_compressed_files_are_not_indexed(self):
+        path = self.write("sequences.fa.gz", FASTA, compressed = True)
+        with self.assertRaises(ValueError):
+            SequenceFileReader(path).get_record("p2")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from alignment_server import AlignmentClient, AlignmentServer, align_request, check_request
+
+from tests.test_alignment import AlignmentTestCase, random_pairs
+
+def create_request(sequence1 = "HEAGAWGHEE", sequence2 = "PAWHEAE", alignment = 'local', **fields):
+    request = {'type': 'align', 'sequence1': sequence1, 'sequence2': sequence2, 'alignment': alignment,
+               'scoring_matrix': "BLOSUM62", 'gap_opening_penalty': -10, 'gap_extension_penalty': -1}
+    request.update(fields)
+    return request
+
+class TestRequests(AlignmentTestCase):
+    def test_valid_requests(self):
+        for fields in ({}, {'engine': 'numpy', 'band_width': 'auto'}, {'band_width': 0, 'max_alignments': 1},
+                       {'linear_space_threshold': 0}, {'top': 2}, {'type': 'score', 'alignment': 'global'}):
+            with self.subTest(fields = fields):
+                self.assertIsNone(check_request(create_request(**fields)))
+
+    def test_invalid_requests(self):
+        request = create_request()
+        del request['scoring_matrix']
+        self.assertEqual(check_request(request), "Missing field!: scoring_matrix")
+        for fields, error in (({'sequence1': 5}, "Sequences must be strings!"),
+                              ({'gap_opening_penalty': 2}, "Invalid value for gap opening penalty!: 2"),
+                              ({'gap_extension_penalty': -1.5}, "Invalid value for gap extension penalty!: -1.5"),
+                              ({'band_width': -1}, "Invalid value for band width!: -1"),
+                              ({'type': 'score', 'band_width': 2}, "band_width cannot be used with score requests!"),
+                              ({'linear_space_threshold': "10"}, "Invalid value for linear space threshold!: 10"),
+                              ({'max_alignments': 0}, "Invalid value for max alignments!: 0"),
+                              ({'top': 2, 'alignment': 'global'}, "top can only be used with local alignment!")):
+            with self.subTest(fields = fields):
+                self.assertTrue(check_request(create_request(**fields)).startswith(error))
+
+    def test_bools_are_not_numbers(self):
+        # JSON true and false
+        for field in ('gap_opening_penalty', 'band_width', 'linear_space_threshold', 'max_alignments', 'top'):
+            for value in (True, False):
+                with self.subTest(field = field, value = value):
+                    self.assertIsNotNone(check_request(create_request(**{field: value})))
+
+    def test_alignments(self):
+        for pair in random_pairs(30, 50):
+            sequence1, sequence2, alignment_type, gap_opening_penalty, gap_extension_penalty = pair
+            request = create_request(sequence1, sequence2, alignment_type, gap_opening_penalty = gap_opening_penalty,
+                                     gap_extension_penalty = gap_extension_penalty, linear_space_threshold = 10 ** 9)
+            with self.subTest(pair = pair):
+                results = self.create_processor(*pair).align()
+                response = align_request(request)
+                self.assertTrue(response['ok'])
+                self.assertEqual(response['result']['alignments'], [result.get_aligned_sequences() for result in results])
+                self.assertEqual(response['result']['raw_alignment_scores'], [result.score for result in results])
+                self.assertEqual(response['result']['positions'], [result.get_positions() for result in results])
+                response = align_request(dict(request, type = 'score'))
+                self.assertEqual(response['result'], dict(zip(('score', 'end'), self.create_processor(*pair).calculate_score())))
+
+    def test_failed_alignments(self):
+        self.assertEqual(align_request(create_request(sequence2 = "MKUAW")),
+                         {'ok': False, 'error': "Unknown residue 'U' at position 3 of sequence2!"})
+        self.assertEqual(align_request(create_request(scoring_matrix = "NO SUCH MATRIX")),
+                         {'ok': False, 'error': "Unknown scoring matrix!: NO SUCH MATRIX"})
+
+class TestAlignmentServer(unittest.TestCase):
+    # a server on a Unix socket, with its event loop in another thread
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.socket_path = os.path.join(cls.directory.name, "server.socket")
+        cls.loop = asyncio.new_event_loop()
+        cls.thread = threading.Thread(target = cls.loop.run_forever)
+        cls.thread.start()
+        cls.server = AlignmentServer(workers = 2, batch_size = 8, batch_delay = 0.05, preloaded_matrices = ("BLOSUM62",))
+        cls.listener = cls.run_in_loop(cls.server.start(unix_socket = cls.socket_path))
+
+    @classmethod
+    def tearDownClass(cls):
+        async def close():
+            cls.listener.close()
+            cls.server.close()
+        cls.run_in_loop(close())
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+        cls.directory.cleanup()
+
+    @classmethod
+    def run_in_loop(cls, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, cls.loop).result()
+
+    def setUp(self):
+        self.client = AlignmentClient(unix_socket = self.socket_path)
+        self.addCleanup(self.client.close)
+
+    def test_batched_requests(self):
+        # every response goes to its request, whatever the batch it is aligned in.
+        # the tuples of the responses are read back as lists.
+        requests = [create_request(sequence1, sequence2, alignment_type, gap_opening_penalty = gap_opening_penalty,
+                                   gap_extension_penalty = gap_extension_penalty)
+                    for sequence1, sequence2, alignment_type, gap_opening_penalty, gap_extension_penalty in random_pairs(31, 40)]
+        requests[5] = create_request(sequence2 = "MKUAW")
+        stats = self.client.request({'type': 'stats'})['result']
+        responses = self.client.request_many(requests)
+        self.assertEqual([{key: value for key, value in response.items() if key != 'id'} for response in responses],
+                         [json.loads(json.dumps(align_request(request))) for request in requests])
+        self.assertFalse(responses[5]['ok'])
+
+        new_stats = self.client.request({'type': 'stats'})['result']
+        self.assertEqual(new_stats['batched requests'] - stats['batched requests'], len(requests))
+        self.assertLess(new_stats['batches'] - stats['batches'], len(requests))
+        self.assertEqual(new_stats['errors'] - stats['errors'], 1)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.request(create_request(band_width = True)),
+                         {'ok': False, 'error': "Invalid value for band width!: True\nBand width can be either a number or auto",
+                          'id': self.client.next_id - 1})
+        response = self.client.request({'type': 'delete'})
+        self.assertTrue(response['error'].startswith("Invalid request type!: delete"))
+        self.client.file.write(b"not json\n")
+        self.client.file.flush()
+        response = {}
+        self.client.read_response(response)
+        self.assertFalse(response[None]['ok'])
+        self.assertTrue(response[None]['error'].startswith("Invalid request!: "))
+
+    def test_health(self):
+        self.assertEqual(self.client.request({'type': 'health'})['result'], {'status': 'ok', 'pending': 0, 'workers': 2})
+
+if __name__ == '__main__':
+    unittest.main()
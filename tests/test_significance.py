@@ -0,0 +1,69 @@
+import math
+import unittest
+
+from pairwise_sequence_alignment import AlignmentProcessor, SignificanceTest
+
+from tests.test_alignment import AlignmentTestCase
+
+# the shuffles depend only on the seed, and their scores neither on the engine nor on the workers
+
+SEQUENCE1 = "MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQ"
+SEQUENCE2 = "MKSAYIAKQRQLSFVKAHFTRQLEEKLGLIEVQ"
+
+class TestSignificance(AlignmentTestCase):
+    def create_test(self, shuffles = 30, **options):
+        return SignificanceTest(SEQUENCE1, SEQUENCE2, self.scoring_matrix, -10, -1, shuffles, **options)
+
+    def decode(self, shuffle):
+        # the residues of a shuffle of the numpy engine, given as their columns in the scoring matrix
+        column_titles = self.scoring_matrix.get_column_titles()
+        return "".join(column_titles[code] for code in shuffle)
+
+    def test_shuffles_keep_the_composition(self):
+        for engine in ('python', 'numpy'):
+            with self.subTest(engine = engine):
+                shuffles = self.create_test(engine = engine).generate_shuffles()
+                if engine == 'numpy':
+                    shuffles = [self.decode(shuffle) for shuffle in shuffles]
+                self.assertEqual(len(shuffles), 30)
+                self.assertEqual(len(set(shuffles)), 30)
+                for shuffle in shuffles:
+                    self.assertEqual(sorted(shuffle), sorted(SEQUENCE2))
+
+    def test_scores_of_the_shuffles(self):
+        # the python engine scores every shuffle with calculate_score
+        test = self.create_test()
+        scores = test.calculate_scores()
+        self.assertEqual(scores, [AlignmentProcessor(SEQUENCE1, shuffle, 'local', self.scoring_matrix, -10, -1, False).calculate_score()[0]
+                                  for shuffle in test.generate_shuffles()])
+        self.assertEqual(self.create_test(workers = 3).calculate_scores(), scores)
+        self.assertNotEqual(self.create_test(seed = 1).calculate_scores(), scores)
+
+    def test_engines_agree(self):
+        # on the scores of the same shuffles
+        test = self.create_test(engine = 'numpy')
+        shuffles = test.generate_shuffles()
+        numpy_scores = test.calculate_scores()
+        self.assertEqual(numpy_scores, [AlignmentProcessor(SEQUENCE1, self.decode(shuffle), 'local', self.scoring_matrix, -10, -1,
+                                                           False).calculate_score()[0] for shuffle in shuffles])
+        self.assertEqual(self.create_test(engine = 'numpy', workers = 2).calculate_scores(), numpy_scores)
+
+    def test_report(self):
+        report = self.create_test().run()
+        self.assertEqual(report['score'], AlignmentProcessor(SEQUENCE1, SEQUENCE2, 'local', self.scoring_matrix, -10, -1, False).calculate_score()[0])
+        self.assertEqual(report['shuffles'], 30)
+        self.assertGreater(report['z_score'], 3)
+        self.assertAlmostEqual(report['lambda'], math.pi / (report['standard_deviation'] * math.sqrt(6)))
+        self.assertLess(report['e_value'], 0.01)
+        self.assertAlmostEqual(report['p_value'], 1 - math.exp(-report['e_value']))
+        self.assertEqual(self.create_test().run(), report)
+
+    def test_shuffles_with_the_same_score(self):
+        # a sequence2 of one residue repeated has a single shuffle
+        report = SignificanceTest(SEQUENCE1, "WWWW", self.scoring_matrix, -10, -1, 5).run()
+        self.assertEqual(report['standard_deviation'], 0)
+        for value in ('z_score', 'lambda', 'mu', 'e_value', 'p_value'):
+            self.assertIsNone(report[value])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import random
+import unittest
+
+from pairwise_sequence_alignment import AlignmentProcessor, AlignmentStatistics, ScoringMatrixFileReader, SignificanceTest
+
+from tests.test_alignment import PROTEIN_RESIDUES, AlignmentTestCase, random_sequence
+
+# every cell is counted once, by the code computing it
+
+class TestAlignmentStatistics(unittest.TestCase):
+    def test_phases_and_counters(self):
+        statistics = AlignmentStatistics()
+        for _ in range(2):
+            statistics.start_phase('fill')
+            statistics.end_phase('fill')
+        statistics.count('cells', 12)
+        statistics.count('cells', 30)
+        statistics.count('alignments')
+        report = statistics.get_report()
+        self.assertEqual(report['phases']['fill']['count'], 2)
+        self.assertGreaterEqual(report['phases']['fill']['wall_time'], 0)
+        self.assertEqual(report['counters'], {'cells': 42, 'alignments': 1})
+        self.assertEqual(json.loads(statistics.format_json()), report)
+        lines = statistics.format_text().splitlines()
+        self.assertTrue(lines[1].startswith("fill "))
+        self.assertIn("Cells: 42", lines)
+        self.assertIn("Alignments: 1", lines)
+
+    def test_merge(self):
+        # as the statistics of the worker processes are added to those of the run
+        statistics = AlignmentStatistics()
+        statistics.count('cells', 5)
+        other = AlignmentStatistics()
+        other.start_phase('traceback')
+        other.end_phase('traceback')
+        other.count('cells', 7)
+        other.count('pairs')
+        statistics.merge(other)
+        statistics.merge(other)
+        self.assertEqual(statistics.counters, {'cells': 19, 'pairs': 2})
+        self.assertEqual(statistics.phases['traceback'][2], 2)
+
+class TestCellCounts(AlignmentTestCase):
+    def count_cells(self, sequence1, sequence2, alignment_type, score_only = False, **options):
+        statistics = AlignmentStatistics()
+        processor = self.create_processor(sequence1, sequence2, alignment_type, -10, -1, statistics = statistics, **options)
+        if score_only:
+            processor.calculate_score()
+        else:
+            processor.align()
+        return statistics.counters.get('cells', 0)
+
+    def test_matrix(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            sequence1 = random_sequence(rng, PROTEIN_RESIDUES, 60)
+            sequence2 = random_sequence(rng, PROTEIN_RESIDUES, 60)
+            for engine in ('python', 'numpy'):
+                for alignment_type in ('global', 'local'):
+                    for score_only in (False, True):
+                        with self.subTest(sequence1 = sequence1, sequence2 = sequence2, engine = engine,
+                                          alignment_type = alignment_type, score_only = score_only):
+                            self.assertEqual(self.count_cells(sequence1, sequence2, alignment_type, score_only, engine = engine),
+                                             len(sequence1) * len(sequence2))
+
+    def test_linear_space_score_only(self):
+        sequence1, sequence2 = "HEAGAWGHEE" * 5, "PAWHEAE" * 6
+        for engine in ('python', 'numpy'):
+            with self.subTest(engine = engine):
+                self.assertEqual(self.count_cells(sequence1, sequence2, 'global', True, engine = engine,
+                                                  linear_space_threshold = 0), len(sequence1) * len(sequence2))
+
+    def test_banded_alignment(self):
+        # only the cells of the band
+        self.assertEqual(self.count_cells("HEAGAWGHEE", "HEAGAWGHEE", 'global', band_width = 1), 10 + 2 * 9)
+
+    def test_bit_parallel_score(self):
+        # one cell per 64-bit word of the longer sequence and residue of the shorter one
+        nucleotide_matrix = ScoringMatrixFileReader("NUC.4.4").read_matrix()
+        for sequence1, sequence2, words in (("ACGT" * 16, "GATTACA", 1), ("GATTACA", "ACGT" * 17, 2)):
+            with self.subTest(sequence1 = sequence1, sequence2 = sequence2):
+                statistics = AlignmentStatistics()
+                processor = AlignmentProcessor(sequence1, sequence2, 'global', nucleotide_matrix, -2, -2, False,
+                                               statistics = statistics)
+                self.assertIsNotNone(processor.get_bit_parallel_scheme())
+                processor.calculate_score()
+                self.assertEqual(statistics.counters['cells'], words * len("GATTACA"))
+
+    def test_significance(self):
+        # the pair and each of its shuffles
+        statistics = AlignmentStatistics()
+        SignificanceTest("HEAGAWGHEE", "PAWHEAE", self.scoring_matrix, -10, -1, 20, statistics = statistics).run()
+        self.assertEqual(statistics.counters, {'shuffles': 20, 'cells': 21 * 10 * 7})
+
+if __name__ == '__main__':
+    unittest.main()
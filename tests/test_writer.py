@@ -0,0 +1,78 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from pairwise_sequence_alignment import AlignmentProcessor, AlignmentWriter, ScoringMatrixFileReader
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pairwise_sequence_alignment.py")
+
+# AWGHE-E
+# AW-HEAE
+# at positions 5-10 of the query and 2-7 of the target
+EXPECTED_LINES = {
+    'cigar': "q1\tt1\t25\t5\t10\t2\t7\t2M1I2M1D1M\n",
+    'jsonl': {"query": "q1", "target": "t1", "score": 25, "identity": 71.4286, "length": 7, "mismatches": 0, "gaps": 2,
+              "query_start": 5, "query_end": 10, "target_start": 2, "target_end": 7, "cigar": "2M1I2M1D1M"},
+    'tabular': "q1\tt1\t71.43\t7\t0\t2\t5\t10\t2\t7\t25\n",
+}
+
+class TestAlignmentWriter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        scoring_matrix = ScoringMatrixFileReader("BLOSUM62").read_matrix()
+        cls.result = AlignmentProcessor("HEAGAWGHEE", "PAWHEAE", 'local', scoring_matrix, -4, -1, False).align()[0]
+
+    def write(self, output_format):
+        f = io.StringIO()
+        writer = AlignmentWriter(f, output_format)
+        writer.write("q1", "t1", self.result)
+        writer.write("q1", "t1", self.result)
+        self.assertEqual(writer.number_of_alignments, 2)
+        return f.getvalue()
+
+    def test_formats(self):
+        self.assertEqual(self.result.get_aligned_sequences(), ("AWGHE-E", "AW-HEAE"))
+        self.assertEqual(self.write('cigar'), EXPECTED_LINES['cigar'] * 2)
+        self.assertEqual(self.write('tabular'), EXPECTED_LINES['tabular'] * 2)
+        self.assertEqual([json.loads(line) for line in self.write('jsonl').splitlines()], [EXPECTED_LINES['jsonl']] * 2)
+
+    def test_files_and_standard_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "alignments.tsv")
+            writer = AlignmentWriter.open(path, 'cigar')
+            writer.write("q1", "t1", self.result)
+            writer.close()
+            with open(path) as f:
+                self.assertEqual(f.read(), EXPECTED_LINES['cigar'])
+
+        # flushed, but left open
+        with mock.patch.object(sys, 'stdout', io.StringIO()) as stdout:
+            writer = AlignmentWriter.open(None, 'tabular')
+            writer.write("q1", "t1", self.result)
+            writer.close()
+            self.assertEqual(stdout.getvalue(), EXPECTED_LINES['tabular'])
+            self.assertFalse(stdout.closed)
+
+    def test_batch_output(self):
+        # the lines of the pairs that are aligned, in the order of the pairs, and the errors on the standard error
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, "queries.fa")
+            targets_path = os.path.join(directory, "targets.fa")
+            with open(input_path, "w") as f:
+                f.write(">q1\nHEAGAWGHEE\n")
+            with open(targets_path, "w") as f:
+                f.write(">t1\nPAWHEAE\n>t2\nMKUAW\n>t3\nPAWHEAE\n")
+            completed = subprocess.run([sys.executable, SCRIPT, "--input", input_path, "--alignment", "local",
+                                        "--scoring-matrix", "BLOSUM62", "--gap-opening-penalty", "-4",
+                                        "--gap-extension-penalty", "-1", "--targets", targets_path, "--workers", "1",
+                                        "--format", "cigar"], capture_output = True, text = True)
+        self.assertEqual(completed.stdout, EXPECTED_LINES['cigar'] + EXPECTED_LINES['cigar'].replace("t1", "t3"))
+        self.assertIn("Query q1 vs target t2: Unknown residue 'U' at position 3 of target t2!", completed.stderr)
+
+if __name__ == '__main__':
+    unittest.main()